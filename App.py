@@ -1,69 +1,244 @@
 import sys
+import logging
 
-from PyQt6.QtCore import QDateTime,QTimer,pyqtSignal, QObject, pyqtSlot, QThread
-from PyQt6.QtWidgets import QApplication, QLabel,QTableWidget, QWidget, QVBoxLayout, QHBoxLayout
+from PyQt6.QtCore import QDateTime,QTimer,pyqtSignal, QObject, pyqtSlot, Qt, QSize, QAbstractTableModel, QModelIndex, QBuffer, QByteArray, QIODevice
+from PyQt6.QtWidgets import QApplication, QCheckBox, QLabel, QStatusBar, QTableView, QHeaderView, QStyledItemDelegate, QWidget, QVBoxLayout, QHBoxLayout
 from PyQt6.QtGui import *
-import paho.mqtt.client as mqtt
-import json
+from PyQt6 import QtCore
 import time
-import urllib.request
-from functools import partial
-import winsound
-
-offlineTime = 5
-freshDataTime = 30
-maxShowDataTime = 120
-localRecordsFilePath = "log.json"
-
-hostname = "test.mosquitto.org"
-username = ""
-portnum = 1883
-password = ""
-broker_topic = "HELLO-TOPIC-HM123"
-
-# hostname = input("HostName:")
-# portnum = input("Port:")
-# username = input("Username:")
-# password = input("Password:")
-
-# broker_topic = input("Topic:")
-# offlineTime = input("OfflineTime:")
-# freshDataTime = input("FreshDataTime:")
-# maxShowDataTime = input("MaxShowDataTime:")
-# localRecordsFilePath = input("JsonLogFile:")
+import collections
+import packets
+import pipeline
+from imagecache import ImageCache
+from downloadpool import DownloadPool, PRIORITY_VISIBLE, PRIORITY_BACKGROUND
+from registry import DeviceRegistry
+import alerts
+import qtbridge
+import transport
+
+from appconfig import *
 
 start_time = time.time()
-class Downloader(QObject):
-    # downloaded = pyqtSignal(bytes)
-    
-    @pyqtSlot(str)
-    def download(self, url, photo):
-        # self.photo = pho
-        img = urllib.request.urlopen(url).read()
-        pixmap1 = QPixmap()
-        if img:
-            pixmap1.loadFromData(img)
-            photo.setPixmap(pixmap1.scaledToWidth(150))
-        # self.downloaded.emit(img)
+
+# custom model role telling the delegate whether a row is still fresh
+FreshRole = Qt.ItemDataRole.UserRole
+
+def pixmap_bytes(pixmap):
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+def decode_thumbnail(data, width=thumbnailWidth):
+    # Safe on worker threads, unlike QPixmap.  Asking the reader for the
+    # scaled size lets the JPEG decoder skip most of the full-size work.
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+    reader = QImageReader(buffer)
+    size = reader.size()
+    if size.isValid() and size.width() > width:
+        reader.setScaledSize(QSize(width, max(1, size.height() * width // size.width())))
+    return reader.read()
+
+class PhotoRefs(object):
+    # Number of rows, in the history and device tables together, showing
+    # each photo URL.  A pixmap is dropped from the memory cache only when
+    # no row of either table shows it; the disk copy stays.
+    def __init__(self, cache):
+        self.cache = cache
+        self.counts = collections.Counter()
+
+    def retain(self, packet):
+        self.counts[packet.photo1] += 1
+        self.counts[packet.photo2] += 1
+
+    def release(self, packet):
+        for url in (packet.photo1, packet.photo2):
+            self.counts[url] -= 1
+            if self.counts[url] <= 0:
+                del self.counts[url]
+                self.cache.discard(url)
+
+class PacketTableModel(QAbstractTableModel):
+    # Common columns of the history and device tables: two photos and the
+    # device text.  Subclasses provide rowCount() and packet(row).
+    def __init__(self, cache, parent=None):
+        super(PacketTableModel, self).__init__(parent)
+        self.cache = cache
+        self.font = QFont('Times', 12)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 3
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        packet = self.packet(index.row())
+        column = index.column()
+
+        if role == FreshRole:
+            return (time.time() - packet.received) < freshDataTime
+        if column == 2:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return device_text(packet)
+            if role == Qt.ItemDataRole.FontRole:
+                return self.font
+        elif role == Qt.ItemDataRole.DecorationRole:
+            return self.cache.peek(packet.photo2 if column else packet.photo1)
+        return None
+
+    def refresh_rows(self, first, last):
+        # Only the age text and the freshness border change with time.
+        self.dataChanged.emit(self.index(first, 0), self.index(last, 2),
+                              [Qt.ItemDataRole.DisplayRole, FreshRole])
+
+class DeviceTableModel(PacketTableModel):
+    # Packets are kept oldest first in a ring buffer, so a new packet is a
+    # cheap append and evicting the oldest costs O(1); row 0 of the view is
+    # the newest packet.
+    def __init__(self, cache, capacity, photo_refs, parent=None):
+        super(DeviceTableModel, self).__init__(cache, parent)
+        self.packets = packets.RingBuffer(capacity)
+        self.photo_refs = photo_refs
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.packets)
+
+    def packet(self, row):
+        return self.packets[len(self.packets) - 1 - row]
+
+    def add_packets(self, batch):
+        if not batch:
+            return
+        batch = batch[-self.packets.capacity:]
+        overflow = len(self.packets) + len(batch) - self.packets.capacity
+        if overflow > 0:
+            self.remove_oldest(overflow)
+        self.beginInsertRows(QModelIndex(), 0, len(batch) - 1)
+        for packet in batch:
+            self.packets.append(packet)
+            self.photo_refs.retain(packet)
+        self.endInsertRows()
+
+    def remove_oldest(self, count):
+        count = min(count, len(self.packets))
+        if count <= 0:
+            return
+        last = len(self.packets) - 1
+        self.beginRemoveRows(QModelIndex(), last - count + 1, last)
+        for i in range(count):
+            self.photo_refs.release(self.packets.popleft())
+        self.endRemoveRows()
+
+    def expire(self, oldest):
+        """Remove the packets received before oldest."""
+        count = 0
+        while count < len(self.packets) and self.packets[count].received < oldest:
+            count += 1
+        self.remove_oldest(count)
+
+class DeviceStatusModel(PacketTableModel):
+    # One row per device, in the order the devices were first seen, showing
+    # its latest packet and whether it is online.
+    def __init__(self, registry, cache, photo_refs, parent=None):
+        super(DeviceStatusModel, self).__init__(cache, parent)
+        self.registry = registry
+        self.photo_refs = photo_refs
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.registry)
+
+    def packet(self, row):
+        return self.registry[row].packet
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if index.isValid() and index.column() == 2:
+            device = self.registry[index.row()]
+            if role == Qt.ItemDataRole.DisplayRole:
+                return device_status_text(device)
+            if role == Qt.ItemDataRole.ForegroundRole and not device.online:
+                return QColor(200, 0, 0)
+        return super(DeviceStatusModel, self).data(index, role)
+
+    def add_packets(self, packets):
+        first = last = None
+        for packet in packets:
+            device = self.registry.get(packet.device)
+            if device is None:
+                row = len(self.registry)
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.registry.upsert(packet)
+                self.photo_refs.retain(packet)
+                self.endInsertRows()
+                continue
+            old = device.packet
+            row = self.registry.upsert(packet)[0].row
+            if device.packet is not old:
+                # retain first, so a photo shared by both packets is kept
+                self.photo_refs.retain(device.packet)
+                self.photo_refs.release(old)
+            first = row if first is None else min(first, row)
+            last = row if last is None else max(last, row)
+        if first is not None:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, 2))
+
+def device_status_text(device):
+    if device.online:
+        state = "online"
+    else:
+        state = "OFFLINE"
+    text = device_text(device.packet).split("\n", 1)
+    return "%s %s, %d packets\n%s" % (text[0], state, device.count, text[1])
+
+def device_text(packet):
+    initialSeconds = time.time() - packet.received
+    hours = initialSeconds // 3600
+    minutes = (initialSeconds - (hours * 3600)) // 60
+    seconds = initialSeconds % 60
+
+    local_time = "%d:%02d:%02d" % (hours, minutes, seconds)
+    return packet.device +"("+str(local_time)+")"+"\n"+packet.textA+"\n"+packet.textB
+
+class FreshnessDelegate(QStyledItemDelegate):
+    def paint(self, painter, option, index):
+        super(FreshnessDelegate, self).paint(painter, option, index)
+        if index.data(FreshRole):
+            color = QColor(255, 0, 0)
+        else:
+            color = QColor(0, 0, 0)
+        painter.save()
+        painter.setPen(QPen(color, 2))
+        painter.drawRect(option.rect.adjusted(5, 5, -5, -5))
+        painter.restore()
 
 class MainGUI(QWidget):
+    photoLoaded = pyqtSignal(str, QImage)
+
     def __init__(self, main, *args, **kwargs):
         super(MainGUI,self).__init__()
         self.main = main
-        self.last_message_time = time.time()
+        self.registry = DeviceRegistry(offlineTime)
         self.setupUi()
-        self.log_file = open('log.json', 'r', encoding='utf-8').read()
-        self.log_json = []
-        if self.log_file:
-            self.log_json = json.loads(self.log_file)
+        self.journal = pipeline.open_journal()
         self.load_json_log()
         self.show()
 
     def load_json_log(self):
-        for i in self.log_json:
-            if i:
-                if (start_time - int(i['time'])) < maxShowDataTime:
-                    self.add_device_item(json.dumps(i))
+        window = pipeline.replay_window(self.journal, start_time - maxShowDataTime)
+        self.model.add_packets(window)
+        self.deviceModel.add_packets(window)
+        for packet in self.shown_packets(window):
+            self.request_photos(packet, PRIORITY_BACKGROUND)
+
+    def expire_history(self):
+        self.model.expire(time.time() - maxShowDataTime)
+        # forget the failures of photos no row shows any more
+        for url in [url for url in self.photoFailures if url not in self.photoRefs.counts]:
+            del self.photoFailures[url]
 
     def setupUi(self):
         self.setFont(QFont('Times', 14))
@@ -81,19 +256,46 @@ class MainGUI(QWidget):
         self.toplayout.addWidget(self.statusLabel)
         self.toplayout.addWidget(self.statusMsg)
         self.toplayout.addStretch()
+        self.historyCheck = QCheckBox("Show history")
+        self.historyCheck.toggled.connect(self.show_history)
+        self.toplayout.addWidget(self.historyCheck)
+        self.cacheLabel = QLabel()
+        self.cacheLabel.setFont(QFont('Times', 10))
+        self.toplayout.addWidget(self.cacheLabel)
         self.toplayout.addWidget(self.dateLabel)
 
-        self.tableWidget = QTableWidget()
-        self.tableWidget.horizontalHeader().setMinimumSectionSize(152)
-        self.tableWidget.verticalHeader().setMinimumSectionSize(82)
-        self.tableWidget.verticalHeader().setMinimumHeight(82)
-        self.tableWidget.setColumnCount(3)
-        self.tableWidget.horizontalHeader().hide()
-        self.tableWidget.horizontalHeader().setStretchLastSection(True)
-        self.centerlayout.addWidget(self.tableWidget)
-        
+        self.imageCache = ImageCache(imageCacheDir, imageCacheMemoryBytes, pixmap_bytes)
+        # every packet of the display window, newest first; the full history
+        # lives in the journal
+        self.photoRefs = PhotoRefs(self.imageCache)
+        self.model = DeviceTableModel(self.imageCache, maxShowRows, self.photoRefs, self)
+        # the latest packet of each device
+        self.deviceModel = DeviceStatusModel(self.registry, self.imageCache, self.photoRefs, self)
+        self.tableView = QTableView()
+        self.tableView.setModel(self.deviceModel)
+        self.tableView.setItemDelegate(FreshnessDelegate(self.tableView))
+        self.tableView.setIconSize(QSize(150, 80))
+        self.tableView.setShowGrid(False)
+        self.tableView.horizontalHeader().setMinimumSectionSize(152)
+        self.tableView.horizontalHeader().hide()
+        self.tableView.horizontalHeader().setStretchLastSection(True)
+        # fixed row heights keep scrolling cheap with a long history
+        self.tableView.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.tableView.verticalHeader().setDefaultSectionSize(90)
+        self.centerlayout.addWidget(self.tableView)
+
+        # a fixed pool of download threads shared by all rows
+        self.downloadPool = DownloadPool(downloadWorkers, downloadsPerHost, downloadTimeout)
+        self.photoLoaded.connect(self.photo_downloaded)
+        # url -> (time of the next attempt, delay) for photos which failed to load
+        self.photoFailures = {}
+
+        self.statusBar = QStatusBar()
+        self.statusBar.setFont(QFont('Times', 10))
+
         self.mainlayout.addLayout(self.toplayout)
         self.mainlayout.addLayout(self.centerlayout)
+        self.mainlayout.addWidget(self.statusBar)
     
     
     def change_state_online(self):
@@ -106,132 +308,181 @@ class MainGUI(QWidget):
         self.statusLabel.setStyleSheet("QLabel { background-color : rgb(255, 0, 0); color : black;border: 1px solid black; }")
         self.statusMsg.setText("")
 
-    def update_packet(self, dev_info, packet_json, message_time, photo1, photo2):
-        initialSeconds = time.time() - message_time
-        hours = initialSeconds // 3600
-        minutes = (initialSeconds - (hours * 3600)) // 60
-        seconds = initialSeconds % 60
+    def show_history(self, checked):
+        if checked:
+            self.tableView.setModel(self.model)
+        else:
+            self.tableView.setModel(self.deviceModel)
+        self.refresh_visible_rows()
+
+    def update_device_states(self):
+        for device in self.registry.expire():
+            self.deviceModel.refresh_rows(device.row, device.row)
+        total = len(self.registry)
+        online = self.registry.online_count
+        if total and online == total:
+            self.change_state_online()
+        else:
+            self.change_state_offline()
+            if total:
+                self.statusMsg.setText("%d of %d devices offline" % (total - online, total))
+
+    def visible_rows(self):
+        first = self.tableView.rowAt(0)
+        if first < 0:
+            return None
+        last = self.tableView.rowAt(self.tableView.viewport().height() - 1)
+        if last < 0:
+            last = self.tableView.model().rowCount() - 1
+        return first, last
 
-        local_time = "%d:%02d:%02d" % (hours, minutes, seconds)
+    def refresh_visible_rows(self):
+        rows = self.visible_rows()
+        if rows is not None:
+            model = self.tableView.model()
+            model.refresh_rows(*rows)
+            # serve the photos of visible rows first, and reload any that
+            # were evicted from the memory cache
+            for row in range(rows[0], rows[1] + 1):
+                packet = model.packet(row)
+                for url in (packet.photo1, packet.photo2):
+                    if (self.imageCache.peek(url) is None and not self.photo_failed_recently(url)
+                            and not self.downloadPool.promote(url, PRIORITY_VISIBLE)):
+                        self.request_photo(url, PRIORITY_VISIBLE)
 
-        if (time.time() - message_time) < freshDataTime:
-            photo1.setStyleSheet("QLabel {border: 2px solid red; margin: 5px;}")
-            photo2.setStyleSheet("QLabel {border: 2px solid red; margin: 5px;}")
-            dev_info.setStyleSheet("QLabel {border: 2px solid red; margin: 5px;}")
-            dev_info.setText(str(packet_json['device']) +"("+str(local_time)+")"+"\n"+packet_json['textA']+"\n"+packet_json['textB'])
+    def request_photos(self, packet, priority):
+        for url in (packet.photo1, packet.photo2):
+            if self.imageCache.get(url) is None and not self.photo_failed_recently(url):
+                self.request_photo(url, priority)
+
+    def photo_failed_recently(self, url):
+        failure = self.photoFailures.get(url)
+        return failure is not None and time.time() < failure[0]
+
+    def request_photo(self, url, priority):
+        if self.imageCache.begin_fetch(url):
+            self.downloadPool.submit(url, self.photo_fetched, priority, handler=self.load_photo)
         else:
-            photo1.setStyleSheet("QLabel {border: 2px solid black; margin: 5px;}")
-            photo2.setStyleSheet("QLabel {border: 2px solid black; margin: 5px;}")
-            dev_info.setStyleSheet("QLabel {border: 2px solid black; margin: 5px;}")
-            dev_info.setText(str(packet_json['device']) +"("+str(local_time)+")"+"\n"+packet_json['textA']+"\n"+packet_json['textB'])
+            self.downloadPool.promote(url, priority)
+
+    def load_photo(self, url):
+        # runs on a download pool thread
+        img = self.imageCache.load(url, self.downloadPool.fetch)
+        if img:
+            return decode_thumbnail(img)
+        return None
+
+    def photo_fetched(self, url, image, error):
+        # runs on a download pool thread; always answer so the GUI can clear
+        # the in-flight entry
+        self.photoLoaded.emit(url, image if image is not None else QImage())
+
+    def photo_downloaded(self, url, image):
+        # only the conversion of the finished thumbnail happens here
+        self.imageCache.finish_fetch(url)
+        if image.isNull():
+            # wait before asking again, twice as long after each failure
+            failure = self.photoFailures.get(url)
+            delay = min(photoRetryMax, failure[1] * 2) if failure else photoRetryInitial
+            self.photoFailures[url] = (time.time() + delay, delay)
+            return
+        self.photoFailures.pop(url, None)
+        self.imageCache.put(url, QPixmap.fromImage(image))
+        self.refresh_visible_rows()
+
+    def show_cache_stats(self):
+        stats = self.imageCache.stats()
+        self.cacheLabel.setText("images: %d hit, %d miss, %d evicted" % (
+            stats['memory_hits'], stats['memory_misses'], stats['memory_evictions']))
+        self.cacheLabel.setToolTip("\n".join("%s: %s" % item for item in stats.items()))
+
+    def show_ingest_stats(self, depth, batch, latency):
+        self.statusBar.showMessage("queue depth: %d, last batch: %d, flush latency: %.0f ms" % (
+            depth, batch, latency * 1000))
 
     def closeEvent(self, event):
-        json_log_file = open("log.json", "w")
-        jsonString = json.dumps(self.log_json)
-        json_log_file.write(jsonString)
-        json_log_file.close()
-        
-    
-    def add_device_item(self,msg):
-        packet_json = json.loads(msg)
-        self.tableWidget.insertRow(0)
-        self.tableWidget.setRowHeight(0,90)
-        photo1 = QLabel()
-        self.thread = QThread(self)
-        self.thread.start()
-
-        self.downloader1 = Downloader()
-        self.downloader1.moveToThread(self.thread)
-        
-        wrapper1 = partial(self.downloader1.download, str(packet_json['photo1']), photo1)
-        QTimer.singleShot(0, wrapper1)
-        
-        photo1.setMinimumSize(150,80)
-        photo2 = QLabel()
-        photo2.setMinimumSize(150,80)
-        message_time = time.time()
-        self.last_message_time = message_time
-        self.downloader2 = Downloader()
-        self.downloader2.moveToThread(self.thread)
-
-        wrapper2 = partial(self.downloader1.download, str(packet_json['photo2']), photo2)
-        QTimer.singleShot(0, wrapper2)
-
-        dev_info = QLabel()
-        dev_info.setStyleSheet("QLabel {border: 2px solid black; margin: 5px;}")
-        dev_info.setFont(QFont('Times', 12))
-        dev_info.setMinimumSize(250,80)
-
-        newTimer = QTimer(dev_info)
-        newTimer.timeout.connect(lambda: self.update_packet(dev_info, packet_json,message_time, photo1,photo2))
-        newTimer.start(1000)
-
-        dev_info.setText(str(packet_json['device'])+"\n"+packet_json['textA']+"\n"+packet_json['textB'])
-
-        self.tableWidget.setCellWidget(0,0,photo1)
-        self.tableWidget.setCellWidget(0,1,photo2)
-        self.tableWidget.setCellWidget(0,2,dev_info)
-        
-        
-        if (time.time() - start_time ) > maxShowDataTime:
-            self.tableWidget.removeRow(self.tableWidget.rowCount()-1)
+        self.main.bridge.close()
+        self.downloadPool.shutdown()
+        self.journal.close()
+        self.main.alerter.close()
+
+    def add_device_items(self, batch):
+        if self.tableView.rowAt(0) <= 0:
+            priority = PRIORITY_VISIBLE
+        else:
+            priority = PRIORITY_BACKGROUND
+        self.model.add_packets(batch)
+        self.deviceModel.add_packets(batch)
+        for packet in self.shown_packets(batch):
+            self.request_photos(packet, priority)
 
-class Communicate(QObject):
-    packetRecieved = pyqtSignal(str)
+    def shown_packets(self, batch):
+        # the packets of a batch still in a table once it is added: those
+        # the history keeps and the latest of each device
+        shown = batch[-self.model.packets.capacity:]
+        kept = set(map(id, shown))
+        for device in set(packet.device for packet in batch):
+            latest = self.registry.get(device).packet
+            if id(latest) not in kept:
+                kept.add(id(latest))
+                shown.append(latest)
+        return shown
 
 class MainApp(object):
     def __init__(self):
-        
-        self.c = Communicate()
-        self.c.packetRecieved.connect(self.on_message_received)
+
+        # packets are parsed on the asyncio network thread and collected here
+        # until the next flush
+        self.ingest = packets.IngestBuffer()
+        self.alerter = alerts.Alerter(alerts.make_backend(alertBackend), alertCoalesceTime, alertMaxRate)
         self.window = MainGUI(self)
+        self.pipeline = pipeline.Pipeline(self.window.journal, self.alerter, self.ingest.put)
         
-        self.client = mqtt.Client()
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_message = self.on_message
-        self.connect_to_mqtt_server()
-        self.client.loop_start()
+        self.bridge = qtbridge.QtBridge(QtCore, self.window)
+        self.client = transport.AsyncClient(hostname, portnum, username, password, [broker_topic],
+                                            on_batch=self.on_batch, on_state=self.on_state)
+        self.bridge.start(self.client)
 
         timer = QTimer(self.window)
         timer.timeout.connect(lambda: self.timeoutEvent())
         timer.start(1000)
 
+        flushTimer = QTimer(self.window)
+        flushTimer.timeout.connect(self.flush_ingest)
+        flushTimer.start(1000 // ingestFlushRate)
+
+    def flush_ingest(self):
+        batch = self.ingest.drain()
+        if batch:
+            self.on_packets_received(batch)
+
     def timeoutEvent(self):
         self.window.dateLabel.setText(QDateTime.currentDateTime().toString("dd/MM/yyyy hh:mm:ss"))
-        if(time.time() - self.window.last_message_time) >= offlineTime:
-            self.window.change_state_offline()
-        else:
-            self.window.change_state_online()
+        self.window.refresh_visible_rows()
+        self.window.show_cache_stats()
+        self.window.expire_history()
+        self.window.journal.tick()
+        self.window.show_ingest_stats(*self.ingest.take_stats())
+        self.window.update_device_states()
 
-    def on_message(self,client, userdata, msg):
-        self.c.packetRecieved.emit(msg.payload.decode())
-        packet_json = json.loads(msg.payload.decode())
-        self.window.log_json.append(packet_json)
+    def on_batch(self, batch):
+        # the only place a payload is decoded; everything downstream gets
+        # the immutable Packet
+        self.pipeline.on_batch(batch)
 
-    def on_connect(self,client, userdata, flags, rc):
-        if rc == 0:
-            client.subscribe(broker_topic)
-            self.window.change_state_online()
+    def on_state(self, client):
+        # called on the network thread; the labels are changed on the Qt thread
+        if client.state == 'connected':
+            self.bridge.post(self.window.change_state_online)
         else:
-            self.window.change_state_offline()
-    
-    def on_disconnect(self, userdata, flags, rc):
-        self.window.change_state_offline()
-    
-    def on_message_received(self,msg):
-        winsound.Beep(440, 500)
-        self.window.add_device_item(msg)
-
-    def connect_to_mqtt_server(self):
-        self.client.username_pw_set(username, password)
-        try:
-            self.client.connect(hostname, portnum,60)
-        except:
-            self.window.statusLabel.setText("Offline")
-            self.window.statusLabel.setStyleSheet("QLabel { background-color : rgb(255, 0, 0); color : black;border: 1px solid black; }")
+            self.bridge.post(self.window.change_state_offline)
+
+    def on_packets_received(self, batch):
+        self.window.add_device_items(batch)
 
 def main():
+    # alerts from the log backend are INFO records
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(name)s: %(message)s')
     app = QApplication([])
     app.setStyle('Fusion')
     main = MainApp()
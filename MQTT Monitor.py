@@ -14,7 +14,7 @@
 ################################################################
 # standard Python libraries
 from __future__ import print_function
-import os, sys, struct, time, logging, functools, queue, signal, getpass
+import os, sys, struct, time, logging, functools, queue, signal, getpass, collections, threading
 
 # documentation: https://doc.qt.io/qt-5/index.html
 # documentation: https://www.riverbankcomputing.com/static/Docs/PyQt5/index.html
@@ -23,6 +23,33 @@ from PyQt5 import QtCore, QtGui, QtWidgets, QtNetwork
 # documentation: https://www.eclipse.org/paho/clients/python/docs/
 import paho.mqtt.client as mqtt
 
+# broker sessions sharing one network thread, and load generation through them
+import brokers
+import burst
+import json
+
+# rolling per-topic traffic counters
+from topicstats import TopicStatsTable
+
+# trie of received topics for the topic tree panel
+from topictree import TopicTree
+
+# compiled include/exclude patterns for the console filter
+from topicmatch import TopicFilter, WildcardTrie, PatternError
+
+# binary recording of received traffic
+import capture
+
+# raw payload storage and the viewers which decode it on demand
+import payloadview
+from packets import RingBuffer
+
+# log records kept unformatted for the log pane
+import logbuffer
+
+# indexed store of all received messages for the history search
+import history
+
 # default logging output
 log = logging.getLogger('main')
 
@@ -40,7 +67,473 @@ ideate_ports = {
                  8887 : '62-362',
 }
 
-mqtt_rc_codes = ['Success', 'Incorrect protocol version', 'Invalid client identifier', 'Server unavailable', 'Bad username or password', 'Not authorized']
+# default number of lines kept in the console window
+default_scrollback = 5000
+
+# number of lines that may wait for the console before the overflow policy applies
+default_console_queue_size = 20000
+
+# longest time spent rendering console text per timer tick, in seconds
+console_time_budget = 0.020
+
+# most queued messages filed into the history index per timer tick
+history_absorb_batch = 10000
+
+# length of the rolling window of the topic statistics, and the panel refresh period, in seconds
+topic_stats_window = 10.0
+topic_stats_refresh = 1.0
+
+################################################################
+class ConsoleQueue(object):
+    """Bounded queue of console lines passed from the network thread to the GUI.
+
+    When the GUI falls behind and the queue is full, new lines are handled
+    by the overflow policy: 'drop oldest' discards the oldest queued line,
+    'drop newest' discards the new line, and 'sample per topic' starts
+    thinning once the queue is half full, passing at most one message per
+    topic every sample_interval seconds.  Every discarded line is counted by
+    reason in the drops counter."""
+
+    policies = ['drop oldest', 'drop newest', 'sample per topic']
+
+    def __init__(self, maxsize, policy='drop oldest', sample_interval=1.0):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.sample_interval = sample_interval
+        self.drops = collections.Counter()
+        self._lock = threading.Lock()
+        self._items = collections.deque()
+        self._last_sampled = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, topic=None):
+        with self._lock:
+            if self.policy == 'sample per topic' and topic is not None and len(self._items) >= self.maxsize // 2:
+                now = time.monotonic()
+                last = self._last_sampled.get(topic)
+                if last is not None and (now - last) < self.sample_interval:
+                    self.drops['sampled'] += 1
+                    return
+                if len(self._last_sampled) > 100000:
+                    self._last_sampled.clear()
+                self._last_sampled[topic] = now
+
+            if len(self._items) >= self.maxsize:
+                if self.policy == 'drop oldest':
+                    self._items.popleft()
+                    self.drops['oldest dropped'] += 1
+                else:
+                    self.drops['newest dropped'] += 1
+                    return
+            self._items.append(item)
+
+    def get_nowait(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    def drop_counts(self):
+        with self._lock:
+            return dict(self.drops)
+
+################################################################
+class MessageRow(object):
+    """One received message as it arrived, decoded only when a view shows it."""
+    __slots__ = ('seq', 'source', 'received', 'topic', 'payload', 'qos', 'retain', 'repeats', 'viewer')
+
+    def __init__(self, source, received, topic, payload, qos=0, retain=False):
+        self.seq = None
+        self.source = source
+        self.received = received
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.repeats = 0
+        self.viewer = None      # detected on first display
+
+    def same_as(self, other):
+        return other is not None and self.topic == other.topic and self.payload == other.payload \
+            and self.source == other.source
+
+class MessageTableModel(QtCore.QAbstractTableModel):
+    """Table model of the most recent received messages, oldest first.
+
+    Messages are kept with their raw payloads in a ring buffer.  The payload
+    viewer is detected, and the one-line summary decoded, only when the view
+    asks for a row's payload cell, and the summary is cached by sequence
+    number until the row leaves the buffer."""
+
+    columns = ['time', 'server', 'topic', 'QoS', 'payload']
+    PAYLOAD = 4
+
+    def __init__(self, capacity, *args, **kwargs):
+        super(MessageTableModel,self).__init__(*args, **kwargs)
+        self.rows = RingBuffer(capacity)
+        self.summaries = {}
+        self.next_seq = 0
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.columns[section]
+        return None
+
+    def row(self, index):
+        return self.rows[index]
+
+    def last(self):
+        return self.rows[-1] if len(self.rows) else None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == QtCore.Qt.ToolTipRole and column == self.PAYLOAD:
+            return "%s, %d bytes%s" % (self.viewer(row), len(row.payload), ", retained" if row.retain else "")
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if column == 0:
+            return time.strftime("%H:%M:%S", time.localtime(row.received)) + ".%03d" % (int(row.received * 1000) % 1000)
+        elif column == 1:
+            return row.source
+        elif column == 2:
+            return row.topic
+        elif column == 3:
+            return str(row.qos) + (" R" if row.retain else "")
+        text = self.summaries.get(row.seq)
+        if text is None:
+            text = self.summaries[row.seq] = payloadview.summary(row.payload, self.viewer(row))
+        if row.repeats:
+            text += "    (repeated %d more times)" % row.repeats
+        return text
+
+    def viewer(self, row):
+        if row.viewer is None:
+            row.viewer = payloadview.detect(row.payload)
+        return row.viewer
+
+    def add_rows(self, batch):
+        if not batch:
+            return
+        batch = batch[-self.rows.capacity:]
+        overflow = len(self.rows) + len(batch) - self.rows.capacity
+        if overflow > 0:
+            self.beginRemoveRows(QtCore.QModelIndex(), 0, overflow - 1)
+            for i in range(overflow):
+                self.summaries.pop(self.rows.popleft().seq, None)
+            self.endRemoveRows()
+        first = len(self.rows)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(batch) - 1)
+        for row in batch:
+            row.seq = self.next_seq
+            self.next_seq += 1
+            self.rows.append(row)
+        self.endInsertRows()
+
+    def repeated(self):
+        """Signal that the repeat count of the last row has changed."""
+        last = len(self.rows) - 1
+        self.dataChanged.emit(self.index(last, self.PAYLOAD), self.index(last, self.PAYLOAD))
+
+    def set_capacity(self, capacity):
+        self.beginResetModel()
+        rows = list(self.rows)[-capacity:]
+        self.rows = RingBuffer(capacity)
+        for row in rows:
+            self.rows.append(row)
+        kept = set(row.seq for row in rows)
+        self.summaries = dict((seq, text) for seq, text in self.summaries.items() if seq in kept)
+        self.endResetModel()
+
+################################################################
+class HistoryResultModel(QtCore.QAbstractTableModel):
+    """Table model of the messages found by a history search, newest first.
+
+    A result may hold millions of message numbers; rows are added to the
+    model in steps of fetch_rows as the view scrolls toward the end, and a
+    message is read from the history store only when one of its cells is
+    shown.  Records read are cached until the next search."""
+
+    columns = MessageTableModel.columns
+    PAYLOAD = MessageTableModel.PAYLOAD
+    fetch_rows = 1000
+
+    def __init__(self, store, *args, **kwargs):
+        super(HistoryResultModel,self).__init__(*args, **kwargs)
+        self.store = store
+        self.ids = range(0)
+        self.loaded = 0
+        self._records = {}
+        self._summaries = {}
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.columns[section]
+        return None
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded < len(self.ids)
+
+    def fetchMore(self, parent):
+        rows = min(self.fetch_rows, len(self.ids) - self.loaded)
+        if rows <= 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.loaded, self.loaded + rows - 1)
+        self.loaded += rows
+        self.endInsertRows()
+
+    def set_result(self, ids):
+        self.beginResetModel()
+        self.ids = ids
+        self.loaded = min(self.fetch_rows, len(ids))
+        self._records = {}
+        self._summaries = {}
+        self.endResetModel()
+
+    def record(self, row):
+        """Return the HistoryRecord for a row, or None if it has left the store."""
+        ident = self.ids[len(self.ids) - 1 - row]
+        if ident not in self._records:
+            if len(self._records) > 10 * self.fetch_rows:
+                self._records = {}
+            self._records[ident] = self.store.get(ident)
+        return self._records[ident]
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        record = self.record(index.row())
+        if record is None:
+            return "(dropped)" if index.column() == 0 else None
+        column = index.column()
+        if column == 0:
+            return time.strftime("%m-%d %H:%M:%S", time.localtime(record.received)) + ".%03d" % (int(record.received * 1000) % 1000)
+        elif column == 1:
+            return record.source
+        elif column == 2:
+            return record.topic
+        elif column == 3:
+            return str(record.qos) + (" R" if record.retain else "")
+        text = self._summaries.get(record.id)
+        if text is None:
+            text = self._summaries[record.id] = payloadview.summary(record.payload)
+        return text
+
+################################################################
+class TopicStatsModel(QtCore.QAbstractTableModel):
+    """Table model presenting a TopicStatsTable, one row per topic ordered by message rate.
+
+    The rows are re-sorted on every refresh, but display values are only
+    computed for the rows the view actually asks for, so the panel stays
+    responsive with tens of thousands of topics."""
+
+    columns = ['Topic', 'msg/s', 'bytes/s', 'p50 size', 'p95 size', 'p99 size', 'jitter ms',
+               'count', 'QoS 0', 'QoS 1', 'QoS 2', 'retained']
+    keys = ['topic', 'rate', 'byte_rate', 'p50', 'p95', 'p99', 'jitter',
+            'count', 'qos0', 'qos1', 'qos2', 'retained']
+
+    def __init__(self, table, *args, **kwargs):
+        super(TopicStatsModel,self).__init__(*args, **kwargs)
+        self.table = table
+        self.rows = []
+        self._summaries = {}
+        self._now = time.monotonic()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.columns[section]
+        return None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.TextAlignmentRole and index.column() > 0:
+            return QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        row = index.row()
+        summary = self._summaries.get(row)
+        if summary is None:
+            summary = self._summaries[row] = self.table.summary(self.rows[row], self._now)
+        value = summary[self.keys[index.column()]]
+        if value is None:
+            return ""
+        if index.column() in (1, 2):
+            return "%.1f" % value
+        if index.column() == 6:
+            return "%.1f" % (value * 1000.0)
+        return str(value)
+
+    def refresh(self):
+        """Re-sort the topics by rate and mark every row as changed."""
+        self._now = time.monotonic()
+        rows = self.table.by_rate(self._now)
+        self._summaries = {}
+        if len(rows) < len(self.rows):
+            self.beginResetModel()
+            self.rows = rows
+            self.endResetModel()
+            return
+        if len(rows) > len(self.rows):
+            self.beginInsertRows(QtCore.QModelIndex(), len(self.rows), len(rows) - 1)
+            self.rows = rows
+            self.endInsertRows()
+        else:
+            self.rows = rows
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows) - 1, len(self.columns) - 1))
+
+################################################################
+class TopicTreeModel(QtCore.QAbstractItemModel):
+    """Item model over a TopicTree in which only expanded nodes have rows.
+
+    The children of a node are copied into the model by fetchMore() when the
+    view expands it and are forgotten again when it is collapsed, so the
+    view never holds items for the unexpanded bulk of a large tree.  Counts
+    and rates of the rows present are rolled up once per refresh."""
+
+    columns = ['Topic', 'messages', 'msg/s', 'last payload']
+
+    def __init__(self, tree, *args, **kwargs):
+        super(TopicTreeModel,self).__init__(*args, **kwargs)
+        self.tree = tree
+        self.fetched = {tree.root: []}    # node -> list of child nodes present as rows
+        self.row_of = {}
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.tree.root
+
+    def index_of(self, node):
+        if node is self.tree.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(self.row_of[node], 0, node)
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        rows = self.fetched.get(self.node(parent))
+        if rows is None or row >= len(rows):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, rows[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self.index_of(index.internalPointer().parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self.fetched.get(self.node(parent), ()))
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.columns)
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return False
+        return bool(self.node(parent).children)
+
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        return len(node.children) > len(self.fetched.get(node, ()))
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        rows = self.tree.children(node)
+        present = self.fetched.get(node, [])
+        if len(rows) <= len(present):
+            return
+        self.beginInsertRows(parent, len(present), len(rows) - 1)
+        self.fetched[node] = rows
+        for row, child in enumerate(rows):
+            self.row_of[child] = row
+            self.tree.rollup(child)
+        self.endInsertRows()
+
+    def forget(self, index):
+        """Drop the rows below a collapsed node, and everything fetched beneath them."""
+        node = self.node(index)
+        rows = self.fetched.get(node)
+        if not rows:
+            return
+        self.beginRemoveRows(index, 0, len(rows) - 1)
+        pending = [node]
+        while pending:
+            for child in self.fetched.pop(pending.pop(), ()):
+                self.row_of.pop(child, None)
+                if child in self.fetched:
+                    pending.append(child)
+        self.fetched[node] = []
+        self.endRemoveRows()
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.columns[section]
+        return None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+        if role == QtCore.Qt.ToolTipRole:
+            return node.path
+        if role == QtCore.Qt.TextAlignmentRole and column in (1, 2):
+            return QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if column == 0:
+            return node.name if node.name != '' else '(empty)'
+        elif column == 1:
+            return str(node.subtree_count)
+        elif column == 2:
+            return "%.1f" % node.subtree_rate
+        elif node.payload is not None:
+            return payloadview.summary(node.payload)
+        return ""
+
+    def refresh(self):
+        """Add rows for new children of expanded nodes and update the totals of all rows."""
+        now = time.time()
+        self.tree.rollup(self.tree.root, now)
+        for node in list(self.fetched):
+            if node not in self.fetched:
+                continue
+            parent = self.index_of(node)
+            if node is self.tree.root or self.fetched[node]:
+                self.fetchMore(parent)
+            rows = self.fetched[node]
+            for child in rows:
+                self.tree.rollup(child, now)
+            if rows:
+                self.dataChanged.emit(self.index(0, 1, parent), self.index(len(rows) - 1, len(self.columns) - 1, parent))
+
+    def reset(self):
+        self.beginResetModel()
+        self.fetched = {self.tree.root: []}
+        self.row_of = {}
+        self.endResetModel()
 
 ################################################################
 class MainGUI(QtWidgets.QMainWindow):
@@ -53,7 +546,13 @@ class MainGUI(QtWidgets.QMainWindow):
         self.main = main
 
         # create the GUI elements
-        self.console_queue = queue.Queue()
+        self.console_queue = ConsoleQueue(self.main.console_queue_size, self.main.overflow_policy)
+        self._shown_drops = None
+        self.console_dropped = 0     # lines never shown because a burst exceeded the scrollback
+        self.console_collapsed = 0   # repeated lines shown as a single line
+        self._last_console_line = None
+        self._repeat_count = 0
+        self._shown_message = None   # (seq, viewer) shown in the payload pane
         self.setupUi()
 
         self._handler = None
@@ -65,8 +564,22 @@ class MainGUI(QtWidgets.QMainWindow):
         # manage the console output across threads
         self.console_timer = QtCore.QTimer()
         self.console_timer.timeout.connect(self._poll_console_queue)
+        self.console_timer.timeout.connect(self._poll_log_buffer)
         self.console_timer.start(50)  # units are milliseconds
 
+        # refresh the topic statistics only while the panel is shown
+        self.stats_timer = QtCore.QTimer()
+        self.stats_timer.timeout.connect(self.refresh_topic_stats)
+        self.stats_timer.timeout.connect(self.refresh_topic_tree)
+        self.stats_timer.timeout.connect(self._show_capture_status)
+        self.stats_timer.timeout.connect(self.show_broker_states)
+        self.stats_timer.start(int(topic_stats_refresh * 1000))
+
+        # file received messages into the history index in bounded steps
+        self.history_timer = QtCore.QTimer()
+        self.history_timer.timeout.connect(self._absorb_history)
+        self.history_timer.start(200)
+
         return
 
     # ------------------------------------------------------------------------------------------------
@@ -130,6 +643,10 @@ class MainGUI(QtWidgets.QMainWindow):
         self.mqtt_password.setText(str(self.main.password))
         self.mqtt_password.editingFinished.connect(self.mqtt_password_entered)
         hbox.addWidget(self.mqtt_password)
+        self.mqtt_tls = QtWidgets.QCheckBox("TLS")
+        self.mqtt_tls.setChecked(self.main.tls)
+        self.mqtt_tls.toggled.connect(self.main.set_tls)
+        hbox.addWidget(self.mqtt_tls)
 
         # instructions
         explanation = QtWidgets.QLabel("""A subscription specifies topics to receive.  Please see help panel for details.""")
@@ -166,10 +683,90 @@ class MainGUI(QtWidgets.QMainWindow):
         hbox.addWidget(disconnect)
         self.verticalLayout.addLayout(hbox)
 
-        # text area for displaying both internal and received messages
+        # client-side filter applied to received messages before they reach the console
+        hbox = QtWidgets.QHBoxLayout()
+        hbox.addWidget(QtWidgets.QLabel("Message filter:"))
+        self.console_filter_entry = QtWidgets.QLineEdit()
+        self.console_filter_entry.setText(self.main.console_filter_text)
+        self.console_filter_entry.setPlaceholderText("show all received messages, e.g.  xyzzy/#  !xyzzy/debug/+  re:temp$")
+        self.console_filter_entry.editingFinished.connect(self.console_filter_entered)
+        hbox.addWidget(self.console_filter_entry)
+        self.verticalLayout.addLayout(hbox)
+
+        # table of received messages; payloads are decoded only for the rows in view
+        splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
+        self.message_model = MessageTableModel(self.main.scrollback)
+        self.messageView = QtWidgets.QTableView()
+        self.messageView.setModel(self.message_model)
+        self.messageView.verticalHeader().hide()
+        self.messageView.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.messageView.verticalHeader().setDefaultSectionSize(self.messageView.fontMetrics().height() + 4)
+        self.messageView.horizontalHeader().setStretchLastSection(True)
+        self.messageView.setWordWrap(False)
+        self.messageView.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.messageView.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.messageView.setColumnWidth(0, 100)
+        self.messageView.setColumnWidth(1, 120)
+        self.messageView.setColumnWidth(2, 150)
+        self.messageView.setColumnWidth(3, 40)
+        self.messageView.selectionModel().currentRowChanged.connect(self.message_selected)
+        splitter.addWidget(self.messageView)
+
+        # full view of the selected message payload
+        panel = QtWidgets.QWidget()
+        vbox = QtWidgets.QVBoxLayout(panel)
+        vbox.setContentsMargins(0, 0, 0, 0)
+        hbox = QtWidgets.QHBoxLayout()
+        hbox.addWidget(QtWidgets.QLabel("Payload viewer:"))
+        self.viewer_selector = QtWidgets.QComboBox()
+        self.viewer_selector.addItems(payloadview.VIEWERS)
+        self.viewer_selector.activated['QString'].connect(self.viewer_selected)
+        hbox.addWidget(self.viewer_selector)
+        hbox.addStretch()
+        self.payload_info = QtWidgets.QLabel()
+        hbox.addWidget(self.payload_info)
+        vbox.addLayout(hbox)
+        self.payloadOutput = QtWidgets.QPlainTextEdit()
+        self.payloadOutput.setReadOnly(True)
+        self.payloadOutput.setUndoRedoEnabled(False)
+        self.payloadOutput.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        font = QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont)
+        self.payloadOutput.setFont(font)
+        vbox.addWidget(self.payloadOutput)
+        splitter.addWidget(panel)
+
+        # text area for displaying internal status and log messages
         self.consoleOutput = QtWidgets.QPlainTextEdit()
         self.consoleOutput.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
-        self.verticalLayout.addWidget(self.consoleOutput)
+        self.consoleOutput.setReadOnly(True)
+        self.consoleOutput.setUndoRedoEnabled(False)
+        self.consoleOutput.setMaximumBlockCount(self.main.scrollback)
+        splitter.addWidget(self.consoleOutput)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
+        splitter.setStretchFactor(2, 1)
+        self.verticalLayout.addWidget(splitter, 1)
+
+        # console scrollback limit and counts of lines not shown
+        hbox = QtWidgets.QHBoxLayout()
+        hbox.addWidget(QtWidgets.QLabel("Scrollback lines:"))
+        self.scrollback_spin = QtWidgets.QSpinBox()
+        self.scrollback_spin.setRange(100, 1000000)
+        self.scrollback_spin.setSingleStep(1000)
+        self.scrollback_spin.setValue(self.main.scrollback)
+        self.scrollback_spin.editingFinished.connect(self.scrollback_entered)
+        hbox.addWidget(self.scrollback_spin)
+        hbox.addWidget(QtWidgets.QLabel("when behind:"))
+        self.overflow_selector = QtWidgets.QComboBox()
+        self.overflow_selector.addItems(ConsoleQueue.policies)
+        self.overflow_selector.setCurrentText(self.main.overflow_policy)
+        self.overflow_selector.activated['QString'].connect(self.overflow_policy_selected)
+        hbox.addWidget(self.overflow_selector)
+        hbox.addStretch()
+        self.console_counts = QtWidgets.QLabel()
+        hbox.addWidget(self.console_counts)
+        self.verticalLayout.addLayout(hbox)
+        self._show_console_counts()
 
         # instructions
         explanation = QtWidgets.QLabel("""Pressing enter in the data field will broadcast the string on the given topic.""")
@@ -199,6 +796,217 @@ class MainGUI(QtWidgets.QMainWindow):
         # set up the status bar which appears at the bottom of the window
         self.statusbar = QtWidgets.QStatusBar(self)
         self.setStatusBar(self.statusbar)
+        self.drop_status = QtWidgets.QLabel()
+        self.statusbar.addPermanentWidget(self.drop_status)
+        self.capture_status = QtWidgets.QLabel()
+        self.statusbar.addPermanentWidget(self.capture_status)
+
+        # dockable panel of per-topic traffic statistics, hidden until opened from the View menu
+        self.stats_dock = QtWidgets.QDockWidget("Topic Statistics", self)
+        self.stats_dock.setObjectName("topic_statistics")
+        panel = QtWidgets.QWidget()
+        vbox = QtWidgets.QVBoxLayout(panel)
+        vbox.setContentsMargins(0, 0, 0, 0)
+        hbox = QtWidgets.QHBoxLayout()
+        self.stats_summary = QtWidgets.QLabel()
+        hbox.addWidget(self.stats_summary)
+        hbox.addStretch()
+        reset = QtWidgets.QPushButton('Reset')
+        reset.pressed.connect(self.reset_topic_stats)
+        hbox.addWidget(reset)
+        vbox.addLayout(hbox)
+        self.stats_model = TopicStatsModel(self.main.topic_stats)
+        self.stats_view = QtWidgets.QTableView()
+        self.stats_view.setModel(self.stats_model)
+        self.stats_view.verticalHeader().hide()
+        self.stats_view.verticalHeader().setDefaultSectionSize(self.stats_view.fontMetrics().height() + 4)
+        self.stats_view.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.stats_view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        vbox.addWidget(self.stats_view)
+        self.stats_dock.setWidget(panel)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.stats_dock)
+        self.stats_dock.hide()
+
+        # dockable list of server sessions, all receiving at once
+        self.brokers_dock = QtWidgets.QDockWidget("Servers", self)
+        self.brokers_dock.setObjectName("servers")
+        panel = QtWidgets.QWidget()
+        vbox = QtWidgets.QVBoxLayout(panel)
+        vbox.setContentsMargins(0, 0, 0, 0)
+        self.brokers_table = QtWidgets.QTableWidget(0, 6)
+        self.brokers_table.setHorizontalHeaderLabels(['server', 'username', 'subscription', 'TLS', 'state', 'received'])
+        self.brokers_table.verticalHeader().hide()
+        self.brokers_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.brokers_table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.brokers_table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.brokers_table.horizontalHeader().setStretchLastSection(True)
+        self.brokers_table.itemSelectionChanged.connect(self.broker_selected)
+        vbox.addWidget(self.brokers_table)
+        hbox = QtWidgets.QHBoxLayout()
+        for title, slot in (('Connect', self.broker_connect_requested),
+                            ('Disconnect', self.broker_disconnect_requested),
+                            ('Remove', self.broker_remove_requested),
+                            ('Connect All', self.main.connect_all),
+                            ('Disconnect All', self.main.disconnect_all)):
+            button = QtWidgets.QPushButton(title)
+            button.pressed.connect(slot)
+            hbox.addWidget(button)
+        vbox.addLayout(hbox)
+        self.brokers_dock.setWidget(panel)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.brokers_dock)
+        self.brokers_dock.hide()
+
+        # dockable search over the indexed history of received messages
+        self.history_dock = QtWidgets.QDockWidget("Message History", self)
+        self.history_dock.setObjectName("message_history")
+        panel = QtWidgets.QWidget()
+        vbox = QtWidgets.QVBoxLayout(panel)
+        hbox = QtWidgets.QHBoxLayout()
+        self.history_query = QtWidgets.QLineEdit()
+        self.history_query.setPlaceholderText("topic:PATTERN server:NAME after:TIME before:TIME words")
+        self.history_query.setToolTip("All terms must match.  TIME is HH:MM[:SS], an ISO date, Unix seconds, or an age like 15m.\n"
+                                      "Words match text payloads ignoring case; quote a phrase with spaces.")
+        self.history_query.returnPressed.connect(self.history_search)
+        hbox.addWidget(self.history_query)
+        search = QtWidgets.QPushButton('Search')
+        search.pressed.connect(self.history_search)
+        hbox.addWidget(search)
+        self.history_words = QtWidgets.QCheckBox("Index words")
+        self.history_words.setToolTip("Index the words of text payloads as they arrive, for fast word searches.")
+        self.history_words.setChecked(self.main.history.tokens)
+        self.history_words.toggled.connect(self.main.set_history_words)
+        hbox.addWidget(self.history_words)
+        clear = QtWidgets.QPushButton('Clear')
+        clear.pressed.connect(self.clear_history)
+        hbox.addWidget(clear)
+        vbox.addLayout(hbox)
+        hbox = QtWidgets.QHBoxLayout()
+        self.history_status = QtWidgets.QLabel()
+        hbox.addWidget(self.history_status, 1)
+        self.history_counts = QtWidgets.QLabel()
+        self.history_counts.setToolTip("Messages not kept because they arrived faster than they could be indexed.")
+        hbox.addWidget(self.history_counts)
+        vbox.addLayout(hbox)
+        self.history_model = HistoryResultModel(self.main.history)
+        self.history_view = QtWidgets.QTableView()
+        self.history_view.setModel(self.history_model)
+        self.history_view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.history_view.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.history_view.setWordWrap(False)
+        self.history_view.verticalHeader().hide()
+        self.history_view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.history_view.horizontalHeader().setStretchLastSection(True)
+        self.history_view.selectionModel().currentRowChanged.connect(self.history_selected)
+        vbox.addWidget(self.history_view)
+        self.history_dock.setWidget(panel)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.history_dock)
+        self.history_dock.hide()
+
+        # dockable log pane, fed from the log record buffer rather than the console queue
+        self.log_dock = QtWidgets.QDockWidget("Log", self)
+        self.log_dock.setObjectName("log")
+        panel = QtWidgets.QWidget()
+        vbox = QtWidgets.QVBoxLayout(panel)
+        hbox = QtWidgets.QHBoxLayout()
+        self.log_enabled = QtWidgets.QCheckBox("Record log")
+        self.log_enabled.setChecked(self.main.log_enabled)
+        self.log_enabled.toggled.connect(self.log_enabled_toggled)
+        hbox.addWidget(self.log_enabled)
+        hbox.addWidget(QtWidgets.QLabel("level:"))
+        self.log_level = QtWidgets.QComboBox()
+        self.log_level.addItems(logbuffer.LEVELS)
+        self.log_level.setCurrentText(self.main.log_level)
+        self.log_level.activated['QString'].connect(self.log_level_selected)
+        hbox.addWidget(self.log_level)
+        clear = QtWidgets.QPushButton('Clear')
+        clear.pressed.connect(self.clear_log)
+        hbox.addWidget(clear)
+        hbox.addStretch()
+        self.log_counts = QtWidgets.QLabel()
+        hbox.addWidget(self.log_counts)
+        vbox.addLayout(hbox)
+        self.logOutput = QtWidgets.QPlainTextEdit()
+        self.logOutput.setReadOnly(True)
+        self.logOutput.setUndoRedoEnabled(False)
+        self.logOutput.setMaximumBlockCount(logbuffer.DEFAULT_CAPACITY)
+        vbox.addWidget(self.logOutput)
+        self.log_dock.setWidget(panel)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.log_dock)
+
+        # dockable burst publisher for load tests
+        self.burst_dock = QtWidgets.QDockWidget("Burst Publisher", self)
+        self.burst_dock.setObjectName("burst_publisher")
+        panel = QtWidgets.QWidget()
+        form = QtWidgets.QFormLayout(panel)
+        self.burst_topic = QtWidgets.QLineEdit(self.main.burst_settings['topic'])
+        form.addRow("Topic:", self.burst_topic)
+        self.burst_template = QtWidgets.QLineEdit(self.main.burst_settings['template'])
+        self.burst_template.setToolTip("Payload text; $seq, $count, $time and $iso are replaced in each message.")
+        form.addRow("Payload template:", self.burst_template)
+        self.burst_count = QtWidgets.QSpinBox()
+        self.burst_count.setRange(1, 100000000)
+        self.burst_count.setValue(self.main.burst_settings['count'])
+        form.addRow("Messages:", self.burst_count)
+        self.burst_rate = QtWidgets.QDoubleSpinBox()
+        self.burst_rate.setRange(0, 1000000)
+        self.burst_rate.setDecimals(1)
+        self.burst_rate.setSpecialValueText("as fast as possible")
+        self.burst_rate.setValue(self.main.burst_settings['rate'])
+        form.addRow("Messages per second:", self.burst_rate)
+        self.burst_qos = QtWidgets.QComboBox()
+        self.burst_qos.addItems(['0', '1', '2'])
+        self.burst_qos.setCurrentIndex(self.main.burst_settings['qos'])
+        form.addRow("QoS:", self.burst_qos)
+        self.burst_window = QtWidgets.QSpinBox()
+        self.burst_window.setRange(1, 65000)
+        self.burst_window.setValue(self.main.burst_settings['window'])
+        self.burst_window.setToolTip("Messages which may be waiting for acknowledgement at once.")
+        form.addRow("In-flight window:", self.burst_window)
+        hbox = QtWidgets.QHBoxLayout()
+        self.burst_start = QtWidgets.QPushButton('Start')
+        self.burst_start.pressed.connect(self.burst_start_requested)
+        hbox.addWidget(self.burst_start)
+        self.burst_stop = QtWidgets.QPushButton('Stop')
+        self.burst_stop.pressed.connect(self.main.stop_burst)
+        self.burst_stop.setEnabled(False)
+        hbox.addWidget(self.burst_stop)
+        form.addRow(hbox)
+        self.burst_status = QtWidgets.QLabel()
+        self.burst_status.setWordWrap(True)
+        form.addRow(self.burst_status)
+        self.burst_dock.setWidget(panel)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.burst_dock)
+        self.burst_dock.hide()
+
+        # the burst status changes faster than the statistics
+        self.burst_timer = QtCore.QTimer()
+        self.burst_timer.timeout.connect(self.show_burst_status)
+
+        # dockable tree of received topics, materialized only as far as it is expanded
+        self.tree_dock = QtWidgets.QDockWidget("Topic Tree", self)
+        self.tree_dock.setObjectName("topic_tree")
+        panel = QtWidgets.QWidget()
+        vbox = QtWidgets.QVBoxLayout(panel)
+        vbox.setContentsMargins(0, 0, 0, 0)
+        hbox = QtWidgets.QHBoxLayout()
+        self.tree_summary = QtWidgets.QLabel()
+        hbox.addWidget(self.tree_summary)
+        hbox.addStretch()
+        reset = QtWidgets.QPushButton('Reset')
+        reset.pressed.connect(self.reset_topic_tree)
+        hbox.addWidget(reset)
+        vbox.addLayout(hbox)
+        self.tree_model = TopicTreeModel(self.main.topic_tree)
+        self.tree_view = QtWidgets.QTreeView()
+        self.tree_view.setModel(self.tree_model)
+        self.tree_view.setUniformRowHeights(True)
+        self.tree_view.collapsed.connect(self.tree_model.forget)
+        self.tree_view.header().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
+        self.tree_view.setColumnWidth(0, 200)
+        vbox.addWidget(self.tree_view)
+        self.tree_dock.setWidget(panel)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.tree_dock)
+        self.tree_dock.hide()
 
         # set up the main menu
         self.menubar = QtWidgets.QMenuBar(self)
@@ -207,6 +1015,12 @@ class MainGUI(QtWidgets.QMainWindow):
         self.menubar.setObjectName("menubar")
         self.menuTitle = QtWidgets.QMenu(self.menubar)
         self.setMenuBar(self.menubar)
+        self.actionStartCapture = self.menuTitle.addAction("Start Capture...")
+        self.actionStartCapture.triggered.connect(self.start_capture_selected)
+        self.actionStopCapture = self.menuTitle.addAction("Stop Capture")
+        self.actionStopCapture.triggered.connect(self.main.stop_capture)
+        self.actionStopCapture.setEnabled(False)
+        self.menuTitle.addSeparator()
         self.actionQuit = QtWidgets.QAction(self)
         self.menuTitle.addAction(self.actionQuit)
         self.menubar.addAction(self.menuTitle.menuAction())
@@ -215,21 +1029,26 @@ class MainGUI(QtWidgets.QMainWindow):
         self.actionQuit.setShortcut("Ctrl+Q")
         self.actionQuit.triggered.connect(self.quitSelected)
 
+        self.menuView = self.menubar.addMenu("View")
+        self.menuView.addAction(self.log_dock.toggleViewAction())
+        self.menuView.addAction(self.history_dock.toggleViewAction())
+        self.menuView.addAction(self.brokers_dock.toggleViewAction())
+        self.menuView.addAction(self.burst_dock.toggleViewAction())
+        self.menuView.addAction(self.stats_dock.toggleViewAction())
+        self.menuView.addAction(self.tree_dock.toggleViewAction())
+
         return
 
     # --- logging to screen -------------------------------------------------------------
     def enable_console_logging(self):
-        # get the root logger to receive all logging traffic
-        logger = logging.getLogger()
-        # create a logging handler which writes to the console window via self.write
-        handler = logging.StreamHandler(self)
-        handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s: %(message)s'))
-        logger.addHandler(handler)
-        # logger.setLevel(logging.NOTSET)
-        logger.setLevel(logging.DEBUG)
-        handler.setLevel(logging.NOTSET)
-        self._handler = handler
-        log.info("Enabled logging in console window.")
+        # get the root logger to receive all logging traffic, kept unformatted in a
+        # bounded buffer which the log pane reads on the timer
+        logbuffer.lean_records()
+        self._handler = logbuffer.LogBuffer()
+        self._log_seq = 0
+        self._log_dropped = 0
+        self.apply_log_level()
+        log.info("Enabled logging in log pane.")
         return
 
     def disable_console_logging(self):
@@ -237,23 +1056,252 @@ class MainGUI(QtWidgets.QMainWindow):
             logging.getLogger().removeHandler(self._handler)
             self._handler = None
 
+    def apply_log_level(self):
+        """Set the logger levels so records below the chosen level are never created."""
+        logger = logging.getLogger()
+        if self.main.log_enabled:
+            level = getattr(logging, self.main.log_level)
+            logger.addHandler(self._handler)
+        else:
+            # only problems, printed to the terminal by the logging module's last resort handler
+            level = logging.WARNING
+            logger.removeHandler(self._handler)
+        logger.setLevel(level)
+        # the MQTT library logs every packet at DEBUG; pass those only when asked for
+        mqtt_log.setLevel(level if level == logging.DEBUG else max(level, logging.WARNING))
+
+    def log_enabled_toggled(self, enabled):
+        self.main.set_log_enabled(enabled)
+        self.apply_log_level()
+
+    def log_level_selected(self, level):
+        self.main.set_log_level(level)
+        self.apply_log_level()
+
+    def clear_log(self):
+        self.logOutput.clear()
+        self._log_dropped = 0
+        self._show_log_counts()
+
+    def _poll_log_buffer(self):
+        """Format and show the log records added since the last tick, while the pane is visible."""
+        if self._handler is None or not self.log_dock.isVisible():
+            return
+        entries, dropped = self._handler.since(self._log_seq)
+        if not entries:
+            return
+        self._log_seq = entries[-1].seq + 1
+        limit = self.logOutput.maximumBlockCount()
+        if len(entries) > limit:
+            dropped += len(entries) - limit
+            entries = entries[-limit:]
+        self._log_dropped += dropped
+        self.logOutput.appendPlainText("\n".join(entry.format() for entry in entries))
+        self._show_log_counts()
+
+    def _show_log_counts(self):
+        self.log_counts.setText("%d records not shown" % self._log_dropped if self._log_dropped else "")
+
     # --- window and qt event processing -------------------------------------------------------------
     def show_status(self, string):
         self.statusbar.showMessage(string)
 
     def _poll_console_queue(self):
-        """Write any queued console text to the console text area from the main thread."""
-        while not self.console_queue.empty():
-            string = str(self.console_queue.get())
-            stripped = string.rstrip()
-            if stripped != "":
-                self.consoleOutput.appendPlainText(stripped)
+        """Move queued console text and received messages into their views from the main thread.
+
+        All lines taken from the queue in one tick are appended with a single
+        insertion, and all messages with a single row insertion; the queue is
+        only drained for console_time_budget seconds so a burst cannot stall
+        the event loop, and the rest waits for the next tick.  Consecutive
+        identical lines or messages are collapsed into one, and a burst
+        longer than the scrollback is cut to its newest entries before
+        rendering.
+        """
+        deadline = time.perf_counter() + console_time_budget
+        scrollback = self.consoleOutput.maximumBlockCount()
+        lines = collections.deque()
+        messages = collections.deque()
+        last_message = self.message_model.last()
+        repeated = False
+        dropped = 0
+        while time.perf_counter() < deadline:
+            try:
+                string = self.console_queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(string, MessageRow):
+                if string.same_as(last_message):
+                    last_message.repeats += 1
+                    self.console_collapsed += 1
+                    repeated = repeated or not messages
+                    continue
+                last_message = string
+                messages.append(string)
+                if len(messages) > scrollback:
+                    messages.popleft()
+                    dropped += 1
+                continue
+            stripped = str(string).rstrip()
+            if stripped == "":
+                continue
+            if stripped == self._last_console_line:
+                self._repeat_count += 1
+                self.console_collapsed += 1
+                continue
+            if self._repeat_count > 0:
+                lines.append("    (last line repeated %d more times)" % self._repeat_count)
+                self._repeat_count = 0
+            self._last_console_line = stripped
+            lines.append(stripped)
+            if len(lines) > scrollback:
+                lines.popleft()
+                dropped += 1
+
+        self.console_dropped += dropped
+        if lines:
+            self.consoleOutput.appendPlainText("\n".join(lines))
+        if repeated:
+            self.message_model.repeated()
+        if messages:
+            scrollbar = self.messageView.verticalScrollBar()
+            at_bottom = scrollbar.value() >= scrollbar.maximum()
+            self.message_model.add_rows(list(messages))
+            if at_bottom:
+                self.messageView.scrollToBottom()
+        if lines or messages or self.console_collapsed:
+            self._show_console_counts()
+        self._show_drop_status()
         return
 
-    def write(self, string):
+    def _show_drop_status(self):
+        drops = self.console_queue.drop_counts()
+        if drops != self._shown_drops:
+            self._shown_drops = drops
+            text = ", ".join("%d %s" % (count, reason) for reason, count in sorted(drops.items()))
+            self.drop_status.setText("Queue drops: " + (text or "none"))
+
+    def _show_console_counts(self):
+        self.console_counts.setText("%d lines dropped, %d repeats collapsed" % (self.console_dropped, self.console_collapsed))
+
+    def refresh_topic_stats(self):
+        if self.stats_dock.isVisible():
+            self.stats_model.refresh()
+            self.stats_summary.setText("%d topics, %.0f s window, sorted by message rate" % (len(self.main.topic_stats), topic_stats_window))
+
+    def reset_topic_stats(self):
+        self.main.topic_stats.clear()
+        self.stats_model.refresh()
+        self.refresh_topic_stats()
+
+    def refresh_topic_tree(self):
+        if self.tree_dock.isVisible():
+            self.tree_model.refresh()
+            root = self.main.topic_tree.root
+            self.tree_summary.setText("%d topic levels, %d messages, %.1f msg/s" % (self.main.topic_tree.nodes - 1, root.subtree_count, root.subtree_rate))
+
+    def reset_topic_tree(self):
+        self.main.topic_tree.clear()
+        self.tree_model.reset()
+        self.refresh_topic_tree()
+
+    def console_filter_entered(self):
+        text = self.console_filter_entry.text()
+        if text != self.main.console_filter_text:
+            self.main.set_console_filter(text)
+
+    def _absorb_history(self):
+        self.main.history.absorb(history_absorb_batch)
+        dropped = self.main.history.dropped
+        self.history_counts.setText("%d messages dropped" % dropped if dropped else "")
+
+    def history_search(self):
+        text = self.history_query.text()
+        try:
+            result = self.main.history.search(text)
+        except ValueError as e:
+            self.history_status.setText("Invalid search: %s" % e)
+            return
+        self.history_model.set_result(result.ids)
+        self.history_status.setText("%d of %d messages match, newest first; %.1f ms by %s" % (
+            len(result.ids), result.total, result.elapsed * 1000, result.plan))
+
+    def history_selected(self, current, previous):
+        if not current.isValid():
+            return
+        record = self.history_model.record(current.row())
+        if record is None:
+            return
+        viewer = self.viewer_selector.currentText()
+        if viewer == 'auto':
+            viewer = payloadview.detect(record.payload)
+        self._shown_message = None
+        self.payloadOutput.setPlainText(payloadview.render(record.payload, viewer))
+        self.payload_info.setText("%s, %d bytes, QoS %d%s, %s" % (viewer, len(record.payload), record.qos,
+                                                                  ", retained" if record.retain else "", record.topic))
+
+    def clear_history(self):
+        self.main.history.clear()
+        self.history_model.set_result(range(0))
+        self.history_status.setText("History cleared.")
+
+    def start_capture_selected(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Capture received messages to", self.main.capture_path,
+                                                        "MQTT captures (*.mqcap);;All files (*)")
+        if path:
+            self.main.start_capture(path)
+
+    def set_capture_state(self, capturing):
+        self.actionStartCapture.setEnabled(not capturing)
+        self.actionStopCapture.setEnabled(capturing)
+        self._show_capture_status()
+
+    def _show_capture_status(self):
+        writer = self.main.capture
+        if writer is None:
+            self.capture_status.setText("")
+        else:
+            self.capture_status.setText("Capturing: %d messages" % writer.count)
+
+    def message_selected(self, current, previous):
+        self.show_payload()
+
+    def viewer_selected(self, viewer):
+        self.show_payload()
+
+    def show_payload(self):
+        """Render the selected message in the payload pane, unless it is already shown."""
+        index = self.messageView.currentIndex()
+        if not index.isValid():
+            return
+        row = self.message_model.row(index.row())
+        viewer = self.viewer_selector.currentText()
+        if viewer == 'auto':
+            viewer = self.message_model.viewer(row)
+        if self._shown_message == (row.seq, viewer):
+            return
+        self._shown_message = (row.seq, viewer)
+        self.payloadOutput.setPlainText(payloadview.render(row.payload, viewer))
+        self.payload_info.setText("%s, %d bytes, QoS %d%s" % (viewer, len(row.payload), row.qos, ", retained" if row.retain else ""))
+
+    def overflow_policy_selected(self, policy):
+        self.console_queue.policy = policy
+        self.main.set_overflow_policy(policy)
+
+    def scrollback_entered(self):
+        lines = self.scrollback_spin.value()
+        self.consoleOutput.setMaximumBlockCount(lines)
+        self.message_model.set_capacity(lines)
+        self.main.set_scrollback(lines)
+
+    def post_message(self, row):
+        """Queue a received MessageRow for the message table; may be called from any thread."""
+        self.console_queue.put(row, row.topic)
+
+    def write(self, string, topic=None):
         """Write output to the console text area in a thread-safe way.  Qt only allows
-        calls from the main thread, but the service routines run on separate threads."""
-        self.console_queue.put(string)
+        calls from the main thread, but the service routines run on separate threads.
+        The topic of a received message is used by the 'sample per topic' overflow policy."""
+        self.console_queue.put(string, topic)
         return
 
     def quitSelected(self):
@@ -262,18 +1310,110 @@ class MainGUI(QtWidgets.QMainWindow):
 
     def closeEvent(self, event):
         self.write("Received window close event.")
+        self.main.stop_capture()
         self.main.app_is_exiting()
         self.disable_console_logging()
         super(MainGUI,self).closeEvent(event)
 
-    def set_connected_state(self, flag):
+    def set_connected_state(self, flag, connected=1, total=1):
         if flag is True:
-            self.connected.setText("  Connected   ")
+            if total > 1:
+                self.connected.setText("  Connected %d/%d  " % (connected, total))
+            else:
+                self.connected.setText("  Connected   ")
             self.connected.setStyleSheet("color: white; background-color: green;")
         else:
             self.connected.setText(" Not Connected ")
             self.connected.setStyleSheet("color: white; background-color: blue;")
 
+    def show_broker_states(self):
+        """Update the connection indicator and the server list from the session states."""
+        sessions = self.main.brokers.session_list()
+        connected = sum(1 for session in sessions if session.state == 'connected')
+        self.set_connected_state(connected > 0, connected, len(sessions))
+        if not self.brokers_dock.isVisible():
+            return
+        table = self.brokers_table
+        if table.rowCount() != len(sessions):
+            table.setRowCount(len(sessions))
+        for row, session in enumerate(sessions):
+            state = session.state if not session.error else "%s (%s)" % (session.state, session.error)
+            values = [session.name, session.username, " ".join(session.subscriptions),
+                      "yes" if session.tls else "no", state, str(session.received)]
+            for column, value in enumerate(values):
+                item = table.item(row, column)
+                if item is None:
+                    table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+                elif item.text() != value:
+                    item.setText(value)
+
+    def burst_start_requested(self):
+        settings = {'topic': self.burst_topic.text(),
+                    'template': self.burst_template.text(),
+                    'count': self.burst_count.value(),
+                    'rate': self.burst_rate.value(),
+                    'qos': self.burst_qos.currentIndex(),
+                    'window': self.burst_window.value()}
+        if self.main.start_burst(settings):
+            self.burst_start.setEnabled(False)
+            self.burst_stop.setEnabled(True)
+            self.burst_timer.start(250)
+
+    def show_burst_status(self):
+        publisher = self.main.burst
+        if publisher is None:
+            return
+        stats = publisher.stats()
+        def ms(value):
+            return "-" if value is None else "%.1f" % (value * 1000.0)
+        self.burst_status.setText(
+            "%s: %d of %d sent on %s, %d acknowledged, %d in flight, %d failed, %.0f msg/s\n"
+            "ack latency ms: p50 %s, p90 %s, p99 %s, max %s" % (
+                "running" if stats['running'] else "finished", stats['sent'], stats['count'], publisher.session,
+                stats['acked'], stats['inflight'], stats['failed'], stats['rate'],
+                ms(stats['p50']), ms(stats['p90']), ms(stats['p99']), ms(stats['max'])))
+        if not stats['running']:
+            self.burst_timer.stop()
+            self.burst_start.setEnabled(True)
+            self.burst_stop.setEnabled(False)
+
+    def selected_broker(self):
+        rows = self.brokers_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        item = self.brokers_table.item(rows[0].row(), 0)
+        return item.text() if item is not None else None
+
+    def broker_selected(self):
+        # load the selected session into the connection fields for editing
+        session = self.main.brokers.get(self.selected_broker())
+        if session is None:
+            return
+        self.mqtt_server_name.setText(session.host)
+        self.mqtt_username.setText(session.username)
+        self.mqtt_password.setText(session.password)
+        self.mqtt_tls.setChecked(session.tls)
+        self.mqtt_sub.setText(" ".join(session.subscriptions))
+        for i in range(self.port_selector.count()):
+            if self.port_selector.itemText(i).split(' ')[0] == str(session.port):
+                self.port_selector.setCurrentIndex(i)
+        self.main.select_session(session)
+
+    def broker_connect_requested(self):
+        name = self.selected_broker()
+        if name is not None:
+            self.main.brokers.connect(name)
+
+    def broker_disconnect_requested(self):
+        name = self.selected_broker()
+        if name is not None:
+            self.main.brokers.disconnect(name)
+
+    def broker_remove_requested(self):
+        name = self.selected_broker()
+        if name is not None:
+            self.main.remove_session(name)
+
 
     # --- GUI widget event processing ----------------------------------------------------------------------
 
@@ -304,6 +1444,8 @@ td { padding-left: 20px; }
   <dt>password</dt><dd>Server-specific password, chosen by your instructor.</dd>
 </dl>
 
+<p>Several servers can be monitored at once.  Pressing Connect adds the server and port in the fields to the list in the Servers panel (View menu) and connects to it, keeping any other connections open; the server of each received message is shown in the message table.  Selecting a server in the panel loads its settings into the fields for editing, and the panel buttons connect, disconnect, or remove servers individually or all together.  Connections which are lost are retried automatically.</p>
+
 <p>Your username and password is specific to the MQTT server and will be provided by your instructor.  This may be individual or may be a shared login for all students in the course.  Please note, the password will not be your Andrew password.</p>
 
 <h2>Listening</h2>
@@ -328,9 +1470,27 @@ Our course policy will be to prefix all topics with a student andrew ID, e.g. if
 <tr><td><b>xyzzy/#</b></td><td>subscribe to all published messages for user xyzzy, including subtopics</td></tr>
 </table>
 </p>
-<p>Changing the subscription field immediately changes what is received; the monitor unsubscribes from the previous pattern and subscribes to the new one.  Entering an empty field defaults to the global pattern '#'.</p>
+<p>Changing the subscription field immediately changes what is received from the server in the fields; the monitor unsubscribes from the previous patterns and subscribes to the new ones.  Several patterns may be given separated by spaces.  Entering an empty field defaults to the global pattern '#'.</p>
+
+<p>The large table lists the received messages.  Payloads are kept as received and decoded only for the rows in view; selecting a row shows its full payload below the table, as pretty-printed JSON, text, a number, or a hex dump as detected, or in the viewer chosen from the menu above it.  The console area under that shows status messages.</p>
 
-<p>The large text field is the console area which shows both debugging and status log messages as well as received messages.</p>
+<p>Debugging and status log records appear in the Log pane, which the View menu shows or hides.  Records are kept in a bounded buffer without being formatted, and only those at or above the chosen level are created at all, so the default INFO level costs nothing per received message; DEBUG adds a record for every packet the MQTT library handles.  Unchecking Record log keeps only warnings, which are printed to the terminal.</p>
+
+<p>The message filter field above the table selects which received messages are listed, without changing the subscription.  It holds any number of patterns separated by spaces.  A pattern uses the same + and # wildcards as a subscription, or is a regular expression when written as <tt>re:</tt><i>expression</i>.  A pattern prefixed with ! hides matching topics instead.  A message is shown when it matches some pattern without a ! (or there are none) and no pattern with a !, as per the following examples.</p>
+<p><table>
+<tr><td><b>xyzzy/# !xyzzy/debug/#</b></td><td>show messages from user xyzzy, except debugging output</td></tr>
+<tr><td><b>+/sensor/+</b></td><td>show every user's sensor sub-sub-topics</td></tr>
+<tr><td><b>re:temp|humidity</b></td><td>show topics containing temp or humidity</td></tr>
+</table>
+</p>
+
+<p>The Topic Statistics panel, opened from the View menu, lists every topic received with its message and byte rates over the last ten seconds, approximate payload size percentiles, the inter-arrival jitter, and counts of messages by QoS level and retain flag.  The busiest topics are listed first.</p>
+
+<p>The Topic Tree panel, also in the View menu, organizes the received topics by their <tt>/</tt> separated levels.  Each entry shows the number of messages and the message rate for the topic and all of its subtopics, and the last payload received on exactly that topic.</p>
+
+<h2>Recording</h2>
+
+<p>File/Start Capture records every received message, whether or not it is shown in the console, into a compact binary capture file with its receive time, topic, QoS, retain flag, and payload bytes.  File/Stop Capture closes the file.  Captures can be summarized with <tt>python capture.py</tt> <i>file</i>.</p>
 
 <h2>Sending</h2>
 
@@ -339,6 +1499,10 @@ transmit the data string on the specified topic.  The text is not cleared after
 <p>The MQTT protocol supports binary messages (i.e. any sequence of bytes), but this tool currently only supports sending messages with plain text.</p>
 
 
+<p>The Burst Publisher panel in the View menu sends many messages for load testing, using the server in the connection fields.  It publishes the given number of messages at the given rate, or as fast as possible when the rate is zero, with at most the in-flight window of messages waiting to be acknowledged at once.  In the payload template, <tt>$seq</tt> is replaced with the message number counting from zero, <tt>$count</tt> with the number of messages, <tt>$time</tt> with the Unix time, and <tt>$iso</tt> with the ISO 8601 time.  While it runs the panel shows the achieved rate and percentiles of the time until each message is acknowledged.</p>
+
+<p>Every received message is also kept in an indexed history, up to a million messages, which the Message History panel in the View menu searches.  A search is a list of terms which must all hold: <tt>topic:</tt> with a subscription pattern such as <tt>topic:user/+/temp</tt>, <tt>server:</tt> with a server name such as <tt>server:mqtt.ideate.cmu.edu:8884</tt>, <tt>after:</tt> and <tt>before:</tt> with a time of day like <tt>14:30</tt>, a date and time like <tt>2024-03-01T14:30</tt>, or an age like <tt>15m</tt> or <tt>2h</tt>, and plain words which a text payload must contain, ignoring case; quote a phrase which includes spaces.  An empty search lists everything.  The matches are listed newest first and selecting one shows its payload in the payload pane.  Indexing the words of payloads makes word searches fast at some cost per received message; it can be turned off with the Index words box.</p>
+
 <h2>More Information</h2>
 
 <p>The IDeATE server has more detailed information on the server help page at <b>https://mqtt.ideate.cmu.edu</b></p>
@@ -433,6 +1597,7 @@ class MainApp(object):
         self.portnum  = self.settings.value('mqtt_port', None)
         self.username = self.settings.value('mqtt_user', 'students')
         self.password = self.settings.value('mqtt_password', '(not yet entered)')
+        self.tls = self.settings.value('mqtt_tls', 'true') in (True, 'true')
 
         # Create a default subscription based on the username.  The hash mark is a wildcard.
         username = getpass.getuser()
@@ -442,26 +1607,70 @@ class MainApp(object):
         self.topic = self.settings.value('mqtt_topic', username)
         self.payload = self.settings.value('mqtt_payload', 'hello')
 
+        # console window line limit, and the queue feeding it
+        self.scrollback = int(self.settings.value('console_scrollback', default_scrollback))
+        self.console_queue_size = int(self.settings.value('console_queue_size', default_console_queue_size))
+        self.overflow_policy = self.settings.value('console_overflow', 'drop oldest')
+        if self.overflow_policy not in ConsoleQueue.policies:
+            self.overflow_policy = 'drop oldest'
+
+        # log pane level, and whether records are kept at all
+        self.log_level = self.settings.value('log_level', 'INFO')
+        if self.log_level not in logbuffer.LEVELS:
+            self.log_level = 'INFO'
+        self.log_enabled = self.settings.value('log_enabled', 'true') in (True, 'true')
+
+        # client-side console filter
+        self.console_filter_text = self.settings.value('console_filter', '')
+        try:
+            self.console_filter = TopicFilter.parse(self.console_filter_text)
+        except PatternError:
+            self.console_filter_text = ''
+            self.console_filter = TopicFilter()
+
+        # binary capture of received messages, when recording
+        self.capture = None
+        self.capture_path = self.settings.value('capture_path', 'capture.mqcap')
+
+        # indexed history of every received message, for searching
+        self.history = history.MessageHistory(int(self.settings.value('history_capacity', history.DEFAULT_CAPACITY)),
+                                              tokens=self.settings.value('history_words', 'true') in (True, 'true'))
+
+        # per-topic traffic statistics, updated from the network thread
+        self.topic_stats = TopicStatsTable(topic_stats_window)
+        self.topic_tree = TopicTree()
+
+        # Initialize the MQTT client system: any number of server sessions
+        # driven by a single network thread, restored from the settings.
+        self.brokers = brokers.ConnectionManager(self.on_message, self.on_broker_state, self.on_publish,
+                                                 self.on_connection_lost, logger=mqtt_log)
+        try:
+            saved = json.loads(self.settings.value('mqtt_sessions', '[]'))
+        except ValueError:
+            saved = []
+        for settings in saved:
+            self.brokers.add(brokers.BrokerSession.from_settings(settings))
+
+        # burst publisher settings, and the publisher while one runs
+        self.burst = None
+        self.burst_settings = {'topic': self.topic + '/load',
+                               'template': '{"seq": $seq, "time": $time}',
+                               'count': 1000, 'rate': 100.0, 'qos': 1, 'window': 100}
+        try:
+            self.burst_settings.update(json.loads(self.settings.value('burst_settings', '{}')))
+        except ValueError:
+            pass
+
         # create the interface window
         self.window = MainGUI(self)
 
-        # Initialize the MQTT client system
-        self.client = mqtt.Client()
-        self.client.enable_logger(mqtt_log)
-        self.client.on_log = self.on_log
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_message = self.on_message
-        self.client.tls_set()
-
         self.window.show_status("Please set the MQTT server address and select Connect.")
         return
 
     ################################################################
     def app_is_exiting(self):
-        if self.client.is_connected():
-            self.client.disconnect()
-            self.client.loop_stop()
+        self.stop_burst()
+        self.brokers.close()
 
     def _sigint_handler(self, signal, frame):
         print("Keyboard interrupt caught, running close handlers...")
@@ -485,56 +1694,91 @@ class MainApp(object):
         self.password = name
         self.settings.setValue('mqtt_password', name)
 
+    def set_tls(self, flag):
+        self.tls = flag
+        self.settings.setValue('mqtt_tls', 'true' if flag else 'false')
+
+    def session_name(self):
+        return "%s:%d" % (self.hostname, self.portnum)
+
+    def current_session(self):
+        if self.portnum is None:
+            return None
+        return self.brokers.get(self.session_name())
+
+    def select_session(self, session):
+        self.set_server_name(session.host)
+        self.set_server_port(session.port)
+        self.set_username(session.username)
+        self.set_password(session.password)
+        self.set_tls(session.tls)
+        self.subscription = " ".join(session.subscriptions)
+        self.settings.setValue('mqtt_subscription', self.subscription)
+
+    def save_sessions(self):
+        self.settings.setValue('mqtt_sessions', json.dumps([session.settings() for session in self.brokers.session_list()]))
+
     def connect_to_mqtt_server(self):
-        if self.client.is_connected():
-            self.window.write("Already connected.")
-        else:
-            if self.portnum is None:
-                log.warning("Please specify the server port before attempting connection.")
-            else:
-                log.debug("Initiating MQTT connection to %s:%d" % (self.hostname, self.portnum))
-                self.window.write("Attempting connection.")
-                self.client.username_pw_set(self.username, self.password)
-                self.client.connect_async(self.hostname, self.portnum)
-                self.client.loop_start()
+        if self.portnum is None:
+            log.warning("Please specify the server port before attempting connection.")
+            return
+        session = self.current_session()
+        settings = (self.hostname, self.portnum, self.username, self.password, self.subscription.split(), self.tls)
+        if session is not None and session.state == 'connected' and \
+                (session.host, session.port, session.username, session.password, session.subscriptions, session.tls) == settings:
+            self.window.write("Already connected to %s." % session.name)
+            return
+        log.debug("Initiating MQTT connection to %s:%d" % (self.hostname, self.portnum))
+        self.window.write("Attempting connection to %s." % self.session_name())
+        self.brokers.add(brokers.BrokerSession(self.session_name(), *settings))
+        self.brokers.connect(self.session_name())
+        self.save_sessions()
 
     def disconnect_from_mqtt_server(self):
-        if self.client.is_connected():
-            self.client.disconnect()
+        session = self.current_session()
+        if session is not None and session.state != 'disconnected':
+            self.brokers.disconnect(session.name)
         else:
             self.window.write("Not connected.")
-        self.client.loop_stop()
 
-    ################################################################
-    # The callback for when the broker responds to our connection request.
-    def on_connect(self, client, userdata, flags, rc):
-        self.window.write("Connected to server with with flags: %s, result code: %s" % (flags, rc))
+    def connect_all(self):
+        for session in self.brokers.session_list():
+            self.brokers.connect(session.name)
 
-        if rc == 0:
-            log.info("Connection succeeded.")
+    def disconnect_all(self):
+        for session in self.brokers.session_list():
+            self.brokers.disconnect(session.name)
 
-        elif rc > 0:
-            if rc < len(mqtt_rc_codes):
-                log.warning("Connection failed with error: %s", mqtt_rc_codes[rc])
-            else:
-                log.warning("Connection failed with unknown error %d", rc)
+    def remove_session(self, name):
+        self.brokers.remove(name)
+        self.save_sessions()
+        self.window.write("Removed server %s." % name)
 
-        # Subscribing in on_connect() means that if we lose the connection and reconnect then subscriptions will be renewed.
-        client.subscribe(self.subscription)
-        self.window.show_status("Connected.")
-        self.window.set_connected_state(True)
-        return
+    ################################################################
+    # The callback for changes of the connection state of any server session,
+    # called on the network thread.  On every connection the session renews
+    # its subscriptions, so they survive reconnecting.
+    def on_broker_state(self, session):
+        if session.state == 'connected':
+            log.info("Connection to %s succeeded.", session.name)
+            self.window.write("Connected to %s, subscribed to %s" % (session.name, " ".join(session.subscriptions)))
+        elif session.error:
+            log.warning("%s: %s, %s", session.name, session.state, session.error)
+        else:
+            self.window.write("%s: %s" % (session.name, session.state))
 
-    # The callback for when the broker responds with error messages.
-    def on_log(client, userdata, level, buf):
-        log.debug("on_log level %s: %s", level, userdata)
-        return
+    # The callback for when a published message has been acknowledged, or
+    # written to the socket for QoS 0.
+    def on_publish(self, source, mid):
+        publisher = self.burst
+        if publisher is not None and publisher.session == source:
+            publisher.on_publish(mid)
 
-    def on_disconnect(self, client, userdata, rc):
-        log.debug("disconnected")
-        self.window.write("Disconnected from server.")
-        self.window.show_status("Disconnected.")
-        self.window.set_connected_state(False)
+    # The callback for when an established broker connection drops.
+    def on_connection_lost(self, source):
+        publisher = self.burst
+        if publisher is not None and publisher.session == source:
+            publisher.connection_lost()
 
     # The callback for when a message has been received on a topic to which this
     # client is subscribed.  The message variable is a MQTTMessage that describes
@@ -545,32 +1789,116 @@ class MainApp(object):
     #   qos is an integer quality of service indicator (0,1, or 2)
     #   mid is an integer message ID.
 
-    def on_message(self, client, userdata, msg):
-        self.window.write("{%s} %s" % (msg.topic, msg.payload))
+    def on_message(self, source, msg):
+        received = time.time()
+        writer = self.capture
+        if writer is not None:
+            writer.write(received, msg.topic, msg.payload, msg.qos, msg.retain)
+        self.history.add(source, received, msg.topic, msg.payload, msg.qos, msg.retain)
+        self.topic_stats.record(msg.topic, len(msg.payload), msg.qos, msg.retain)
+        self.topic_tree.insert(msg.topic, msg.payload)
+        if not self.console_filter.match(msg.topic):
+            return
+        self.window.post_message(MessageRow(source, received, msg.topic, msg.payload, msg.qos, msg.retain))
         return
 
     ################################################################
     def set_subscription(self, sub):
-        if self.client.is_connected():
-            self.client.unsubscribe(self.subscription)
-            try:
-                self.client.subscribe(sub)
-                self.subscription = sub
-                self.settings.setValue('mqtt_subscription', sub)
-            except ValueError:
-                self.window.write("Invalid subscription string, not changed.")
-                self.client.subscribe(self.subscription)
-        else:
-            self.subscription = sub
-            self.settings.setValue('mqtt_subscription', sub)
+        try:
+            WildcardTrie(sub.split())
+        except PatternError:
+            self.window.write("Invalid subscription string, not changed.")
+            return
+        self.subscription = sub
+        self.settings.setValue('mqtt_subscription', sub)
+        session = self.current_session()
+        if session is not None:
+            self.brokers.set_subscriptions(session.name, sub.split())
+            self.save_sessions()
+
+    def start_capture(self, path):
+        self.stop_capture()
+        try:
+            self.capture = capture.CaptureWriter(path)
+        except OSError as e:
+            self.window.write("Unable to start capture: %s" % e)
+            return
+        self.capture_path = path
+        self.settings.setValue('capture_path', path)
+        self.window.write("Capturing received messages to %s" % path)
+        self.window.set_capture_state(True)
+
+    def stop_capture(self):
+        writer, self.capture = self.capture, None
+        if writer is not None:
+            writer.close()
+            self.window.write("Captured %d messages to %s" % (writer.count, writer.path))
+            self.window.set_capture_state(False)
+
+    def set_console_filter(self, text):
+        try:
+            console_filter = TopicFilter.parse(text)
+        except PatternError as e:
+            self.window.write("Invalid console filter, not changed: %s" % e)
+            return
+        self.console_filter = console_filter
+        self.console_filter_text = text
+        self.settings.setValue('console_filter', text)
+        self.window.write("Console filter changed to: %s" % (text or "(none)"))
+
+    def set_overflow_policy(self, policy):
+        self.overflow_policy = policy
+        self.settings.setValue('console_overflow', policy)
+
+    def set_history_words(self, enabled):
+        self.history.tokens = enabled
+        self.settings.setValue('history_words', enabled)
+
+    def set_log_level(self, level):
+        self.log_level = level
+        self.settings.setValue('log_level', level)
+
+    def set_log_enabled(self, enabled):
+        self.log_enabled = enabled
+        self.settings.setValue('log_enabled', enabled)
+
+    def set_scrollback(self, lines):
+        self.scrollback = lines
+        self.settings.setValue('console_scrollback', lines)
 
     def set_topic(self, sub):
         self.topic = sub
         self.settings.setValue('mqtt_topic', sub)
 
+    def start_burst(self, settings):
+        session = self.current_session()
+        if session is None or session.state != 'connected':
+            self.window.write("Not connected.")
+            return False
+        if self.burst is not None and self.burst.running:
+            self.window.write("A burst is already running.")
+            return False
+        try:
+            publisher = burst.BurstPublisher(self.brokers, session.name, settings['topic'], settings['template'],
+                                             settings['count'], settings['rate'], settings['qos'], settings['window'])
+        except ValueError as e:
+            self.window.write("Invalid payload template: %s" % e)
+            return False
+        self.burst_settings = settings
+        self.settings.setValue('burst_settings', json.dumps(settings))
+        self.burst = publisher
+        self.window.write("Publishing %d messages on %s to %s." % (settings['count'], settings['topic'], session.name))
+        publisher.start()
+        return True
+
+    def stop_burst(self):
+        if self.burst is not None:
+            self.burst.stop()
+
     def send_message(self, topic, payload):
-        if self.client.is_connected():
-            self.client.publish(topic, payload)
+        session = self.current_session()
+        if session is not None and session.state == 'connected':
+            self.brokers.publish(session.name, topic, payload)
         else:
             self.window.write("Not connected.")
         self.payload = payload
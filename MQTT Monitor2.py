@@ -2,6 +2,9 @@
 from PyQt5 import QtCore, QtWidgets
 import paho.mqtt.client as mqtt
 
+import qtbridge
+import transport
+
 
 class MqttClient(QtCore.QObject):
     Disconnected = 0
@@ -33,14 +36,11 @@ class MqttClient(QtCore.QObject):
         self.m_protocolVersion = MqttClient.MQTT_3_1
 
         self.m_state = MqttClient.Disconnected
+        self.m_subscriptions = []
 
-        self.m_client =  mqtt.Client(clean_session=self.m_cleanSession,
-            protocol=self.protocolVersion)
-
-        self.m_client.on_connect = self.on_connect
-        self.m_client.on_message = self.on_message
-        self.m_client.on_disconnect = self.on_disconnect
-
+        # the network runs on the asyncio thread of the bridge; results come back through post()
+        self.m_bridge = qtbridge.QtBridge(QtCore, self)
+        self.m_client = None
 
     @QtCore.pyqtProperty(int, notify=stateChanged)
     def state(self):
@@ -107,37 +107,60 @@ class MqttClient(QtCore.QObject):
     @QtCore.pyqtSlot()
     def connectToHost(self):
         if self.m_hostname:
-            self.m_client.connect(self.m_hostname, 
-                port=self.port, 
-                keepalive=self.keepAlive)
+            if self.m_client is not None:
+                self.m_bridge.remove(self.m_client)
+            self.m_client = transport.AsyncClient(self.m_hostname,
+                port=self.port,
+                keepalive=self.keepAlive,
+                subscriptions=self.m_subscriptions,
+                clean_session=self.m_cleanSession,
+                protocol=self.protocolVersion,
+                on_batch=self.on_batch,
+                on_state=self.on_client_state)
 
             self.state = MqttClient.Connecting
-            self.m_client.loop_start()
+            self.m_bridge.start(self.m_client)
 
     @QtCore.pyqtSlot()
     def disconnectFromHost(self):
-        self.m_client.disconnect()
+        if self.m_client is not None:
+            self.m_bridge.call(self.m_client.disconnect)
 
     def subscribe(self, path):
-        if self.state == MqttClient.Connected:
-            self.m_client.subscribe(path)
-
-    #################################################################
-    # callbacks
-    def on_message(self, mqttc, obj, msg):
-        mstr = msg.payload.decode("ascii")
-        # print("on_message", mstr, obj, mqttc)
-        self.messageSignal.emit(mstr)
+        if path not in self.m_subscriptions:
+            self.m_subscriptions.append(path)
+        if self.m_client is not None:
+            self.m_bridge.call(self.m_client.subscribe, list(self.m_subscriptions))
 
-    def on_connect(self, *args):
-        # print("on_connect", args)
-        self.state = MqttClient.Connected
-        self.connected.emit()
+    def close(self):
+        self.m_bridge.close()
 
-    def on_disconnect(self, *args):
-        # print("on_disconnect", args)
-        self.state = MqttClient.Disconnected
-        self.disconnected.emit()
+    #################################################################
+    # callbacks, called on the asyncio thread
+    def on_batch(self, batch):
+        self.m_bridge.post(self.on_messages, batch)
+
+    def on_client_state(self, client):
+        self.m_bridge.post(self.on_state, client, client.state)
+
+    # and on the Qt thread
+    def on_messages(self, batch):
+        for msg in batch:
+            mstr = msg.payload.decode("ascii")
+            # print("on_message", mstr)
+            self.messageSignal.emit(mstr)
+
+    def on_state(self, client, state):
+        if client is not self.m_client:
+            return      # a client replaced by connectToHost
+        if state == 'connected':
+            self.state = MqttClient.Connected
+            self.connected.emit()
+        elif state == 'connecting':
+            self.state = MqttClient.Connecting
+        elif self.state != MqttClient.Disconnected:
+            self.state = MqttClient.Disconnected
+            self.disconnected.emit()
 
 
 class Widget(QtWidgets.QWidget):
@@ -161,6 +184,9 @@ class Widget(QtWidgets.QWidget):
             print(state)
             self.client.subscribe("shok2")
 
+    def closeEvent(self, event):
+        self.client.close()
+
     @QtCore.pyqtSlot(str)
     def on_messageSignal(self, msg):
         try:
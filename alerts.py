@@ -0,0 +1,123 @@
+"""Packet alerts delivered on a background thread.
+
+notify() is cheap and may be called from any thread.  The first packet
+from a device raises an alert; further packets from the same device within
+coalesce_window seconds are only counted.  Alerts are delivered by a worker
+thread at most max_rate times per second, with all devices that became due
+in the meantime merged into one call of the backend.
+"""
+import logging
+import sys
+import threading
+import time
+
+log = logging.getLogger('alerts')
+
+
+class NullBackend(object):
+    def alert(self, devices):
+        pass
+
+
+class LogBackend(object):
+    def alert(self, devices):
+        log.info("New packets from %s", ", ".join(devices))
+
+
+class BellBackend(object):
+    """Terminal bell, for consoles without a sound device API."""
+    def alert(self, devices):
+        sys.stdout.write('\a')
+        sys.stdout.flush()
+
+
+class WinsoundBackend(object):
+    def __init__(self, frequency=440, duration=500):
+        import winsound
+        self.winsound = winsound
+        self.frequency = frequency
+        self.duration = duration
+
+    def alert(self, devices):
+        self.winsound.Beep(self.frequency, self.duration)
+
+
+BACKENDS = {
+    'null': NullBackend,
+    'log': LogBackend,
+    'bell': BellBackend,
+    'winsound': WinsoundBackend,
+}
+
+
+def make_backend(name='auto'):
+    """Return a backend by name; 'auto' is winsound where available, else log."""
+    if name == 'auto':
+        try:
+            return WinsoundBackend()
+        except ImportError:
+            return LogBackend()
+    return BACKENDS[name]()
+
+
+class Alerter(object):
+    def __init__(self, backend, coalesce_window=5.0, max_rate=1.0):
+        self.backend = backend
+        self.coalesce_window = coalesce_window
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._cond = threading.Condition()
+        self._last_alert = {}
+        self._pending = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name='alerts', daemon=True)
+        self._thread.start()
+
+    def notify(self, device):
+        now = time.time()
+        with self._cond:
+            last = self._last_alert.get(device)
+            if last is not None and (now - last) < self.coalesce_window:
+                self.coalesced += 1
+                return
+            self._last_alert[device] = now
+            self._pending.append(device)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {'sent': self.sent, 'coalesced': self.coalesced,
+                    'failed': self.failed, 'pending': len(self._pending)}
+
+    def close(self, timeout=1.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _worker(self):
+        next_allowed = 0.0
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                delay = next_allowed - time.time()
+                if delay > 0:
+                    # rate limited: let more devices gather into this alert
+                    self._cond.wait(delay)
+                    continue
+                devices, self._pending = self._pending, []
+            next_allowed = time.time() + self.min_interval
+            try:
+                self.backend.alert(devices)
+            except Exception:
+                log.exception("Alert backend failed")
+                with self._cond:
+                    self.failed += 1
+                continue
+            with self._cond:
+                self.sent += 1
@@ -0,0 +1,49 @@
+"""Settings shared by App.py and headless.py.
+
+Edit the values here, or uncomment the input() lines to be asked at startup.
+"""
+
+offlineTime = 5
+freshDataTime = 30
+maxShowDataTime = 120
+localRecordsFilePath = "log.json"
+journalDir = "journal"
+journalSegmentBytes = 8 * 1024 * 1024
+journalFsyncInterval = 1.0
+journalRetentionBytes = 1024 * 1024 * 1024
+journalRetentionDays = 90
+# the history table also never holds more than this many packets
+maxShowRows = 100000
+# maximum number of times per second received packets are added to the table
+ingestFlushRate = 10
+# "auto" beeps through winsound on Windows and logs elsewhere; also "bell", "log", "null"
+alertBackend = "auto"
+# packets from the same device within this many seconds raise only one alert
+alertCoalesceTime = 5
+alertMaxRate = 1
+imageCacheDir = "image_cache"
+imageCacheMemoryBytes = 32 * 1024 * 1024
+thumbnailWidth = 150
+downloadWorkers = 4
+downloadsPerHost = 2
+downloadTimeout = 10
+# seconds before a photo which failed to load is asked for again, doubling up to the maximum
+photoRetryInitial = 5
+photoRetryMax = 300
+
+hostname = "test.mosquitto.org"
+username = ""
+portnum = 1883
+password = ""
+broker_topic = "HELLO-TOPIC-HM123"
+
+# hostname = input("HostName:")
+# portnum = input("Port:")
+# username = input("Username:")
+# password = input("Password:")
+
+# broker_topic = input("Topic:")
+# offlineTime = input("OfflineTime:")
+# freshDataTime = input("FreshDataTime:")
+# maxShowDataTime = input("MaxShowDataTime:")
+# localRecordsFilePath = input("JsonLogFile:")
@@ -0,0 +1,102 @@
+"""Benchmark the per-message cost of debug logging in the Monitor.
+
+For every simulated received message, a paho client logs its "Received
+PUBLISH" debug line through the 'mqtt' logger, as the network thread does,
+and the application logs one debug line of its own.  The overhead of each
+configuration over logging disabled is printed per message:
+
+  off         logger levels above DEBUG, no handler
+  console     root at DEBUG with a formatting StreamHandler feeding a locked
+              queue, as the Monitor console handler did
+  buffer      root at DEBUG with a logbuffer.LogBuffer, records kept unformatted
+  buffer/lean as buffer, after logbuffer.lean_records(), as the Monitor runs
+  buffer/INFO LogBuffer attached, levels at INFO so the debug calls are dropped
+
+usage: python bench_logging.py [-n MESSAGES]
+"""
+import argparse
+import collections
+import logging
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import logbuffer
+
+PUBLISH_FORMAT = "Received PUBLISH (d%d, q%d, r%d, m%d), '%s', ...  (%d bytes)"
+
+
+class QueueStream(object):
+    """Stands in for the console: each write is one locked queue append."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = collections.deque(maxlen=20000)
+
+    def write(self, text):
+        with self.lock:
+            self.items.append(text)
+
+    def flush(self):
+        pass
+
+
+def receive(client, app_log, topics, count):
+    for i in range(count):
+        topic = topics[i % len(topics)]
+        client._easy_log(mqtt.MQTT_LOG_DEBUG, PUBLISH_FORMAT, 0, 0, 0, 0, topic, 64)
+        app_log.debug("message on %s, %d bytes", topic, 64)
+
+
+def configure(mode):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    mqtt_log = logging.getLogger('mqtt')
+    level = logging.DEBUG
+    if mode == 'off':
+        level = logging.WARNING
+        root.addHandler(logging.NullHandler())
+    elif mode == 'console':
+        handler = logging.StreamHandler(QueueStream())
+        handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s: %(message)s'))
+        root.addHandler(handler)
+    elif mode in ('buffer', 'buffer/lean'):
+        if mode == 'buffer/lean':
+            logbuffer.lean_records()
+        root.addHandler(logbuffer.LogBuffer())
+    else:
+        level = logging.INFO
+        root.addHandler(logbuffer.LogBuffer())
+    root.setLevel(level)
+    mqtt_log.setLevel(level)
+
+
+def measure(mode, client, app_log, topics, count):
+    configure(mode)
+    start = time.perf_counter()
+    receive(client, app_log, topics, count)
+    return (time.perf_counter() - start) * 1e6 / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    client = mqtt.Client()
+    client.enable_logger(logging.getLogger('mqtt'))
+    app_log = logging.getLogger('main')
+    topics = ['user%d/sensor/temp' % i for i in range(100)]
+
+    baseline = measure('off', client, app_log, topics, args.messages)
+    print("%12s %12s %14s" % ('logging', 'us/msg', 'overhead us'))
+    print("%12s %12.2f %14s" % ('off', baseline, '-'))
+    for mode in ('console', 'buffer', 'buffer/lean', 'buffer/INFO'):
+        cost = measure(mode, client, app_log, topics, args.messages)
+        print("%12s %12.2f %14.2f" % (mode, cost, cost - baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark the decode time per device photo thumbnail.
+
+Compares the old App.py path, which decoded the full image into a QPixmap
+and then scaled it to 150 px, with App.decode_thumbnail(), which asks
+QImageReader for the target size so the JPEG is decoded at reduced scale.
+
+usage: python bench_thumbnails.py [-n REPEAT] [image files...]
+
+Without files a synthetic 4000x3000 JPEG is used.
+"""
+import argparse
+import sys
+import time
+
+from PyQt6.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt6.QtGui import QGuiApplication, QImage, QPixmap, QColor, QPainter, QLinearGradient
+
+from App import decode_thumbnail, thumbnailWidth
+
+
+def synthetic_jpeg(width=4000, height=3000):
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(30, 120, 200))
+    gradient.setColorAt(1, QColor(220, 180, 40))
+    painter.fillRect(image.rect(), gradient)
+    painter.end()
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, 'JPEG', 90)
+    return bytes(data)
+
+
+def full_decode(data):
+    pixmap = QPixmap()
+    pixmap.loadFromData(data)
+    return pixmap.scaledToWidth(thumbnailWidth)
+
+
+def scaled_decode(data):
+    return QPixmap.fromImage(decode_thumbnail(data))
+
+
+def measure(function, images, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in images:
+            function(data)
+    return (time.perf_counter() - start) * 1000.0 / (repeat * len(images))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--repeat', type=int, default=20)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    app = QGuiApplication(sys.argv)
+    if args.files:
+        images = [open(path, 'rb').read() for path in args.files]
+    else:
+        images = [synthetic_jpeg()]
+
+    for name, function in (('full decode + scaledToWidth', full_decode),
+                           ('QImageReader.setScaledSize', scaled_decode)):
+        function(images[0])  # warm up the image plugins
+        print("%-30s %8.2f ms/image" % (name, measure(function, images, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark the cost of matching a topic against a growing number of patterns.
+
+Compares testing each subscription pattern in turn with paho's
+topic_matches_sub(), as a per-pattern filter would, against one compiled
+topicmatch.TopicFilter.  The filter's per-topic cache is disabled so every
+match walks the trie.
+
+usage: python bench_topicmatch.py [-n TOPICS] [-p COUNT ...]
+"""
+import argparse
+import random
+import time
+
+from paho.mqtt.client import topic_matches_sub
+
+from topicmatch import TopicFilter
+
+
+def make_patterns(count, rng):
+    patterns = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            patterns.append('user%d/#' % i)
+        elif kind == 1:
+            patterns.append('user%d/+/temp' % i)
+        elif kind == 2:
+            patterns.append('+/sensor%d/+' % i)
+        else:
+            patterns.append('user%d/status/%d' % (i, rng.randrange(10)))
+    return patterns
+
+
+def make_topics(count, pattern_count, rng):
+    return ['user%d/sensor%d/%s' % (rng.randrange(pattern_count * 2), rng.randrange(pattern_count * 2),
+                                     rng.choice(('temp', 'humidity', 'status')))
+            for _ in range(count)]
+
+
+def per_pattern(patterns, topics):
+    matched = 0
+    for topic in topics:
+        for pattern in patterns:
+            if topic_matches_sub(pattern, topic):
+                matched += 1
+                break
+    return matched
+
+
+def compiled(patterns, topics):
+    topic_filter = TopicFilter(patterns, cache_size=0)
+    matched = 0
+    for topic in topics:
+        if topic_filter._match(topic):
+            matched += 1
+    return matched
+
+
+def measure(function, patterns, topics):
+    start = time.perf_counter()
+    matched = function(patterns, topics)
+    return (time.perf_counter() - start) * 1e6 / len(topics), matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--topics', type=int, default=20000)
+    parser.add_argument('-p', '--patterns', type=int, nargs='+', default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    print("%8s %20s %20s" % ('patterns', 'per pattern us/msg', 'compiled us/msg'))
+    for count in args.patterns:
+        patterns = make_patterns(count, rng)
+        topics = make_topics(args.topics, count, rng)
+        slow, slow_matched = measure(per_pattern, patterns, topics)
+        fast, fast_matched = measure(compiled, patterns, topics)
+        assert slow_matched == fast_matched, (slow_matched, fast_matched)
+        print("%8d %20.2f %20.2f" % (count, slow, fast))
+
+
+if __name__ == '__main__':
+    main()
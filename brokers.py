@@ -0,0 +1,181 @@
+"""Several MQTT broker sessions driven by one network thread.
+
+Each BrokerSession has its own server, credentials and subscriptions, and a
+transport.AsyncClient, all run by the asyncio loop of one transport
+LoopThread.  That loop waits on the sockets of every session, reads all the
+packets a socket has ready at each wakeup, and reconnects a session which
+loses its connection with exponential backoff and jitter until it is
+disconnected explicitly.
+
+Every client call happens on the loop; the public methods only queue a call
+and wake it, so they may be used from any thread.  Received messages are
+passed to on_message(session_name, msg), a batch at a time, so the sessions
+feed one stream tagged by source, state changes to on_state(session), and
+the loss of an established connection to on_lost(session_name), all on the
+loop thread.
+"""
+import collections
+import functools
+import threading
+
+import paho.mqtt.client as mqtt
+
+import transport
+
+
+class BrokerSession(object):
+    """Settings and state of one broker connection."""
+
+    def __init__(self, name, host, port, username='', password='', subscriptions=('#',),
+                 tls=False, keepalive=60):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.subscriptions = list(subscriptions)
+        self.tls = tls
+        self.keepalive = keepalive
+        self.state = 'disconnected'     # 'connecting', 'connected', 'waiting' to retry, or 'disconnected'
+        self.error = ''
+        self.received = 0
+        self.client = None
+
+    def settings(self):
+        return {'name': self.name, 'host': self.host, 'port': self.port,
+                'username': self.username, 'password': self.password,
+                'subscriptions': self.subscriptions, 'tls': self.tls}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings['name'], settings['host'], int(settings['port']),
+                   settings.get('username', ''), settings.get('password', ''),
+                   settings.get('subscriptions', ['#']), bool(settings.get('tls', False)))
+
+
+class ConnectionManager(object):
+    def __init__(self, on_message, on_state=None, on_publish=None, on_lost=None,
+                 retry_initial=1.0, retry_max=60.0, logger=None):
+        self.on_message = on_message
+        self.on_state = on_state
+        self.on_publish = on_publish
+        self.on_lost = on_lost
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.logger = logger
+        self.sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._transport = transport.LoopThread('brokers')
+
+    # --- public interface, safe from any thread -----------------------------------------------
+    def call_soon(self, function, *args):
+        self._transport.call(function, *args)
+
+    def session_list(self):
+        with self._lock:
+            return list(self.sessions.values())
+
+    def get(self, name):
+        with self._lock:
+            return self.sessions.get(name)
+
+    def add(self, session):
+        """Add a session, replacing and disconnecting any other of the same name."""
+        with self._lock:
+            old = self.sessions.get(session.name)
+            self.sessions[session.name] = session
+        if old is not None and old is not session:
+            self.call_soon(self._disconnect, old)
+
+    def remove(self, name):
+        with self._lock:
+            session = self.sessions.pop(name, None)
+        if session is not None:
+            self.call_soon(self._disconnect, session)
+
+    def connect(self, name):
+        self.call_soon(self._connect, name)
+
+    def disconnect(self, name):
+        session = self.get(name)
+        if session is not None:
+            self.call_soon(self._disconnect, session)
+
+    def set_subscriptions(self, name, subscriptions):
+        session = self.get(name)
+        if session is not None:
+            session.subscriptions = list(subscriptions)
+            self.call_soon(self._resubscribe, session)
+
+    def publish(self, name, topic, payload, qos=0, retain=False, callback=None):
+        """Publish on a session; callback(info), if given, receives the MQTTMessageInfo."""
+        self.call_soon(self._publish, name, topic, payload, qos, retain, callback)
+
+    def connected_count(self):
+        return sum(1 for session in self.session_list() if session.state == 'connected')
+
+    def close(self, timeout=2.0):
+        try:
+            self._transport.run(self._close(timeout), timeout + 1.0)
+        except Exception:
+            pass    # a server which cannot be told goodbye must not hold up the exit
+        self._transport.stop(timeout)
+
+    # --- loop thread -------------------------------------------------------------------------
+    def _connect(self, name):
+        session = self.get(name)
+        if session is None:
+            return
+        if session.client is None:
+            session.client = transport.AsyncClient(
+                session.host, session.port, session.username, session.password, session.subscriptions,
+                session.tls, keepalive=session.keepalive, name=session.name,
+                on_batch=functools.partial(self._on_batch, session),
+                on_state=functools.partial(self._on_client_state, session),
+                on_publish=functools.partial(self._on_publish, session),
+                retry_initial=self.retry_initial, retry_max=self.retry_max, logger=self.logger)
+        session.client.start()
+
+    def _disconnect(self, session):
+        if session.client is not None:
+            session.client.disconnect()
+
+    def _resubscribe(self, session):
+        if session.client is not None:
+            session.client.subscribe(session.subscriptions)
+
+    def _publish(self, name, topic, payload, qos, retain, callback):
+        session = self.get(name)
+        if session is None or session.client is None:
+            info = mqtt.MQTTMessageInfo(0)
+            info.rc = mqtt.MQTT_ERR_NO_CONN
+        else:
+            info = session.client.publish_nowait(topic, payload, qos, retain)
+        if callback is not None:
+            callback(info)
+
+    async def _close(self, timeout):
+        for session in self.session_list():
+            if session.client is not None:
+                await session.client.close(timeout)
+
+    # --- client callbacks, called on the loop thread -------------------------------------------
+    def _on_client_state(self, session, client):
+        lost = session.state == 'connected' and client.state != 'connected'
+        session.state = client.state
+        session.error = client.error
+        if self.on_state is not None:
+            self.on_state(session)
+        if lost and self.on_lost is not None:
+            self.on_lost(session.name)
+
+    def _on_batch(self, session, batch):
+        session.received += len(batch)
+        on_message = self.on_message
+        name = session.name
+        for msg in batch:
+            on_message(name, msg)
+
+    def _on_publish(self, session, mid):
+        if self.on_publish is not None:
+            self.on_publish(session.name, mid)
@@ -0,0 +1,156 @@
+"""Burst publishing through a brokers.ConnectionManager session, for stress tests.
+
+A BurstPublisher sends count messages on its own thread, paced to a target
+rate or as fast as possible.  At most window messages may be waiting for
+on_publish at once: at QoS 1 and 2 that is the broker's acknowledgement,
+at QoS 0 the write to the socket.  The time from each publish request to
+its on_publish is kept for the latency percentiles shown while it runs.
+QoS 0 messages still waiting when the connection drops are lost with it and
+never reach on_publish; connection_lost() counts them as failed.
+
+Payloads are string.Template text expanded per message with $seq (from 0),
+$count, $time (Unix time as a float), and $iso (ISO 8601 time).
+"""
+import collections
+import string
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+TEMPLATE_FIELDS = ('seq', 'count', 'time', 'iso')
+
+# latencies kept for the percentiles
+LATENCY_SAMPLES = 10000
+
+
+def compile_template(text):
+    """Return a function of (seq, count) giving the payload bytes; raises ValueError for bad fields."""
+    template = string.Template(text)
+    fields = dict((name, '') for name in TEMPLATE_FIELDS)
+    try:
+        template.substitute(fields)
+    except KeyError as e:
+        raise ValueError("unknown template field $%s, use %s" % (e.args[0], ", ".join('$' + f for f in TEMPLATE_FIELDS)))
+    if '$' not in text:
+        payload = text.encode('utf-8')
+        return lambda seq, count: payload
+
+    def render(seq, count):
+        now = time.time()
+        iso = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)) + '.%06dZ' % int(now % 1 * 1e6)
+        return template.substitute(seq=seq, count=count, time='%.6f' % now, iso=iso).encode('utf-8')
+    return render
+
+
+def percentiles(samples, fractions=(0.5, 0.9, 0.99)):
+    if not samples:
+        return [None] * len(fractions) + [None]
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return [ordered[min(last, int(fraction * len(ordered)))] for fraction in fractions] + [ordered[-1]]
+
+
+class BurstPublisher(object):
+    def __init__(self, manager, session, topic, template, count, rate=None, qos=1, window=100, retain=False):
+        self.manager = manager
+        self.session = session
+        self.topic = topic
+        self.render = compile_template(template)
+        self.count = count
+        self.rate = rate or None
+        self.qos = qos
+        self.window = window
+        self.retain = retain
+        self.sent = 0
+        self.acked = 0
+        self.failed = 0
+        self.started = None
+        self.finished = None
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(window)
+        self._pending = {}       # mid -> time the publish was requested
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='burst', daemon=True)
+
+    def start(self):
+        self.started = time.monotonic()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    @property
+    def running(self):
+        return self.started is not None and self.finished is None
+
+    def _run(self):
+        start = self.started
+        requested = 0
+        for seq in range(self.count):
+            while not self._slots.acquire(timeout=0.1):
+                if self._stopped.is_set():
+                    break
+            if self._stopped.is_set():
+                break
+            if self.rate is not None:
+                delay = start + seq / self.rate - time.monotonic()
+                if delay > 0 and self._stopped.wait(delay):
+                    break
+            now = time.monotonic()
+            self.manager.publish(self.session, self.topic, self.render(seq, self.count), self.qos, self.retain,
+                                 callback=lambda info, now=now: self._published(info, now))
+            requested += 1
+        # wait until every request has been answered by the manager and acknowledged
+        while not self._stopped.is_set():
+            with self._lock:
+                if self.sent + self.failed >= requested and self.acked >= self.sent:
+                    break
+            self._stopped.wait(0.05)
+        self.finished = time.monotonic()
+
+    def _published(self, info, requested):
+        # manager thread, straight after the publish call
+        with self._lock:
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.sent += 1
+                self._pending[info.mid] = requested
+                return
+            self.failed += 1
+        self._slots.release()
+
+    def connection_lost(self):
+        # manager thread; paho resends QoS 1 and 2 messages after the reconnect
+        if self.qos != 0:
+            return
+        with self._lock:
+            lost = len(self._pending)
+            self._pending.clear()
+            self.sent -= lost
+            self.failed += lost
+        for _ in range(lost):
+            self._slots.release()
+
+    def on_publish(self, mid):
+        # manager thread
+        now = time.monotonic()
+        with self._lock:
+            requested = self._pending.pop(mid, None)
+            if requested is None:
+                return
+            self.acked += 1
+            self.latencies.append(now - requested)
+        self._slots.release()
+
+    def stats(self):
+        """Return a dict of counts, the achieved rate, and latency percentiles in seconds."""
+        with self._lock:
+            latencies = list(self.latencies)
+            sent, acked, failed = self.sent, self.acked, self.failed
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started is not None else 0.0
+        p50, p90, p99, worst = percentiles(latencies)
+        return {'sent': sent, 'acked': acked, 'failed': failed, 'count': self.count,
+                'inflight': sent - acked, 'rate': acked / elapsed if elapsed > 0 else 0.0,
+                'p50': p50, 'p90': p90, 'p99': p99, 'max': worst, 'running': self.running}
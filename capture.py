@@ -0,0 +1,184 @@
+"""Compact binary recording of MQTT traffic.
+
+A capture file starts with the 8 byte MAGIC and is followed by records,
+each a little-endian uint32 length and then that many bytes:
+
+    kind 1, topic:    <B kind><I topic id><topic, UTF-8>
+    kind 2, message:  <B kind><d receive time><I topic id><B flags><payload>
+
+Topics are interned: the first message on a topic is preceded by a topic
+record assigning it the next id, and later messages only carry the id.
+The flags byte holds the QoS in bits 0-1 and the retain flag in bit 2.
+Records are only appended, so a capture cut short by a crash is read up to
+its last complete record.
+
+CaptureReader memory-maps the file and yields payloads as memoryview slices
+of the map, so scanning a multi-GB capture copies no payload bytes.
+
+usage: python capture.py FILE...    prints a summary of each capture
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b'MQCAP\x00\x01\x00'
+
+TOPIC = 1
+MESSAGE = 2
+
+LENGTH = struct.Struct('<I')
+TOPIC_HEADER = struct.Struct('<BI')
+MESSAGE_HEADER = struct.Struct('<BdIB')
+
+QOS_MASK = 0x03
+RETAIN_FLAG = 0x04
+
+
+class CaptureError(ValueError):
+    pass
+
+
+class CaptureWriter(object):
+    """Appends messages to a capture file; write() may be called from any thread.
+
+    Once close() has run, further writes are ignored, so a thread still
+    holding the writer when another closes it does not fail.
+    """
+
+    def __init__(self, path, buffer_size=1 << 20):
+        self.path = path
+        self.count = 0
+        self.bytes = 0
+        self.topics = {}
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(MAGIC)
+
+    def write(self, timestamp, topic, payload, qos=0, retain=False):
+        flags = (qos & QOS_MASK) | (RETAIN_FLAG if retain else 0)
+        with self._lock:
+            if self._file.closed:
+                return
+            topic_id = self.topics.get(topic)
+            if topic_id is None:
+                topic_id = self.topics[topic] = len(self.topics)
+                name = topic.encode('utf-8')
+                self._file.write(LENGTH.pack(TOPIC_HEADER.size + len(name)))
+                self._file.write(TOPIC_HEADER.pack(TOPIC, topic_id))
+                self._file.write(name)
+            self._file.write(LENGTH.pack(MESSAGE_HEADER.size + len(payload)))
+            self._file.write(MESSAGE_HEADER.pack(MESSAGE, timestamp, topic_id, flags))
+            self._file.write(payload)
+            self.count += 1
+            self.bytes += len(payload)
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureReader(object):
+    """Memory-mapped, zero-copy reader of a capture file.
+
+    Iterating yields (timestamp, topic, qos, retain, payload) tuples where
+    payload is a memoryview into the map.  The views are only valid until
+    close(); convert them with bytes() to keep them longer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.topics = []
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC):
+            self._map = None
+            self._view = memoryview(b'')
+        else:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+        if size and self._view[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise CaptureError("%s is not a capture file" % path)
+
+    def __iter__(self):
+        view = self._view
+        end = len(view)
+        offset = len(MAGIC)
+        topics = self.topics
+        unpack_length = LENGTH.unpack_from
+        unpack_message = MESSAGE_HEADER.unpack_from
+        header_size = MESSAGE_HEADER.size
+        while offset + LENGTH.size <= end:
+            length, = unpack_length(view, offset)
+            start = offset + LENGTH.size
+            offset = start + length
+            if offset > end:
+                break   # truncated final record
+            if view[start] == MESSAGE:
+                kind, timestamp, topic_id, flags = unpack_message(view, start)
+                yield (timestamp, topics[topic_id], flags & QOS_MASK, bool(flags & RETAIN_FLAG),
+                       view[start + header_size:offset])
+            elif view[start] == TOPIC:
+                kind, topic_id = TOPIC_HEADER.unpack_from(view, start)
+                name = str(view[start + TOPIC_HEADER.size:offset], 'utf-8')
+                if topic_id == len(topics):
+                    topics.append(name)
+                elif topic_id < len(topics):
+                    topics[topic_id] = name
+                else:
+                    raise CaptureError("topic id %d out of order at offset %d" % (topic_id, start))
+            else:
+                raise CaptureError("unknown record kind %d at offset %d" % (view[start], start))
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def summarize(path):
+    start = time.perf_counter()
+    count = 0
+    nbytes = 0
+    first = last = None
+    with CaptureReader(path) as reader:
+        for timestamp, topic, qos, retain, payload in reader:
+            count += 1
+            nbytes += len(payload)
+            if first is None:
+                first = timestamp
+            last = timestamp
+            del payload
+        topics = len(reader.topics)
+    elapsed = time.perf_counter() - start
+    duration = (last - first) if count else 0.0
+    print("%s: %d messages on %d topics, %d payload bytes over %.1f s; scanned in %.3f s (%.0f messages/s)"
+          % (path, count, topics, nbytes, duration, elapsed, count / elapsed if elapsed else 0.0))
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        summarize(path)
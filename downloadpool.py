@@ -0,0 +1,239 @@
+"""Fixed-size pool of download threads sharing kept-alive HTTP connections.
+
+Jobs wait in one priority queue (lower numbers first) and are handed to a
+fixed number of worker threads, never more than per_host at a time for the
+same host.  Each worker keeps its own small set of open connections, so the
+number of threads and sockets stays bounded however many URLs are queued.
+"""
+import collections
+import heapq
+import http.client
+import itertools
+import threading
+import urllib.parse
+
+PRIORITY_VISIBLE = 0
+PRIORITY_BACKGROUND = 10
+
+MAX_REDIRECTS = 5
+
+
+class _Job(object):
+    __slots__ = ('url', 'host', 'priority', 'timeout', 'handler', 'callback')
+
+    def __init__(self, url, priority, timeout, handler, callback):
+        self.url = url
+        self.host = urllib.parse.urlsplit(url).netloc
+        self.priority = priority
+        self.timeout = timeout
+        self.handler = handler
+        self.callback = callback
+
+
+class DownloadPool(object):
+    """Run download jobs on a fixed set of threads.
+
+    submit() queues a URL; a worker calls handler(url) (by default fetch())
+    and then callback(url, result, error) on the worker thread.  A URL that
+    is already queued is not queued twice; submitting it again only raises
+    its priority.
+    """
+
+    def __init__(self, workers=4, per_host=2, timeout=10.0, max_idle=8):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.completed = 0
+        self.failed = 0
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._active = collections.Counter()
+        self._blocked = collections.defaultdict(list)
+        self._shutdown = False
+        self._local = threading.local()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name='download-%d' % i, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, url, callback, priority=PRIORITY_BACKGROUND, timeout=None, handler=None):
+        """Queue url; returns False if it was already queued."""
+        with self._cond:
+            if self._shutdown:
+                return False
+            job = self._jobs.get(url)
+            if job is not None:
+                self._promote(job, priority)
+                return False
+            job = _Job(url, priority, timeout or self.timeout, handler, callback)
+            self._jobs[url] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._cond.notify()
+            return True
+
+    def promote(self, url, priority=PRIORITY_VISIBLE):
+        """Raise the priority of a queued url; returns False if it is not queued."""
+        with self._cond:
+            job = self._jobs.get(url)
+            if job is None:
+                return False
+            self._promote(job, priority)
+            return True
+
+    def _promote(self, job, priority):
+        # The old heap entry is left behind and skipped once its priority
+        # no longer matches the job.
+        if priority < job.priority:
+            job.priority = priority
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._jobs)
+
+    def active(self):
+        with self._cond:
+            return sum(self._active.values())
+
+    def shutdown(self, wait=True, timeout=2.0):
+        with self._cond:
+            self._shutdown = True
+            self._heap = []
+            self._jobs.clear()
+            self._blocked.clear()
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join(timeout)
+
+    # --- worker side ----------------------------------------------------------
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._shutdown:
+                    return None
+                while self._heap:
+                    priority, _, job = heapq.heappop(self._heap)
+                    if self._jobs.get(job.url) is not job or priority != job.priority:
+                        continue
+                    if self._active[job.host] >= self.per_host:
+                        self._blocked[job.host].append((priority, next(self._seq), job))
+                        continue
+                    self._active[job.host] += 1
+                    return job
+                self._cond.wait()
+
+    def _finish_job(self, job, failed):
+        with self._cond:
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self._jobs.pop(job.url, None)
+            self._active[job.host] -= 1
+            if self._active[job.host] <= 0:
+                del self._active[job.host]
+            for entry in self._blocked.pop(job.host, ()):
+                heapq.heappush(self._heap, entry)
+            self._cond.notify_all()
+
+    def _worker(self):
+        self._local.connections = collections.OrderedDict()
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                self._local.timeout = job.timeout
+                result = error = None
+                try:
+                    if job.handler is not None:
+                        result = job.handler(job.url)
+                    else:
+                        result = self.fetch(job.url)
+                except Exception as e:
+                    error = e
+                self._finish_job(job, error is not None)
+                job.callback(job.url, result, error)
+        finally:
+            for conn in self._local.connections.values():
+                conn.close()
+
+    # --- HTTP ---------------------------------------------------------------------
+    def _connection(self, scheme, netloc):
+        connections = self._local.connections
+        key = (scheme, netloc)
+        conn = connections.get(key)
+        timeout = getattr(self._local, 'timeout', self.timeout)
+        if conn is None:
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(netloc, timeout=timeout)
+            elif scheme == 'http':
+                conn = http.client.HTTPConnection(netloc, timeout=timeout)
+            else:
+                raise ValueError("unsupported URL scheme: %r" % scheme)
+            connections[key] = conn
+            while len(connections) > self.max_idle:
+                connections.popitem(last=False)[1].close()
+        else:
+            connections.move_to_end(key)
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+        return conn
+
+    def _drop_connection(self, scheme, netloc):
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def fetch(self, url, etag=None):
+        """GET url on this thread's kept-alive connection.
+
+        Returns (status, body, etag); a 304 reply to If-None-Match has no
+        body.  Must be called on a pool worker thread.
+        """
+        headers = {'Connection': 'keep-alive'}
+        if etag:
+            headers['If-None-Match'] = etag
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            status, reason, response_headers, body = self._request(parts.scheme, parts.netloc, path, headers)
+            if status in (301, 302, 303, 307, 308) and response_headers.get('Location'):
+                url = urllib.parse.urljoin(url, response_headers['Location'])
+                continue
+            if status == 304:
+                return status, None, etag
+            if status >= 400:
+                raise OSError("HTTP %d %s: %s" % (status, reason, url))
+            return status, body, response_headers.get('ETag')
+        raise OSError("too many redirects: %s" % url)
+
+    def _request(self, scheme, netloc, path, headers):
+        # A kept-alive connection may have been closed by the server while
+        # idle, so a failure on a reused connection is retried once.
+        for attempt in (0, 1):
+            conn = self._connection(scheme, netloc)
+            reused = conn.sock is not None
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                self._drop_connection(scheme, netloc)
+                if reused and attempt == 0:
+                    continue
+                raise OSError(str(e)) from e
+            except OSError:
+                self._drop_connection(scheme, netloc)
+                raise
+            if response.will_close:
+                self._drop_connection(scheme, netloc)
+            return response.status, response.reason, response.headers, body
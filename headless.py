@@ -0,0 +1,186 @@
+"""Run the App.py ingest pipeline without a GUI.
+
+Subscribes to the configured broker topic through a transport.AsyncClient,
+which hands the messages over a batch at a time, and runs the same parse,
+journal, alert, and device registry stages as App.py, but never imports Qt.
+Every report interval a status line is printed to stdout, as text or as one JSON
+object per line with --json, with throughput, queue latency, and devices
+that changed state.
+
+With --bench COUNT no broker is used: COUNT copies of msg.json are fed
+through the pipeline as fast as possible to measure the data path alone,
+journaling them to a temporary directory which is removed afterwards.
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+
+import paho.mqtt.client as mqtt
+
+import alerts
+import appconfig
+import packets
+import pipeline
+import transport
+from registry import DeviceRegistry
+
+
+class Headless(object):
+    def __init__(self, alert_backend, journal_dir=None):
+        self.ingest = packets.IngestBuffer()
+        self.registry = DeviceRegistry(appconfig.offlineTime)
+        self.journal = pipeline.open_journal(journal_dir)
+        self.alerter = alerts.Alerter(alerts.make_backend(alert_backend),
+                                      appconfig.alertCoalesceTime, appconfig.alertMaxRate)
+        self.pipeline = pipeline.Pipeline(self.journal, self.alerter, self.ingest.put)
+        self.connected = False
+        self.came_online = []
+        self.went_offline = []
+        self._last_report = (time.time(), 0, 0)
+
+        for packet in pipeline.replay_window(self.journal, time.time() - appconfig.maxShowDataTime):
+            self.registry.upsert(packet)
+
+    def on_state(self, client):
+        self.connected = (client.state == 'connected')
+
+    def process(self):
+        """Move buffered packets into the registry and expire silent devices."""
+        for packet in self.ingest.drain():
+            device, is_new, came_online = self.registry.upsert(packet)
+            if came_online:
+                self.came_online.append(device.name)
+        self.went_offline.extend(device.name for device in self.registry.expire())
+        self.journal.tick()
+
+    def report(self):
+        now = time.time()
+        received, rejected, nbytes = self.pipeline.stats()
+        last_time, last_received, last_bytes = self._last_report
+        elapsed = max(now - last_time, 1e-9)
+        depth, batch, latency = self.ingest.take_stats()
+        status = {
+            'time': round(now, 3),
+            'connected': self.connected,
+            'received': received,
+            'rejected': rejected,
+            'rate': round((received - last_received) / elapsed, 1),
+            'bytes_per_sec': round((nbytes - last_bytes) / elapsed, 1),
+            'queue_depth': depth,
+            'latency_ms': round(latency * 1000.0, 1),
+            'journal_written': self.journal.written,
+            'devices': len(self.registry),
+            'online': self.registry.online_count,
+            'came_online': self.came_online,
+            'went_offline': self.went_offline,
+        }
+        self._last_report = (now, received, nbytes)
+        self.came_online, self.went_offline = [], []
+        return status
+
+    def close(self):
+        self.process()
+        self.journal.close()
+        self.alerter.close()
+
+
+def print_status(status, as_json):
+    if as_json:
+        print(json.dumps(status))
+    else:
+        line = "%(received)d received (%(rate).1f/s), %(rejected)d rejected, queue %(queue_depth)d, " \
+               "latency %(latency_ms).1f ms, %(online)d/%(devices)d devices online" % status
+        if not status['connected']:
+            line += ", not connected"
+        if status['came_online']:
+            line += ", online: " + " ".join(status['came_online'])
+        if status['went_offline']:
+            line += ", offline: " + " ".join(status['went_offline'])
+        print(line)
+    sys.stdout.flush()
+
+
+def run_bench(app, count, devices, as_json):
+    with open('msg.json', 'rb') as f:
+        template = json.loads(f.read())
+    messages = []
+    for i in range(min(count, devices)):
+        template['device'] = 'DEV%d' % i
+        msg = mqtt.MQTTMessage(topic=appconfig.broker_topic.encode('utf-8'))
+        msg.payload = json.dumps(template, separators=(',', ':')).encode('utf-8')
+        messages.append(msg)
+    start = time.perf_counter()
+    for i in range(0, count, 1000):
+        app.pipeline.on_batch([messages[j % len(messages)] for j in range(i, min(count, i + 1000))])
+        app.process()
+    app.process()
+    app.journal.flush()
+    elapsed = time.perf_counter() - start
+    status = app.report()
+    status['bench_seconds'] = round(elapsed, 3)
+    status['bench_rate'] = round(count / elapsed, 1)
+    if as_json:
+        print_status(status, True)
+    else:
+        print("%d messages in %.3f s: %.0f messages/s through parse, journal, alerts and registry"
+              % (count, elapsed, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the App.py ingest pipeline without a GUI.")
+    parser.add_argument('--host', default=appconfig.hostname)
+    parser.add_argument('--port', type=int, default=appconfig.portnum)
+    parser.add_argument('--topic', default=appconfig.broker_topic)
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between status reports")
+    parser.add_argument('--json', action='store_true', help="print status as JSON lines")
+    parser.add_argument('--alerts', default='log', choices=['auto'] + sorted(alerts.BACKENDS))
+    parser.add_argument('--bench', type=int, metavar='COUNT', help="feed COUNT local messages instead of connecting")
+    parser.add_argument('--devices', type=int, default=10, help="number of device names used by --bench")
+    args = parser.parse_args()
+
+    # alerts from the log backend are INFO records; they go to stderr, apart from the status lines
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(name)s: %(message)s')
+    appconfig.broker_topic = args.topic
+
+    if args.bench:
+        # the synthetic packets go to a scratch journal, never the one App.py replays
+        with tempfile.TemporaryDirectory(prefix='headless-bench-') as journal_dir:
+            app = Headless(args.alerts, journal_dir)
+            try:
+                run_bench(app, args.bench, args.devices, args.json)
+            finally:
+                app.close()
+        return
+
+    app = Headless(args.alerts)
+
+    loop_thread = transport.LoopThread('headless')
+    client = transport.AsyncClient(args.host, args.port, appconfig.username, appconfig.password,
+                                   [appconfig.broker_topic], on_batch=app.pipeline.on_batch,
+                                   on_state=app.on_state)
+    loop_thread.call(client.start)
+
+    next_report = time.time() + args.interval
+    try:
+        while True:
+            time.sleep(1.0 / appconfig.ingestFlushRate)
+            app.process()
+            if time.time() >= next_report:
+                next_report += args.interval
+                print_status(app.report(), args.json)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            loop_thread.run(client.close(), 3.0)
+        except Exception:
+            pass
+        loop_thread.stop()
+        app.close()
+
+
+if __name__ == "__main__":
+    main()
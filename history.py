@@ -0,0 +1,478 @@
+"""Indexed store of received messages for the Monitor history search.
+
+Messages are numbered in arrival order and kept column-wise in segments of
+up to SEGMENT_MESSAGES: arrays of receive times, topic and server numbers
+and flags, plus every payload appended to one bytearray with an offset
+array.  Three indexes point into them:
+
+  topics  topic number -> sorted array of message numbers (posting list)
+  time    the time arrays themselves, which are kept non-decreasing so
+          a time maps to a message number by bisection
+  words   lowercase word -> posting list, for payloads of UTF-8 text up to
+          TOKEN_BYTES; all words are also listed in one newline-separated
+          vocabulary so substrings of words are found with bytes.find(),
+          and longer text payloads are listed as unindexed
+
+add() only queues the message, so the network thread never waits on the
+index; absorb() files the queued messages and is called from a timer and
+before every search.  At most max_pending messages wait in the queue: while
+it is full, new messages are not kept and are counted in dropped.  When more than capacity messages or max_bytes of
+payload are held, the oldest segment is dropped whole.
+
+A query is a list of terms which must all hold:
+
+  topic:PATTERN   MQTT subscription pattern, may be given more than once
+  server:NAME     messages received from this server session
+  after:TIME      received at or after TIME, also since:
+  before:TIME     received at or before TIME, also until:
+  WORD            text payload contains WORD, ignoring ASCII case; quote
+                  to include spaces.  Binary payloads never match words.
+
+TIME is HH:MM[:SS] today, an ISO 8601 date and time, Unix seconds, or an
+age such as 90s, 15m, 2h or 1d.  The search estimates how many messages
+each index would yield for the given time range, starts from the smallest,
+intersects it with the posting lists of comparable size, and checks the
+remaining terms only on the messages left.  A word made only of word
+characters is answered from the word index, plus a search of the unindexed
+payloads; a phrase uses the words within it to find the messages to check,
+and only text without any word characters needs a scan of all payload
+bytes in the time range.
+"""
+import array
+import bisect
+import collections
+import datetime
+import itertools
+import re
+import shlex
+import threading
+import time
+
+from topicmatch import WildcardTrie
+
+# messages per storage segment; whole segments are dropped when full
+SEGMENT_MESSAGES = 65536
+
+# flag bits beside the QoS
+RETAIN = 4
+BINARY = 8
+
+# a posting list up to this many times longer than the starting one is
+# intersected with it rather than checked message by message
+INTERSECT_RATIO = 4
+
+# relative cost of checking one message found through a phrase's words, as
+# against scanning one payload
+CHECK_COST = 3
+
+DEFAULT_CAPACITY = 1000000
+DEFAULT_MAX_BYTES = 256 << 20
+# messages which may wait for absorb() before new ones are dropped
+DEFAULT_MAX_PENDING = 200000
+
+# longest payload whose words are indexed
+TOKEN_BYTES = 4096
+
+_TOKEN = re.compile(rb'[0-9a-z_\x80-\xff]+')
+_WORD_TERM = re.compile(rb'[0-9a-z_\x80-\xff]+\Z')
+_AGE = re.compile(r'(\d+(?:\.\d*)?)([smhd])\Z')
+_CLOCK = re.compile(r'(\d{1,2}):(\d{2})(?::(\d{2}(?:\.\d*)?))?\Z')
+_AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+QUERY_KEYS = {'topic': 'topics', 'server': 'sources',
+              'after': 'since', 'since': 'since', 'before': 'until', 'until': 'until'}
+
+
+class QueryError(ValueError):
+    pass
+
+
+HistoryRecord = collections.namedtuple('HistoryRecord', 'id source received topic payload qos retain')
+
+SearchResult = collections.namedtuple('SearchResult', 'ids total elapsed plan')
+
+
+def parse_time(text, now=None):
+    """Return the Unix time for a query time value."""
+    now = time.time() if now is None else now
+    match = _AGE.match(text)
+    if match:
+        return now - float(match.group(1)) * _AGE_UNITS[match.group(2)]
+    match = _CLOCK.match(text)
+    if match:
+        day = datetime.datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        hours, minutes, seconds = int(match.group(1)), int(match.group(2)), float(match.group(3) or 0)
+        if hours > 23 or minutes > 59 or seconds >= 60:
+            raise QueryError("invalid time of day %r" % text)
+        return day.timestamp() + hours * 3600 + minutes * 60 + seconds
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise QueryError("invalid time %r, use HH:MM[:SS], an ISO date, Unix seconds, or an age like 15m" % text)
+
+
+def parse_query(text, now=None):
+    """Split a search into a dict of topics, sources, since, until and words."""
+    try:
+        parts = shlex.split(text)
+    except ValueError as e:
+        raise QueryError(str(e))
+    query = {'topics': [], 'sources': [], 'since': None, 'until': None, 'words': []}
+    for part in parts:
+        key, sep, value = part.partition(':')
+        field = QUERY_KEYS.get(key.lower()) if sep else None
+        if field is None:
+            query['words'].append(part.encode('utf-8').lower())
+        elif not value:
+            raise QueryError("no value after %s:" % key)
+        elif field in ('since', 'until'):
+            query[field] = parse_time(value, now)
+        else:
+            query[field].append(value)
+    return query
+
+
+def _count(lists, lo, hi):
+    return sum(bisect.bisect_left(ids, hi) - bisect.bisect_left(ids, lo) for ids in lists)
+
+
+def _union(lists, lo, hi, distinct=False):
+    """Return the sorted message numbers in [lo, hi) from several posting lists."""
+    parts = [ids[bisect.bisect_left(ids, lo):bisect.bisect_left(ids, hi)] for ids in lists]
+    if len(parts) == 1:
+        return parts[0]
+    merged = itertools.chain.from_iterable(parts)
+    return array.array('I', sorted(set(merged) if distinct else merged))
+
+
+class _Segment(object):
+    __slots__ = ('first', 'times', 'topics', 'sources', 'flags', 'offsets', 'blob')
+
+    def __init__(self, first):
+        self.first = first
+        self.times = array.array('d')
+        self.topics = array.array('I')
+        self.sources = array.array('H')
+        self.flags = array.array('B')       # QoS in bits 0-1, retain in bit 2, binary in bit 3
+        self.offsets = array.array('Q', [0])
+        self.blob = bytearray()
+
+    def __len__(self):
+        return len(self.times)
+
+
+class MessageHistory(object):
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_bytes=DEFAULT_MAX_BYTES, tokens=True,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.tokens = tokens
+        self.max_pending = max_pending
+        self.dropped = 0        # messages not kept because the queue was full
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.segments = []
+        self.first_id = 0
+        self.next_id = 0
+        self.bytes = 0
+        self.topic_ids = {}
+        self.topic_names = []
+        self.topic_postings = []
+        self.source_ids = {}
+        self.source_names = []
+        self.token_postings = {}
+        self.vocabulary = bytearray(b'\n')
+        self.unindexed = array.array('I')     # messages whose words are not in the word index
+        self._last_time = 0.0
+
+    def __len__(self):
+        return self.next_id - self.first_id
+
+    def add(self, source, received, topic, payload, qos=0, retain=False):
+        """Queue a received message for the index; may be called from any thread."""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((source, received, topic, payload, qos, retain))
+
+    def pending(self):
+        return len(self._pending)
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self.dropped = 0
+            self._reset()
+
+    def absorb(self, limit=None):
+        """File up to limit queued messages into the store and indexes; returns their number."""
+        with self._lock:
+            return self._absorb(limit)
+
+    def _absorb(self, limit=None):
+        pending = self._pending
+        if limit is None:
+            limit = len(pending)
+        topic_ids, topic_postings = self.topic_ids, self.topic_postings
+        token_postings = self.token_postings
+        tokens = self.tokens
+        segment_bytes = max(1, self.max_bytes // 16)
+        segment = self.segments[-1] if self.segments else None
+        count = 0
+        while pending and count < limit:
+            source, received, topic, payload, qos, retain = pending.popleft()
+            if segment is None or len(segment) >= SEGMENT_MESSAGES or len(segment.blob) >= segment_bytes:
+                segment = _Segment(self.next_id)
+                self.segments.append(segment)
+            ident = self.next_id
+            self.next_id += 1
+            count += 1
+
+            topic_id = topic_ids.get(topic)
+            if topic_id is None:
+                topic_id = topic_ids[topic] = len(self.topic_names)
+                self.topic_names.append(topic)
+                topic_postings.append(array.array('I'))
+            topic_postings[topic_id].append(ident)
+            source_id = self.source_ids.get(source)
+            if source_id is None:
+                source_id = self.source_ids[source] = len(self.source_names)
+                self.source_names.append(source)
+
+            # keep the time index sorted even if the clock steps back
+            if received < self._last_time:
+                received = self._last_time
+            self._last_time = received
+            segment.times.append(received)
+            segment.topics.append(topic_id)
+            segment.sources.append(source_id)
+            text = _is_text(payload)
+            segment.flags.append(qos | (RETAIN if retain else 0) | (0 if text else BINARY))
+            segment.blob += payload
+            segment.offsets.append(len(segment.blob))
+            self.bytes += len(payload)
+
+            if not text:
+                pass
+            elif tokens and len(payload) <= TOKEN_BYTES:
+                for token in set(_TOKEN.findall(payload.lower())):
+                    postings = token_postings.get(token)
+                    if postings is None:
+                        postings = token_postings[token] = array.array('I')
+                        self.vocabulary += token + b'\n'
+                    postings.append(ident)
+            else:
+                self.unindexed.append(ident)
+        if count:
+            self._trim()
+        return count
+
+    def _trim(self):
+        dropped = False
+        while len(self.segments) > 1 and (len(self) > self.capacity or self.bytes > self.max_bytes):
+            oldest = self.segments.pop(0)
+            self.bytes -= len(oldest.blob)
+            self.first_id = self.segments[0].first
+            dropped = True
+        if not dropped:
+            return
+        # release the posting entries of the dropped messages
+        first = self.first_id
+        for postings in self.topic_postings:
+            del postings[:bisect.bisect_left(postings, first)]
+        del self.unindexed[:bisect.bisect_left(self.unindexed, first)]
+        stale = []
+        for token, postings in self.token_postings.items():
+            del postings[:bisect.bisect_left(postings, first)]
+            if not postings:
+                stale.append(token)
+        if stale:
+            for token in stale:
+                del self.token_postings[token]
+            self.vocabulary = bytearray(b'\n' + b''.join(token + b'\n' for token in self.token_postings))
+
+    # --- reading --------------------------------------------------------------------------------
+    def _segment_index(self, ident):
+        firsts = [segment.first for segment in self.segments]
+        return bisect.bisect_right(firsts, ident) - 1
+
+    def get(self, ident):
+        """Return the HistoryRecord for a message number, or None once it has been dropped."""
+        with self._lock:
+            if ident < self.first_id or ident >= self.next_id:
+                return None
+            segment = self.segments[self._segment_index(ident)]
+            i = ident - segment.first
+            flags = segment.flags[i]
+            payload = bytes(segment.blob[segment.offsets[i]:segment.offsets[i + 1]])
+            return HistoryRecord(ident, self.source_names[segment.sources[i]], segment.times[i],
+                                 self.topic_names[segment.topics[i]], payload, flags & 3, bool(flags & RETAIN))
+
+    def _id_at(self, when, side):
+        # the first message received at or after (bisect_left) or after (bisect_right) a time
+        for segment in self.segments:
+            i = side(segment.times, when)
+            if i < len(segment):
+                return segment.first + i
+        return self.next_id
+
+    def search(self, text, now=None):
+        """Run a query, returning a SearchResult whose ids are message numbers, oldest first.
+
+        Raises QueryError, or topicmatch.PatternError for an invalid topic pattern.
+        """
+        query = parse_query(text, now)
+        start = time.perf_counter()
+        with self._lock:
+            self._absorb()
+            ids, plan = self._search(query)
+            total = len(self)
+        return SearchResult(ids, total, time.perf_counter() - start, plan)
+
+    def _search(self, query):
+        lo, hi = self.first_id, self.next_id
+        if query['since'] is not None:
+            lo = max(lo, self._id_at(query['since'], bisect.bisect_left))
+        if query['until'] is not None:
+            hi = min(hi, self._id_at(query['until'], bisect.bisect_right))
+        if lo >= hi:
+            return range(0), 'time'
+
+        topic_set = source_set = None
+        words = query['words']
+        plans = [(hi - lo, 'time', None)]
+        if query['topics']:
+            trie = WildcardTrie(query['topics'])
+            matched = [topic_id for topic_id, name in enumerate(self.topic_names) if trie.match(name)]
+            topic_set = set(matched)
+            lists = [self.topic_postings[topic_id] for topic_id in matched]
+            plans.append((_count(lists, lo, hi), 'topic', lists))
+        if query['sources']:
+            source_set = set(self.source_ids[name] for name in query['sources'] if name in self.source_ids)
+        if self.tokens:
+            for word in words:
+                # a word with other characters, like a quoted phrase, is looked up
+                # by the words within it and checked afterwards
+                exact = _WORD_TERM.match(word) is not None
+                for part in [word] if exact else _TOKEN.findall(word):
+                    lists = [self.token_postings[token] for token in self._matching_tokens(part)]
+                    size = _count(lists, lo, hi) + _count([self.unindexed], lo, hi)
+                    plans.append((size, 'word', (part, lists, exact)))
+
+        # checking a candidate costs about as much as scanning a few payloads
+        plans.sort(key=lambda p: p[0] if p[1] != 'word' or p[2][2] else p[0] * CHECK_COST)
+        size, plan, detail = plans[0]
+        if plan == 'time':
+            if words:
+                ids = self._scan(words[0], lo, hi)
+                words = words[1:]
+                plan = 'scan'
+            else:
+                ids = range(lo, hi)
+        else:
+            # intersect the smallest posting lists, and leave the other terms to be checked
+            ids = None
+            for size, kind, detail in plans:
+                if kind == 'time' or (ids is not None and size > INTERSECT_RATIO * len(ids)):
+                    continue
+                postings = self._postings(kind, detail, lo, hi)
+                ids = postings if ids is None else array.array('I', sorted(set(ids).intersection(postings)))
+                if kind == 'topic':
+                    topic_set = None
+                elif detail[2]:
+                    words = [word for word in words if word != detail[0]]
+        if topic_set is not None or source_set is not None or words:
+            ids = self._filter(ids, topic_set, source_set, words)
+        return ids, plan
+
+    def _postings(self, plan, detail, lo, hi):
+        """Return the sorted message numbers in [lo, hi) given by a topic or word plan."""
+        if plan == 'topic':
+            return _union(detail, lo, hi)
+        word, lists, exact = detail
+        ids = _union(lists, lo, hi, distinct=True)
+        unindexed = self._filter(_union([self.unindexed], lo, hi), None, None, [word])
+        if unindexed:
+            ids = array.array('I', sorted(itertools.chain(ids, unindexed)))
+        return ids
+
+    def _matching_tokens(self, word):
+        """Return the indexed words containing word."""
+        vocabulary = self.vocabulary
+        tokens = []
+        position = vocabulary.find(word)
+        while position >= 0:
+            start = vocabulary.rfind(b'\n', 0, position) + 1
+            end = vocabulary.find(b'\n', position)
+            tokens.append(bytes(vocabulary[start:end]))
+            position = vocabulary.find(word, end)
+        return tokens
+
+    def _scan(self, word, lo, hi):
+        """Return the messages in [lo, hi) whose payload contains word, by searching the payload bytes."""
+        pattern = re.compile(re.escape(word), re.IGNORECASE)
+        found = array.array('I')
+        for segment in self.segments[max(0, self._segment_index(lo)):]:
+            if segment.first >= hi:
+                break
+            offsets, blob = segment.offsets, segment.blob
+            first = max(lo, segment.first) - segment.first
+            last = min(hi - segment.first, len(segment))
+            position, end = offsets[first], offsets[last]
+            while True:
+                match = pattern.search(blob, position, end)
+                if match is None:
+                    break
+                i = bisect.bisect_right(offsets, match.start()) - 1
+                if match.end() <= offsets[i + 1]:
+                    if not segment.flags[i] & BINARY:
+                        found.append(segment.first + i)
+                    position = offsets[i + 1]
+                else:
+                    position = match.start() + 1    # spans two payloads
+        return found
+
+    def _filter(self, ids, topic_set, source_set, words):
+        """Return the messages of a sorted sequence which satisfy the remaining terms."""
+        patterns = [re.compile(re.escape(word), re.IGNORECASE) for word in words]
+        found = array.array('I')
+        if not ids:
+            return found
+        k = self._segment_index(ids[0])
+        segment = self.segments[k]
+        end = segment.first + len(segment)
+        for ident in ids:
+            while ident >= end:
+                k += 1
+                segment = self.segments[k]
+                end = segment.first + len(segment)
+            i = ident - segment.first
+            if topic_set is not None and segment.topics[i] not in topic_set:
+                continue
+            if source_set is not None and segment.sources[i] not in source_set:
+                continue
+            if patterns:
+                if segment.flags[i] & BINARY:
+                    continue
+                start, stop = segment.offsets[i], segment.offsets[i + 1]
+                if not all(pattern.search(segment.blob, start, stop) for pattern in patterns):
+                    continue
+            found.append(ident)
+        return found
+
+
+def _is_text(payload):
+    if payload.isascii():
+        return True
+    try:
+        payload.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
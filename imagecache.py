@@ -0,0 +1,220 @@
+"""Two-tier cache for device photos.
+
+Decoded images are kept in a memory LRU bounded by bytes, and downloaded
+bodies are kept on disk.  Bodies are stored by the SHA-256 of their content,
+so the same JPEG served under several URLs is only stored once; a small
+per-URL record maps each URL to its content digest and ETag.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class LRUCache(object):
+    """Least-recently-used mapping bounded by the total size of its values."""
+
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        try:
+            value, size = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key, default=None):
+        """Like get(), but not counted as a hit or miss."""
+        try:
+            value, size = self._items[key]
+        except KeyError:
+            return default
+        self._items.move_to_end(key)
+        return value
+
+    def discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.total_bytes -= item[1]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if key in self._items:
+            self.total_bytes -= self._items.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._items[key] = (value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, old_size) = self._items.popitem(last=False)
+            self.total_bytes -= old_size
+            self.evictions += 1
+
+
+class DiskCache(object):
+    """Content-addressed store of response bodies with a per-URL ETag record."""
+
+    def __init__(self, path, max_age=24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(path, 'urls'), exist_ok=True)
+
+    def _url_path(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, 'urls', key + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest)
+
+    def lookup(self, url):
+        """Return the stored record for url as a dict, or None."""
+        try:
+            with open(self._url_path(url), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if record.get('url') != url or not os.path.exists(self._object_path(record['digest'])):
+            self.misses += 1
+            return None
+        return record
+
+    def is_stale(self, record):
+        return (time.time() - record['fetched']) > self.max_age
+
+    def read(self, record):
+        try:
+            with open(self._object_path(record['digest']), 'rb') as f:
+                body = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body
+
+    def store(self, url, body, etag=None):
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            self._write_atomic(object_path, body)
+        self.touch(url, digest, etag)
+        return digest
+
+    def touch(self, url, digest, etag=None):
+        record = {'url': url, 'digest': digest, 'etag': etag, 'fetched': time.time()}
+        self._write_atomic(self._url_path(url), json.dumps(record).encode('utf-8'))
+
+    def _write_atomic(self, path, data):
+        tmp = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+class ImageCache(object):
+    """Memory and disk tiers plus the set of URLs currently being fetched.
+
+    All methods may be called from any thread.  begin_fetch() returns True
+    only for the first request of a URL; later requests are merged into the
+    fetch already in flight until finish_fetch() is called.
+    """
+
+    def __init__(self, path, max_bytes, sizeof=len, max_age=24 * 3600):
+        self.memory = LRUCache(max_bytes, sizeof)
+        self.disk = DiskCache(path, max_age)
+        self.merged = 0
+        self.fetches = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._inflight = set()
+
+    def get(self, url):
+        with self._lock:
+            return self.memory.get(url)
+
+    def peek(self, url):
+        with self._lock:
+            return self.memory.peek(url)
+
+    def put(self, url, image):
+        with self._lock:
+            self.memory.put(url, image)
+
+    def discard(self, url):
+        """Drop url from the memory tier; the disk copy is kept."""
+        with self._lock:
+            self.memory.discard(url)
+
+    def begin_fetch(self, url):
+        with self._lock:
+            if url in self._inflight:
+                self.merged += 1
+                return False
+            self._inflight.add(url)
+            return True
+
+    def finish_fetch(self, url):
+        with self._lock:
+            self._inflight.discard(url)
+
+    def load(self, url, fetch):
+        """Return the body for url from disk, revalidating stale entries.
+
+        fetch(url, etag) performs the request and returns a tuple
+        (status, body, etag); a status of 304 keeps the stored body.  Called
+        on a worker thread, never with the lock held.
+        """
+        record = self.disk.lookup(url)
+        if record is not None and not self.disk.is_stale(record):
+            body = self.disk.read(record)
+            if body is not None:
+                return body
+            record = None
+
+        status, body, etag = fetch(url, record and record.get('etag'))
+        with self._lock:
+            self.fetches += 1
+            if status == 304:
+                self.not_modified += 1
+        if status == 304 and record is not None:
+            self.disk.touch(url, record['digest'], etag or record.get('etag'))
+            return self.disk.read(record)
+        if body:
+            self.disk.store(url, body, etag)
+        return body
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_hits': self.memory.hits,
+                'memory_misses': self.memory.misses,
+                'memory_evictions': self.memory.evictions,
+                'memory_bytes': self.memory.total_bytes,
+                'disk_hits': self.disk.hits,
+                'disk_misses': self.disk.misses,
+                'fetches': self.fetches,
+                'not_modified': self.not_modified,
+                'merged': self.merged,
+                'inflight': len(self._inflight),
+            }
@@ -0,0 +1,252 @@
+"""Append-only packet journal stored as rotated JSON-lines segments.
+
+Each line is one record {"ts": <receive time>, "msg": <packet>}.  Records
+are buffered and written in batches of batch_size, and all buffered records
+are written and fsync'ed once fsync_interval seconds have passed, so a crash
+loses at most that much of the session.
+
+Segments are named after the time of their first record and rotated by
+size, and whole segments are deleted once they fall outside the size or age
+retention limits.
+
+Next to each segment a sparse index file holds (ts, byte offset) pairs,
+one for the first record and then one every index_interval bytes.  Replay
+of a time window finds the segment by name, bisects its index, and seeks
+straight to the window start, so startup cost does not grow with history.
+"""
+import bisect
+import json
+import os
+import struct
+import threading
+import time
+
+from packets import json_loads, json_dumps
+
+SEGMENT_SUFFIX = '.jsonl'
+INDEX_SUFFIX = '.idx'
+
+# index entry: receive time, byte offset of the record in the segment
+INDEX_ENTRY = struct.Struct('<dQ')
+
+
+class Journal(object):
+    def __init__(self, path, segment_bytes=8 * 1024 * 1024, fsync_interval=1.0,
+                 batch_size=256, retention_bytes=None, retention_age=None,
+                 index_interval=64 * 1024):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self.retention_bytes = retention_bytes
+        self.retention_age = retention_age
+        self.index_interval = index_interval
+        self.written = 0
+        self._lock = threading.Lock()
+        self._pending = []
+        self._file = None
+        self._file_path = None
+        self._index = None
+        self._next_index_offset = 0
+        self._last_sync = time.time()
+        os.makedirs(path, exist_ok=True)
+        self.enforce_retention()
+
+    # --- segments -----------------------------------------------------------------
+    def segments(self):
+        """Return the segment paths, oldest first."""
+        names = [name for name in os.listdir(self.path) if name.endswith(SEGMENT_SUFFIX)]
+        names.sort(key=lambda name: int(name[:-len(SEGMENT_SUFFIX)]))
+        return [os.path.join(self.path, name) for name in names]
+
+    def _segment_path(self, ts):
+        return os.path.join(self.path, '%d%s' % (int(ts * 1000), SEGMENT_SUFFIX))
+
+    def _open_segment(self, ts):
+        path = self._segment_path(ts)
+        while os.path.exists(path) and path != self._file_path:
+            ts += 0.001
+            path = self._segment_path(ts)
+        self._file = open(path, 'ab')
+        self._file_path = path
+        self._index = open(index_path(path), 'ab')
+        self._next_index_offset = self._file.tell()
+
+    def _close_segment(self, sync=True):
+        if self._file is not None:
+            self._sync_files(sync)
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._file_path = None
+            self._index = None
+
+    def _sync_files(self, sync):
+        # the index is written after the data it points to
+        self._file.flush()
+        self._index.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+            os.fsync(self._index.fileno())
+
+    # --- writing ------------------------------------------------------------------
+    def append(self, ts, msg):
+        """Queue one record; may be called from any thread."""
+        self.append_raw(ts, json_dumps(msg))
+
+    def append_raw(self, ts, msg_json):
+        """Queue one record whose msg is already encoded as single-line JSON bytes."""
+        line = b'{"ts":%r,"msg":%s}\n' % (ts, msg_json)
+        with self._lock:
+            self._pending.append((ts, line))
+            if (time.time() - self._last_sync) >= self.fsync_interval:
+                self._write_pending(sync=True)
+            elif len(self._pending) >= self.batch_size:
+                self._write_pending(sync=False)
+
+    def tick(self):
+        """Write out records older than the fsync interval; call periodically."""
+        with self._lock:
+            if (time.time() - self._last_sync) >= self.fsync_interval:
+                self._write_pending(sync=True)
+
+    def flush(self):
+        with self._lock:
+            self._write_pending(sync=True)
+
+    def close(self):
+        with self._lock:
+            self._write_pending(sync=True)
+            self._close_segment()
+
+    def _write_pending(self, sync):
+        pending, self._pending = self._pending, []
+        for ts, line in pending:
+            if self._file is None:
+                self._open_segment(ts)
+            elif self._file.tell() >= self.segment_bytes:
+                self._close_segment()
+                self.enforce_retention()
+                self._open_segment(ts)
+            offset = self._file.tell()
+            if offset >= self._next_index_offset:
+                self._index.write(INDEX_ENTRY.pack(ts, offset))
+                self._next_index_offset = offset + self.index_interval
+            self._file.write(line)
+            self.written += 1
+        if self._file is not None:
+            self._sync_files(sync)
+        if sync:
+            self._last_sync = time.time()
+
+    def enforce_retention(self, now=None):
+        """Delete the oldest closed segments beyond the size or age limits."""
+        if self.retention_bytes is None and self.retention_age is None:
+            return
+        now = now or time.time()
+        segments = [path for path in self.segments() if path != self._file_path]
+        sizes = [os.path.getsize(path) for path in segments]
+        total = sum(sizes) + (self._file.tell() if self._file is not None else 0)
+        for i, path in enumerate(segments):
+            # a segment ends where the next one starts
+            if i + 1 < len(segments):
+                end = segment_start(segments[i + 1])
+            elif self._file_path is not None:
+                end = segment_start(self._file_path)
+            else:
+                break
+            too_big = self.retention_bytes is not None and total > self.retention_bytes
+            too_old = self.retention_age is not None and (now - end) > self.retention_age
+            if not (too_big or too_old):
+                break
+            os.remove(path)
+            if os.path.exists(index_path(path)):
+                os.remove(index_path(path))
+            total -= sizes[i]
+
+    # --- reading ------------------------------------------------------------------
+    def replay(self, since=None):
+        """Yield (ts, msg) for every record with ts >= since, oldest first.
+
+        Records still waiting in the write buffer are not included.  A torn
+        line left by a crash is skipped.
+        """
+        segments = self.segments()
+        offset = 0
+        if since is not None:
+            # skip segments that end before the window starts, then seek
+            # within the first one using its index
+            starts = [segment_start(path) for path in segments]
+            first = max(bisect.bisect_right(starts, since) - 1, 0)
+            segments = segments[first:]
+            if segments:
+                offset = seek_offset(segments[0], since)
+        for path in segments:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                offset = 0
+                for line in f:
+                    try:
+                        record = json_loads(line)
+                        ts = record['ts']
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    if since is None or ts >= since:
+                        yield ts, record['msg']
+
+    def import_json_array(self, path):
+        """Append the packets of an old whole-file log.json array."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return 0
+        if not text.strip():
+            return 0
+        packets = [packet for packet in json.loads(text) if packet]
+        packets.sort(key=lambda packet: float(packet.get('time', 0)))
+        for packet in packets:
+            self.append(float(packet.get('time', 0)), packet)
+        self.flush()
+        return len(packets)
+
+
+def segment_start(path):
+    """Return the time of the first record of a segment from its file name."""
+    name = os.path.basename(path)
+    return int(name[:-len(SEGMENT_SUFFIX)]) / 1000.0
+
+
+def index_path(path):
+    return path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+
+def read_index(path):
+    """Return the (times, offsets) lists of a segment's index.
+
+    Entries beyond the end of the segment, as left by a crash between the
+    two writes, and a torn final entry are dropped.
+    """
+    times, offsets = [], []
+    try:
+        with open(index_path(path), 'rb') as f:
+            data = f.read()
+        size = os.path.getsize(path)
+    except OSError:
+        return times, offsets
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    for ts, offset in INDEX_ENTRY.iter_unpack(data[:usable]):
+        if offset >= size:
+            break
+        times.append(ts)
+        offsets.append(offset)
+    return times, offsets
+
+
+def seek_offset(path, since):
+    """Return a byte offset in a segment at or before the first record >= since."""
+    times, offsets = read_index(path)
+    i = bisect.bisect_left(times, since) - 1
+    if i < 0:
+        return 0
+    return offsets[i]
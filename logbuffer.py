@@ -0,0 +1,93 @@
+"""Bounded in-memory log record store for the Monitor log pane.
+
+A LogBuffer is a logging handler which keeps the newest capacity records
+as plain tuples, without formatting them: the message text is only built
+when a view asks for the entries it shows.  The logger level is checked
+before a record is even created, so with the level above DEBUG the
+per-message debug calls of paho and the application cost one comparison,
+and with DEBUG enabled the handler adds only a tuple append to the cost of
+creating the record, with no formatting on the network thread and no
+records competing with received messages in the console queue.
+
+Most of the remaining cost of a DEBUG record is the logging module looking
+up the calling source line and process details, which the entries do not
+keep; lean_records() turns that off for the whole program, as the logging
+documentation suggests for speed.
+
+Each entry has a sequence number, so a view can fetch only the entries
+added since it last looked and count those which fell out of the buffer in
+between.
+"""
+import collections
+import logging
+import time
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+# number of records kept by default
+DEFAULT_CAPACITY = 10000
+
+
+def lean_records():
+    """Stop every LogRecord from collecting its source location and process details."""
+    logging._srcfile = None
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+
+class LogEntry(collections.namedtuple('LogEntry', 'seq created levelno name msg args exc_text thread')):
+    """One stored log record; message() applies the arguments."""
+    __slots__ = ()
+
+    def message(self):
+        if not self.args:
+            return str(self.msg)
+        try:
+            return str(self.msg) % self.args
+        except (TypeError, ValueError) as e:
+            return "%s %r (bad format: %s)" % (self.msg, self.args, e)
+
+    def format(self):
+        stamp = time.strftime('%H:%M:%S', time.localtime(self.created)) + '.%03d' % (self.created % 1 * 1000)
+        line = "%s %s:%s: %s" % (stamp, logging.getLevelName(self.levelno), self.name, self.message())
+        if self.exc_text:
+            line += "\n" + self.exc_text
+        return line
+
+
+class LogBuffer(logging.Handler):
+    def __init__(self, capacity=DEFAULT_CAPACITY, level=logging.NOTSET):
+        super(LogBuffer, self).__init__(level)
+        self.entries = collections.deque(maxlen=capacity)
+        self.seq = 0
+
+    def emit(self, record):
+        # called with the level already checked and the handler lock held; keep the arguments unformatted
+        exc_text = None
+        if record.exc_info:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        args = record.args
+        if args and not isinstance(args, (tuple, dict)):
+            args = (args,)
+        self.entries.append(LogEntry(self.seq, record.created, record.levelno, record.name,
+                                     record.msg, args, exc_text, record.threadName))
+        self.seq += 1
+
+    def since(self, seq):
+        """Return (entries with seq or later, number of those no longer held)."""
+        with self.lock:
+            if not self.entries or seq >= self.seq:
+                return [], 0
+            first = self.entries[0].seq
+            if seq <= first:
+                return list(self.entries), first - seq
+            entries = list(self.entries)
+        return entries[seq - first:], 0
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def set_capacity(self, capacity):
+        with self.lock:
+            self.entries = collections.deque(self.entries, maxlen=capacity)
@@ -0,0 +1,175 @@
+"""Decoding and validation of the device packets received over MQTT.
+
+A payload is parsed exactly once, on the network thread, into an immutable
+Packet which is then handed to the GUI, the journal, and any other stage.
+orjson is used for JSON when it is installed, with the standard json module
+as the fallback.
+"""
+import collections
+import json
+import threading
+import time
+import types
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj)
+else:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+# fields shown by the GUI; a packet without them is rejected
+REQUIRED_FIELDS = ('device', 'photo1', 'photo2', 'textA', 'textB')
+
+
+class PacketError(ValueError):
+    pass
+
+
+class Packet(collections.namedtuple('Packet', 'received device time photo1 photo2 textA textB fields raw')):
+    """One validated device packet.
+
+    received is the local receive time, time the device's own timestamp (or
+    None), fields a read-only view of the whole JSON object, and raw the
+    compact JSON encoding of it as written to the journal.
+    """
+    __slots__ = ()
+
+
+def parse(payload, received=None):
+    """Decode and validate an MQTT payload (bytes or str) into a Packet."""
+    try:
+        obj = json_loads(payload)
+    except ValueError as e:
+        raise PacketError("invalid JSON: %s" % e)
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return from_dict(obj, received, payload)
+
+
+def from_dict(obj, received=None, raw=None):
+    """Validate an already decoded JSON object, e.g. a journal record."""
+    if not isinstance(obj, dict):
+        raise PacketError("packet is not a JSON object")
+    missing = [key for key in REQUIRED_FIELDS if key not in obj]
+    if missing:
+        raise PacketError("packet is missing %s" % ", ".join(missing))
+    if received is None:
+        received = time.time()
+    device_time = obj.get('time')
+    try:
+        device_time = float(device_time) if device_time is not None else None
+    except (TypeError, ValueError):
+        raise PacketError("invalid time: %r" % (device_time,))
+    # the journal stores one record per line, so only compact payloads are
+    # reused as they are
+    if raw is None or b'\n' in raw or b'\r' in raw:
+        raw = json_dumps(obj)
+    return Packet(received, str(obj['device']), device_time,
+                  str(obj['photo1']), str(obj['photo2']),
+                  str(obj['textA']), str(obj['textB']),
+                  types.MappingProxyType(obj), raw.strip())
+
+
+class IngestBuffer(object):
+    """Buffer between the network thread and the GUI.
+
+    put() is called for every packet on the network thread; the GUI calls
+    drain() from a timer, at most a few times per second, and inserts the
+    whole batch at once.  The depth and latency of the last drain are kept
+    for display.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = []
+        self._first_put = None
+        self.max_depth = 0
+        self.last_batch = 0
+        self.last_latency = 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._lock:
+            if not self._items:
+                self._first_put = time.time()
+            self._items.append(item)
+            if len(self._items) > self.max_depth:
+                self.max_depth = len(self._items)
+
+    def drain(self):
+        """Return all buffered items, oldest first."""
+        with self._lock:
+            items, self._items = self._items, []
+            first_put = self._first_put
+        if items:
+            self.last_batch = len(items)
+            self.last_latency = time.time() - first_put
+        return items
+
+    def take_stats(self):
+        """Return (max depth since the last call, last batch size, last latency)."""
+        with self._lock:
+            stats = (self.max_depth, self.last_batch, self.last_latency)
+            self.max_depth = len(self._items)
+        return stats
+
+
+class RingBuffer(object):
+    """Fixed-capacity sequence of items, oldest first.
+
+    Appending to a full buffer overwrites the oldest item, and items are
+    removed from the old end in O(1) without moving the others.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._start = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("ring buffer index out of range")
+        return self._items[(self._start + i) % self.capacity]
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self._items[(self._start + i) % self.capacity]
+
+    def append(self, item):
+        """Add item at the new end; returns the overwritten oldest item or None."""
+        end = (self._start + self._len) % self.capacity
+        old = None
+        if self._len == self.capacity:
+            old = self._items[end]
+            self._start = (self._start + 1) % self.capacity
+        else:
+            self._len += 1
+        self._items[end] = item
+        return old
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from an empty ring buffer")
+        item = self._items[self._start]
+        self._items[self._start] = None
+        self._start = (self._start + 1) % self.capacity
+        self._len -= 1
+        return item
@@ -0,0 +1,102 @@
+"""Detection and rendering of MQTT payloads for the Monitor message views.
+
+Payloads are kept as the raw bytes received and are only decoded here, when
+a view shows them.  detect() picks the viewer: 'number' for a short decimal
+or float, 'json' for an object or array, 'text' for printable UTF-8, and
+'hex' for anything else.  summary() gives the one-line form for a table
+cell and render() the full form for the detail pane.
+"""
+import json
+import re
+
+from packets import json_loads
+
+VIEWERS = ('auto', 'text', 'json', 'hex', 'number')
+
+# longest payload tested as a number, and the bytes shown in a summary
+NUMBER_MAX_BYTES = 40
+SUMMARY_BYTES = 4096
+SUMMARY_CHARS = 200
+HEX_SUMMARY_BYTES = 32
+
+_NUMBER = re.compile(br'\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*\Z')
+_CONTROL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _text(payload):
+    """Return the payload as str if it is printable UTF-8, else None."""
+    try:
+        text = bytes(payload).decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    if _CONTROL.search(text):
+        return None
+    return text
+
+
+def detect(payload):
+    if len(payload) <= NUMBER_MAX_BYTES and _NUMBER.match(payload):
+        return 'number'
+    head = bytes(payload[:64]).lstrip()[:1]
+    if head in (b'{', b'['):
+        try:
+            json_loads(payload)
+            return 'json'
+        except ValueError:
+            pass
+    if _text(payload) is not None:
+        return 'text'
+    return 'hex'
+
+
+def summary(payload, viewer='auto'):
+    """Return one line describing the payload, short enough for a table cell."""
+    if viewer == 'auto':
+        viewer = detect(payload)
+    if not payload:
+        return ''
+    if viewer == 'hex':
+        line = bytes(payload[:HEX_SUMMARY_BYTES]).hex(' ')
+        if len(payload) > HEX_SUMMARY_BYTES:
+            line += ' ... (%d bytes)' % len(payload)
+        return line
+    text = bytes(payload[:SUMMARY_BYTES]).decode('utf-8', 'replace')
+    line = _WHITESPACE.sub(' ', text).strip()
+    if len(line) > SUMMARY_CHARS or len(payload) > SUMMARY_BYTES:
+        line = line[:SUMMARY_CHARS] + ' ...'
+    return line
+
+
+def render(payload, viewer='auto'):
+    """Return the full text of a payload in the given viewer."""
+    if viewer == 'auto':
+        viewer = detect(payload)
+    if viewer == 'json':
+        try:
+            return json.dumps(json_loads(payload), indent=2, ensure_ascii=False)
+        except ValueError as e:
+            return "(not valid JSON: %s)\n\n%s" % (e, render(payload, 'text'))
+    if viewer == 'number':
+        text = bytes(payload).decode('ascii', 'replace').strip()
+        try:
+            value = float(text)
+        except ValueError:
+            return "(not a number)\n\n" + render(payload, 'text')
+        lines = [text]
+        if value.is_integer() and abs(value) < 2 ** 63:
+            lines.append("hex: %#x" % int(value))
+        return "\n".join(lines)
+    if viewer == 'hex':
+        return hex_dump(payload)
+    return bytes(payload).decode('utf-8', 'replace')
+
+
+def hex_dump(payload, width=16):
+    lines = []
+    data = bytes(payload)
+    for offset in range(0, len(data), width):
+        chunk = data[offset:offset + width]
+        text = ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
+        lines.append("%08x  %-*s  %s" % (offset, width * 3 - 1, chunk.hex(' '), text))
+    return "\n".join(lines)
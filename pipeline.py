@@ -0,0 +1,83 @@
+"""The packet ingest stages shared by App.py and headless.py.
+
+Nothing here imports Qt.  Pipeline.on_batch is installed as the on_batch
+callback of a transport.AsyncClient, and on_message as a paho on_message
+callback: each message is parsed once, appended to the journal, the alerter
+notified, and the Packet handed to a sink, normally an IngestBuffer drained
+by the GUI or the headless report loop.
+"""
+import os
+import threading
+
+import appconfig
+import packets
+from journal import Journal
+
+# A torn write or a foreign publisher must not flood the output.
+MAX_REPORTED_ERRORS = 10
+
+
+class Pipeline(object):
+    def __init__(self, journal, alerter, sink):
+        self.journal = journal
+        self.alerter = alerter
+        self.sink = sink
+        self.received = 0
+        self.rejected = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def on_message(self, client, userdata, msg):
+        self.on_batch([msg])
+
+    def on_batch(self, batch):
+        """Run a list of received messages through the stages, counting them once."""
+        received = rejected = nbytes = 0
+        for msg in batch:
+            try:
+                packet = packets.parse(msg.payload)
+            except packets.PacketError as e:
+                rejected += 1
+                if self.rejected + rejected <= MAX_REPORTED_ERRORS:
+                    print("Ignoring packet on %s: %s" % (msg.topic, e))
+                continue
+            received += 1
+            nbytes += len(msg.payload)
+            self.journal.append_raw(packet.received, packet.raw)
+            if self.alerter is not None:
+                self.alerter.notify(packet.device)
+            self.sink(packet)
+        with self._lock:
+            self.received += received
+            self.rejected += rejected
+            self.bytes += nbytes
+
+    def stats(self):
+        with self._lock:
+            return self.received, self.rejected, self.bytes
+
+
+def open_journal(path=None):
+    """Open the journal configured in appconfig, importing an old log.json once.
+
+    With a path the journal is opened there instead and nothing is imported,
+    for runs such as benchmarks which must not touch the real records.
+    """
+    journal = Journal(path or appconfig.journalDir, appconfig.journalSegmentBytes,
+                      appconfig.journalFsyncInterval,
+                      retention_bytes=appconfig.journalRetentionBytes,
+                      retention_age=appconfig.journalRetentionDays * 24 * 3600)
+    if path is None and not journal.segments() and os.path.exists(appconfig.localRecordsFilePath):
+        journal.import_json_array(appconfig.localRecordsFilePath)
+    return journal
+
+
+def replay_window(journal, since):
+    """Return the journaled packets received since the given time as Packets."""
+    window = []
+    for received, msg in journal.replay(since=since):
+        try:
+            window.append(packets.from_dict(msg, received))
+        except packets.PacketError:
+            continue
+    return window
@@ -0,0 +1,74 @@
+"""The one thread-safe link between the MQTT transport and a Qt event loop.
+
+A QtBridge owns a transport.LoopThread running the asyncio loop of every
+AsyncClient of the application.  Work crosses between the two threads only
+through it: call() and submit() run functions and coroutines on the asyncio
+loop, and post() runs a function on the Qt thread through a single queued
+signal.  Clients deliver a whole batch of messages per post, so the Qt
+thread wakes once per burst rather than once per message.
+
+Qt bindings differ in module name but not in the parts used here, so the
+class is made for the QtCore module passed in, PyQt5 or PyQt6:
+
+    bridge = qtbridge.QtBridge(QtCore)
+    bridge.start(client)
+"""
+import transport
+
+_classes = {}
+
+
+def QtBridge(QtCore, parent=None, name='mqtt'):
+    """Return a new bridge built on the given QtCore module."""
+    cls = _classes.get(QtCore)
+    if cls is None:
+        cls = _classes[QtCore] = _bridge_class(QtCore)
+    return cls(parent, name)
+
+
+def _bridge_class(QtCore):
+    class Bridge(QtCore.QObject):
+        _posted = QtCore.pyqtSignal(object, object)
+
+        def __init__(self, parent=None, name='mqtt'):
+            super(Bridge, self).__init__(parent)
+            self.transport = transport.LoopThread(name)
+            self.clients = []
+            self._posted.connect(self._run_posted)
+
+        def post(self, function, *args):
+            """Run function(*args) on the Qt thread; may be called from any thread."""
+            self._posted.emit(function, args)
+
+        def _run_posted(self, function, args):
+            function(*args)
+
+        def call(self, function, *args):
+            """Run function(*args) on the asyncio loop; may be called from any thread."""
+            self.transport.call(function, *args)
+
+        def submit(self, coroutine):
+            return self.transport.submit(coroutine)
+
+        def start(self, client):
+            """Start an AsyncClient on the asyncio loop; it is closed with the bridge."""
+            self.clients.append(client)
+            self.call(client.start)
+
+        def remove(self, client):
+            """Disconnect a client started here; the bridge no longer closes it."""
+            if client in self.clients:
+                self.clients.remove(client)
+            self.call(client.disconnect)
+
+        def close(self, timeout=2.0):
+            """Close the clients, then stop the asyncio loop."""
+            for client in self.clients:
+                try:
+                    self.transport.run(client.close(timeout), timeout + 1.0)
+                except Exception:
+                    pass    # a client which cannot say goodbye must not hold up the exit
+            self.clients = []
+            self.transport.stop(timeout)
+
+    return Bridge
@@ -0,0 +1,89 @@
+"""Registry of devices with individual online/offline tracking.
+
+Each device is keyed by the packet's device field and keeps its latest
+packet and a deadline after which it is considered offline.  Deadlines are
+kept in a heap holding at most one entry per online device: an upsert only
+moves the device's deadline, and expire() re-queues entries whose device was
+refreshed in the meantime, so neither path scans the whole fleet.
+"""
+import heapq
+import time
+
+
+class Device(object):
+    __slots__ = ('name', 'row', 'packet', 'first_seen', 'last_seen', 'count', 'deadline', 'online')
+
+    def __init__(self, name, row):
+        self.name = name
+        self.row = row
+        self.packet = None
+        self.first_seen = None
+        self.last_seen = None
+        self.count = 0
+        self.deadline = 0.0
+        self.online = False
+
+
+class DeviceRegistry(object):
+    def __init__(self, offline_time):
+        self.offline_time = offline_time
+        self.devices = {}
+        self.order = []
+        self.online_count = 0
+        self._heap = []
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, row):
+        return self.order[row]
+
+    def get(self, name):
+        return self.devices.get(name)
+
+    def upsert(self, packet):
+        """Record packet as the latest of its device.
+
+        Returns (device, is_new, came_online).
+        """
+        device = self.devices.get(packet.device)
+        is_new = device is None
+        if is_new:
+            device = Device(packet.device, len(self.order))
+            device.first_seen = packet.received
+            self.devices[packet.device] = device
+            self.order.append(device)
+        if device.packet is None or packet.received >= device.packet.received:
+            device.packet = packet
+            device.last_seen = packet.received
+        device.count += 1
+        deadline = device.last_seen + self.offline_time
+        came_online = False
+        if deadline > device.deadline:
+            device.deadline = deadline
+            if not device.online and deadline > time.time():
+                device.online = True
+                self.online_count += 1
+                came_online = True
+                heapq.heappush(self._heap, (deadline, device.name))
+        return device, is_new, came_online
+
+    def expire(self, now=None):
+        """Mark devices whose deadline has passed as offline and return them."""
+        now = now or time.time()
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, name = heapq.heappop(heap)
+            device = self.devices[name]
+            if device.deadline > now:
+                # refreshed since this entry was queued
+                heapq.heappush(heap, (device.deadline, name))
+            elif device.online:
+                device.online = False
+                self.online_count -= 1
+                expired.append(device)
+        return expired
+
+    def next_deadline(self):
+        return self._heap[0][0] if self._heap else None
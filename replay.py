@@ -0,0 +1,359 @@
+"""Republish recorded MQTT traffic to a broker, for reproducing load.
+
+The source may be a capture file recorded by the Monitor (capture.py), a
+packet journal directory (journal.py), or an App.py log.json array; the
+latter two hold packets only, which are published on --topic.  Messages are
+sent with their original spacing, sped up --speed times, or with --fast as
+fast as the connections allow.
+
+Publishing is spread over --connections client connections, each topic
+always using the same one so per-topic order is kept.  Each connection
+allows at most --window messages not yet confirmed by on_publish, which
+bounds memory when the broker cannot keep up.  Every --interval seconds the
+achieved rate is printed next to the rate the source timing asks for.
+
+usage: python replay.py SOURCE [--host H] [--port P] [--speed N | --fast]
+                        [--rewrite OLD=NEW ...] [--qos Q] [--connections N]
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import appconfig
+import capture
+import transport
+from journal import Journal
+from packets import json_dumps
+
+
+# --- sources --------------------------------------------------------------------
+# Each source yields (timestamp, topic, payload, qos, retain) in time order.
+
+def read_capture(path):
+    with capture.CaptureReader(path) as reader:
+        for timestamp, topic, qos, retain, view in reader:
+            payload = bytes(view)
+            del view    # the map cannot be closed while a view of it exists
+            yield timestamp, topic, payload, qos, retain
+
+
+def read_journal(path, topic):
+    for timestamp, msg in Journal(path).replay():
+        yield timestamp, topic, json_dumps(msg), 0, False
+
+
+def read_json_log(path, topic):
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    packets = [packet for packet in json.loads(text) if packet] if text.strip() else []
+    packets.sort(key=lambda packet: float(packet.get('time', 0)))
+    for packet in packets:
+        yield float(packet.get('time', 0)), topic, json_dumps(packet), 0, False
+
+
+def open_source(path, topic):
+    """Pick the reader for a capture file, journal directory, or log.json."""
+    if os.path.isdir(path):
+        return read_journal(path, topic)
+    with open(path, 'rb') as f:
+        magic = f.read(len(capture.MAGIC))
+    if magic == capture.MAGIC:
+        return read_capture(path)
+    return read_json_log(path, topic)
+
+
+def rewriter(rules):
+    """Return a function applying the first matching OLD=NEW topic prefix rule."""
+    pairs = []
+    for rule in rules:
+        old, sep, new = rule.partition('=')
+        if not sep:
+            raise ValueError("topic rewrite %r is not of the form OLD=NEW" % rule)
+        pairs.append((old, new))
+
+    def rewrite(topic):
+        for old, new in pairs:
+            if topic.startswith(old):
+                return new + topic[len(old):]
+        return topic
+    return rewrite
+
+
+# --- publishing -----------------------------------------------------------------
+# seconds a blocked publish() waits between checks for stop() and a lost connection
+WAIT_STEP = 0.1
+
+
+class Publisher(object):
+    """A set of broker connections with a bounded window of unconfirmed messages each.
+
+    The connections are transport.AsyncClients on the event loop of one
+    LoopThread; publish() blocks the calling thread while the connection is
+    down or its window is full, then hands the message to the loop.  When a
+    connection drops, its window is freed at once: messages it had in flight
+    are counted as lost, since a QoS 0 message lost with the connection is
+    never confirmed, unless a confirmation arrives after the reconnect.
+    """
+
+    def __init__(self, host, port, username='', password='', connections=1, window=1000,
+                 tls=False, client_id='', connect_timeout=10.0):
+        self.sent = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.lost = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.transport = transport.LoopThread('replay')
+        self.clients = []
+        self.slots = []
+        self._online = []
+        # mids sent and not yet confirmed, those given up when a connection dropped,
+        # and messages held while reconnecting; all only used on the loop thread
+        self._in_flight = []
+        self._abandoned = []
+        self._held = []
+        for i in range(connections):
+            client = transport.AsyncClient(host, port, username, password, tls=tls,
+                                           client_id=client_id + ('-%d' % i if client_id else ''),
+                                           window=window, on_publish=functools.partial(self._on_publish, i),
+                                           on_state=functools.partial(self._on_state, i))
+            self.clients.append(client)
+            self.slots.append(threading.Semaphore(window))
+            self._online.append(threading.Event())
+            self._in_flight.append(set())
+            self._abandoned.append(set())
+            self._held.append(collections.deque())
+            self.transport.call(client.start)
+        deadline = time.monotonic() + connect_timeout
+        for client in self.clients:
+            try:
+                self.transport.run(asyncio.wait_for(client.wait_connected(), max(0.0, deadline - time.monotonic())))
+            except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+                self.close(0)
+                raise ConnectionError("no connection to %s:%d within %.0f s" % (host, port, connect_timeout))
+
+    def _on_state(self, i, client):
+        if client.state == 'connected':
+            self._online[i].set()
+            held = self._held[i]
+            while held and client.state == 'connected':
+                self._publish(i, *held.popleft())
+            return
+        self._online[i].clear()
+        if not client.wanted:
+            # given up or closed: the held messages will not be sent
+            held = self._held[i]
+            with self._lock:
+                self.failed += len(held)
+            for _ in range(len(held)):
+                self.slots[i].release()
+            held.clear()
+        in_flight = self._in_flight[i]
+        if in_flight:
+            # the confirmations may never come; free the window for the next connection
+            with self._lock:
+                self.lost += len(in_flight)
+            for _ in range(len(in_flight)):
+                self.slots[i].release()
+            self._abandoned[i].update(in_flight)
+            in_flight.clear()
+
+    def _on_publish(self, i, mid):
+        if mid in self._in_flight[i]:
+            self._in_flight[i].discard(mid)
+            self.slots[i].release()
+            lost = 0
+        elif mid in self._abandoned[i]:
+            self._abandoned[i].discard(mid)     # resent after a reconnect after all
+            lost = 1
+        else:
+            return
+        with self._lock:
+            self.confirmed += 1
+            self.lost -= lost
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Hand a message to its connection once that is up and has a free slot.
+
+        Returns False, counting the message as failed, if stop() is called or
+        the connection gives up first.
+        """
+        i = hash(topic) % len(self.clients)
+        client = self.clients[i]
+        while not self._stopping.is_set() and client.wanted:
+            if self._online[i].wait(WAIT_STEP) and self.slots[i].acquire(timeout=WAIT_STEP):
+                self.transport.call(self._publish, i, topic, payload, qos, retain)
+                return True
+        with self._lock:
+            self.failed += 1
+        return False
+
+    def _publish(self, i, topic, payload, qos, retain):
+        # on the loop thread
+        client = self.clients[i]
+        if client.state != 'connected' and client.wanted:
+            # the slot was freed by a dropped connection; send once it is back
+            self._held[i].append((topic, payload, qos, retain))
+            return
+        info = client.publish_nowait(topic, payload, qos, retain)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            self._abandoned[i].discard(info.mid)    # a mid used again is not the lost message
+            self._in_flight[i].add(info.mid)
+            with self._lock:
+                self.sent += 1
+            return
+        with self._lock:
+            self.failed += 1
+        self.slots[i].release()
+
+    def stats(self):
+        """Return (sent, confirmed, failed), counting lost messages as failed."""
+        with self._lock:
+            return self.sent, self.confirmed, self.failed + self.lost
+
+    def stopped(self):
+        return self._stopping.is_set()
+
+    def stop(self):
+        """Make publish() give up instead of waiting; may be called from any thread."""
+        self._stopping.set()
+
+    def flush(self, timeout=10.0):
+        """Wait up to timeout seconds for every sent message to be confirmed or lost."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self.confirmed + self.lost >= self.sent:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def close(self, timeout=10.0):
+        """Wait up to timeout seconds for outstanding messages, then disconnect."""
+        self.stop()
+        self.flush(timeout)
+        for client in self.clients:
+            try:
+                self.transport.run(client.close(), 3.0)
+            except Exception:
+                pass
+        self.transport.stop()
+
+
+# --- scheduling -----------------------------------------------------------------
+def replay(source, publisher, speed=1.0, rewrite=None, qos=None, interval=5.0, limit=None, report=print):
+    """Publish the messages of a source, spaced by their timestamps divided by speed.
+
+    A speed of None publishes as fast as possible.  Returns the final status
+    dict, which is also passed to report() together with the periodic ones.
+    """
+    start = time.monotonic()
+    first_ts = None
+    timestamp = None
+    count = 0
+    lag = 0.0
+    last = (start, 0, None)
+    next_report = start + interval
+    for timestamp, topic, payload, msg_qos, retain in source:
+        if first_ts is None:
+            first_ts = timestamp
+            last = (start, 0, timestamp)
+        if speed is not None:
+            due = start + (timestamp - first_ts) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            lag = max(0.0, time.monotonic() - due)
+        if rewrite is not None:
+            topic = rewrite(topic)
+        if not publisher.publish(topic, payload, msg_qos if qos is None else qos, retain) and publisher.stopped():
+            break
+        count += 1
+
+        now = time.monotonic()
+        if now >= next_report:
+            next_report = now + interval
+            report(_status(publisher, speed, last, (now, count, timestamp), lag))
+            last = (now, count, timestamp)
+        if limit is not None and count >= limit:
+            break
+
+    end = time.monotonic()
+    publisher.flush()
+    status = _status(publisher, speed, (start, 0, first_ts), (end, count, timestamp), lag)
+    status['final'] = True
+    report(status)
+    return status
+
+
+def _status(publisher, speed, since, until, lag):
+    (t0, n0, ts0), (t1, n1, ts1) = since, until
+    sent, confirmed, failed = publisher.stats()
+    achieved = (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+    target = None
+    if speed is not None and ts0 is not None and ts1 is not None and ts1 > ts0:
+        target = (n1 - n0) / ((ts1 - ts0) / speed)
+    return {'messages': n1, 'sent': sent, 'confirmed': confirmed, 'failed': failed,
+            'achieved_rate': achieved, 'target_rate': target, 'lag': lag}
+
+
+def print_status(status):
+    target = "as fast as possible" if status['target_rate'] is None else "%.1f msg/s" % status['target_rate']
+    line = "%s%d published (%d confirmed, %d failed): %.1f msg/s achieved, target %s" % (
+        "done: " if status.get('final') else "", status['messages'], status['confirmed'],
+        status['failed'], status['achieved_rate'], target)
+    if status['lag'] > 0.1:
+        line += ", %.1f s behind schedule" % status['lag']
+    print(line)
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help="capture file, journal directory, or log.json")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--username', default='')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--tls', action='store_true')
+    parser.add_argument('--topic', default=appconfig.broker_topic, help="topic for journal and log.json packets")
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument('--speed', type=float, default=1.0, help="speed-up over the original timing")
+    timing.add_argument('--fast', action='store_true', help="publish as fast as possible")
+    parser.add_argument('--rewrite', action='append', default=[], metavar='OLD=NEW', help="replace a topic prefix")
+    parser.add_argument('--qos', type=int, choices=[0, 1, 2], help="publish with this QoS instead of the recorded one")
+    parser.add_argument('--connections', type=int, default=1)
+    parser.add_argument('--window', type=int, default=1000, help="unconfirmed messages allowed per connection")
+    parser.add_argument('--limit', type=int, help="stop after this many messages")
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between rate reports")
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    try:
+        rewrite = rewriter(args.rewrite) if args.rewrite else None
+    except ValueError as e:
+        parser.error(str(e))
+    source = open_source(args.source, args.topic)
+    publisher = Publisher(args.host, args.port, args.username, args.password,
+                          args.connections, args.window, args.tls)
+    try:
+        replay(source, publisher, None if args.fast else args.speed, rewrite, args.qos,
+               args.interval, args.limit, print_status)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,9 @@
-# python3.6
+# python3.7
 
+import asyncio
 import random
 
-from paho.mqtt import client as mqtt_client
+import transport
 
 
 broker = '127.0.0.1'
@@ -14,33 +15,28 @@ username = ''
 password = ''
 
 
-def connect_mqtt() -> mqtt_client:
-    def on_connect(client, userdata, flags, rc):
-        if rc == 0:
-            print("Connected to MQTT Broker!")
-        else:
-            print("Failed to connect, return code %d\n", rc)
+def on_state(client):
+    if client.state == 'connected':
+        print("Connected to MQTT Broker!")
+    elif client.error:
+        print(f"Failed to connect: {client.error}")
 
-    client = mqtt_client.Client(client_id)
-    client.username_pw_set(username, password)
-    client.on_connect = on_connect
-    client.connect(broker, port)
-    return client
 
-
-def subscribe(client: mqtt_client):
-    def on_message(client, userdata, msg):
-        print(f"Received `{msg.payload.decode()}` from `{msg.topic}` topic")
-
-    client.subscribe(topic)
-    client.on_message = on_message
-
-
-def run():
-    client = connect_mqtt()
-    subscribe(client)
-    client.loop_forever()
+async def run():
+    client = transport.AsyncClient(broker, port, username, password, [topic],
+                                   client_id=client_id, on_state=on_state)
+    client.start()
+    try:
+        # every message received since the last wakeup arrives in one batch
+        async for batch in client.messages():
+            for msg in batch:
+                print(f"Received `{msg.payload.decode()}` from `{msg.topic}` topic")
+    finally:
+        await client.close()
 
 
 if __name__ == '__main__':
-    run()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
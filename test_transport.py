@@ -0,0 +1,129 @@
+"""Tests of transport.AsyncClient flow control across a dropped connection.
+
+A minimal in-process broker accepts connections and acknowledges CONNECT;
+it can stop reading, so published packets stay queued in the client, and
+drop the connection, as a broker restart or network fault would.
+
+usage: python -m unittest test_transport
+"""
+import asyncio
+import unittest
+
+import transport
+
+WINDOW = 4
+BIG_PAYLOAD = b'x' * (20 * 1024 * 1024)
+
+
+async def read_packet(reader):
+    header = (await reader.readexactly(1))[0]
+    length, shift = 0, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return header, await reader.readexactly(length)
+
+
+class StallingBroker(object):
+    """Acknowledges CONNECT; while stalled it reads nothing more from the connection."""
+
+    def __init__(self):
+        self.stalled = True
+        self.connections = []
+        self.published = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    def kick(self):
+        for writer in self.connections:
+            writer.transport.abort()
+        self.connections = []
+
+    async def close(self):
+        self.kick()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections.append(writer)
+        stalled = self.stalled
+        try:
+            while True:
+                header, body = await read_packet(reader)
+                kind = header >> 4
+                if kind == 1:       # CONNECT
+                    writer.write(b'\x20\x02\x00\x00')
+                    if stalled:
+                        await asyncio.Event().wait()
+                elif kind == 3:     # PUBLISH
+                    self.published += 1
+                    if (header >> 1) & 3 == 1:
+                        topic_length = int.from_bytes(body[:2], 'big')
+                        writer.write(b'\x40\x02' + body[2 + topic_length:4 + topic_length])
+                elif kind == 12:    # PINGREQ
+                    writer.write(b'\xd0\x00')
+                elif kind == 14:    # DISCONNECT
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class DroppedConnectionTest(unittest.TestCase):
+    def test_queued_qos0_publishes_give_back_the_window(self):
+        asyncio.run(self._queued_qos0_publishes())
+
+    async def _queued_qos0_publishes(self):
+        broker = StallingBroker()
+        port = await broker.start()
+        client = transport.AsyncClient('127.0.0.1', port, window=WINDOW, retry_initial=0.05, retry_max=0.1)
+        client.start()
+        try:
+            await asyncio.wait_for(client.wait_connected(), 5)
+            for i in range(WINDOW):
+                await asyncio.wait_for(client.publish('big/%d' % i, BIG_PAYLOAD), 5)
+            await asyncio.sleep(0.2)
+            self.assertEqual(len(client._waiters), WINDOW)
+
+            # the window is full of messages stuck in the client when the connection drops
+            broker.stalled = False
+            broker.kick()
+            await asyncio.wait_for(client.publish('after', b'1', qos=1, wait=True), 5)
+            self.assertTrue(await client.flush(2))
+            self.assertEqual(client._waiters, {})
+            self.assertEqual(client._slots._value, WINDOW)
+            self.assertEqual(broker.published, 1)
+        finally:
+            await client.close(2)
+            await broker.close()
+
+    def test_waiting_publish_reports_the_loss(self):
+        asyncio.run(self._waiting_publish())
+
+    async def _waiting_publish(self):
+        broker = StallingBroker()
+        port = await broker.start()
+        client = transport.AsyncClient('127.0.0.1', port, window=WINDOW, retry_initial=0.05, retry_max=0.1)
+        client.start()
+        try:
+            await asyncio.wait_for(client.wait_connected(), 5)
+            publish = asyncio.ensure_future(client.publish('big', BIG_PAYLOAD, wait=True))
+            await asyncio.sleep(0.2)
+            broker.stalled = False
+            broker.kick()
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(publish, 5)
+        finally:
+            await client.close(2)
+            await broker.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Compiled include/exclude topic filters for client-side message filtering.
+
+A filter is a list of patterns.  A plain pattern is an MQTT subscription
+using the + and # wildcards; a pattern starting with re: is a regular
+expression searched in the topic.  Either kind is an exclusion when
+prefixed with ! or -.  A topic passes when it matches some include pattern
+(or there are none) and no exclude pattern.
+
+All wildcard patterns of one kind are merged into a single trie of topic
+levels, so a topic is tested once no matter how many there are; regular
+expressions are compiled separately and tried in turn, each keeping its own
+flags and groups.  Results are cached per topic, since most traffic repeats
+a small set of topics.
+"""
+import re
+
+REGEX_PREFIX = 're:'
+EXCLUDE_PREFIXES = ('!', '-')
+
+
+class PatternError(ValueError):
+    pass
+
+
+class _Level(object):
+    __slots__ = ('children', 'plus', 'terminal', 'hash')
+
+    def __init__(self):
+        self.children = {}
+        self.plus = None        # child for the + wildcard
+        self.terminal = False   # a pattern ends at this level
+        self.hash = False       # a pattern ends with # below this level
+
+
+class WildcardTrie(object):
+    """Any number of MQTT subscription patterns, matched in one walk of the topic levels."""
+
+    def __init__(self, patterns=()):
+        self.root = _Level()
+        self.count = 0
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        levels = pattern.split('/')
+        node = self.root
+        for i, level in enumerate(levels):
+            if level == '#':
+                if i != len(levels) - 1:
+                    raise PatternError("'#' must be the last level in %r" % pattern)
+                node.hash = True
+                self.count += 1
+                return
+            if level == '+':
+                if node.plus is None:
+                    node.plus = _Level()
+                node = node.plus
+            elif '#' in level or '+' in level:
+                raise PatternError("wildcards must occupy a whole level in %r" % pattern)
+            else:
+                node = node.children.setdefault(level, _Level())
+        node.terminal = True
+        self.count += 1
+
+    def match(self, topic):
+        levels = topic.split('/')
+        # wildcards at the first level do not match $SYS style topics
+        system = topic.startswith('$')
+        active = [self.root]
+        for i, level in enumerate(levels):
+            following = []
+            for node in active:
+                if node.hash and not (system and i == 0):
+                    return True
+                child = node.children.get(level)
+                if child is not None:
+                    following.append(child)
+                if node.plus is not None and not (system and i == 0):
+                    following.append(node.plus)
+            if not following:
+                return False
+            active = following
+        # 'a/#' also matches 'a' itself
+        return any(node.terminal or node.hash for node in active)
+
+
+class _PatternSet(object):
+    def __init__(self):
+        self.trie = WildcardTrie()
+        # compiled one by one and tried in turn: joined into one expression, inline
+        # flags, group names and backreferences of one pattern would clash with the others
+        self.regexes = []
+
+    def __bool__(self):
+        return bool(self.trie.count or self.regexes)
+
+    def match(self, topic):
+        if self.trie.count and self.trie.match(topic):
+            return True
+        return any(regex.search(topic) is not None for regex in self.regexes)
+
+
+class TopicFilter(object):
+    """A compiled set of include and exclude patterns."""
+
+    def __init__(self, patterns=(), cache_size=100000):
+        self.patterns = list(patterns)
+        self.include = _PatternSet()
+        self.exclude = _PatternSet()
+        for pattern in self.patterns:
+            target = self.include
+            if pattern.startswith(EXCLUDE_PREFIXES):
+                target = self.exclude
+                pattern = pattern[1:]
+            if pattern.startswith(REGEX_PREFIX):
+                expression = pattern[len(REGEX_PREFIX):]
+                try:
+                    target.regexes.append(re.compile(expression))
+                except re.error as e:
+                    raise PatternError("bad regular expression %r: %s" % (expression, e))
+            elif pattern:
+                target.trie.add(pattern)
+        self.cache_size = cache_size
+        self._cache = {}
+
+    @classmethod
+    def parse(cls, text, **kwargs):
+        """Build a filter from whitespace separated patterns."""
+        return cls(text.split(), **kwargs)
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    def match(self, topic):
+        result = self._cache.get(topic)
+        if result is None:
+            result = self._match(topic)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[topic] = result
+        return result
+
+    def _match(self, topic):
+        if self.include and not self.include.match(topic):
+            return False
+        return not (self.exclude and self.exclude.match(topic))
@@ -0,0 +1,176 @@
+"""Rolling per-topic traffic statistics for the MQTT Monitor.
+
+record() is called for every received message and costs O(1): each topic
+keeps two generations of counters and a payload size histogram, each
+as long as the window.  When a generation ends the older one is dropped,
+and window totals are estimated from the current generation plus the share
+of the previous one that still overlaps the window.  Rates, percentiles and
+jitter are only computed when a row is displayed.
+"""
+import threading
+import time
+
+# payload size histogram: two bins per power of two
+HISTOGRAM_BINS = 2 * 40
+
+
+def size_bin(size):
+    if size < 2:
+        return size
+    bits = size.bit_length()
+    return 2 * bits - 2 + ((size >> (bits - 2)) & 1)
+
+
+def bin_upper(index):
+    """Return the largest payload size falling in a histogram bin."""
+    if index < 2:
+        return index
+    bits = (index + 2) // 2
+    half = (index + 2) % 2
+    return (1 << (bits - 1)) + (half + 1) * (1 << (bits - 2)) - 1
+
+
+class TopicStats(object):
+    __slots__ = ('topic', 'count', 'bytes', 'qos', 'retained', 'gen_start',
+                 'counts', 'byte_counts', 'histograms', 'last_arrival', 'last_gap', 'jitter')
+
+    def __init__(self, topic, now):
+        self.topic = topic
+        self.count = 0
+        self.bytes = 0
+        self.qos = [0, 0, 0]
+        self.retained = 0
+        self.gen_start = now
+        self.counts = [0, 0]            # [current, previous] generation
+        self.byte_counts = [0, 0]
+        self.histograms = [None, None]
+        self.last_arrival = None
+        self.last_gap = None
+        self.jitter = 0.0
+
+    def _advance(self, now, span):
+        elapsed = now - self.gen_start
+        if elapsed < span:
+            return
+        if elapsed < 2 * span:
+            self.counts = [0, self.counts[0]]
+            self.byte_counts = [0, self.byte_counts[0]]
+            self.histograms = [None, self.histograms[0]]
+            self.gen_start += span
+        else:
+            self.counts = [0, 0]
+            self.byte_counts = [0, 0]
+            self.histograms = [None, None]
+            self.gen_start = now
+
+    def add(self, size, qos, retain, now, span):
+        self._advance(now, span)
+        self.count += 1
+        self.bytes += size
+        self.qos[qos] += 1
+        if retain:
+            self.retained += 1
+        self.counts[0] += 1
+        self.byte_counts[0] += size
+        histogram = self.histograms[0]
+        if histogram is None:
+            histogram = self.histograms[0] = [0] * HISTOGRAM_BINS
+        histogram[size_bin(size)] += 1
+
+        # inter-arrival jitter as in RFC 3550: a running mean of the change
+        # between consecutive gaps
+        if self.last_arrival is not None:
+            gap = now - self.last_arrival
+            if self.last_gap is not None:
+                self.jitter += (abs(gap - self.last_gap) - self.jitter) / 16.0
+            self.last_gap = gap
+        self.last_arrival = now
+
+    def _weight(self, now, span):
+        # share of the previous generation still inside the window
+        return max(0.0, 1.0 - (now - self.gen_start) / span)
+
+    def rate(self, now, span):
+        """Messages per second over the window."""
+        self._advance(now, span)
+        return (self.counts[0] + self.counts[1] * self._weight(now, span)) / span
+
+    def byte_rate(self, now, span):
+        self._advance(now, span)
+        return (self.byte_counts[0] + self.byte_counts[1] * self._weight(now, span)) / span
+
+    def percentiles(self, now, span, fractions=(0.5, 0.95, 0.99)):
+        """Approximate payload size percentiles over the window."""
+        self._advance(now, span)
+        weight = self._weight(now, span)
+        current, previous = self.histograms
+        bins = [0.0] * HISTOGRAM_BINS
+        if current is not None:
+            for i, n in enumerate(current):
+                bins[i] += n
+        if previous is not None and weight > 0:
+            for i, n in enumerate(previous):
+                bins[i] += n * weight
+        total = sum(bins)
+        if total == 0:
+            return [None] * len(fractions)
+        results = []
+        for fraction in fractions:
+            target = fraction * total
+            seen = 0.0
+            for i, n in enumerate(bins):
+                seen += n
+                if seen >= target and n:
+                    results.append(bin_upper(i))
+                    break
+            else:
+                results.append(bin_upper(HISTOGRAM_BINS - 1))
+        return results
+
+
+class TopicStatsTable(object):
+    """Statistics for every topic seen, safe to update from the network thread."""
+
+    def __init__(self, window=10.0):
+        self.span = window
+        self.topics = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.topics)
+
+    def record(self, topic, size, qos=0, retain=False, now=None):
+        now = now or time.monotonic()
+        with self.lock:
+            stats = self.topics.get(topic)
+            if stats is None:
+                stats = self.topics[topic] = TopicStats(topic, now)
+            stats.add(size, qos, retain, now, self.span)
+
+    def by_rate(self, now=None):
+        """Return the TopicStats objects sorted by decreasing message rate."""
+        now = now or time.monotonic()
+        with self.lock:
+            rates = [(stats.rate(now, self.span), stats) for stats in self.topics.values()]
+        rates.sort(key=lambda pair: pair[0], reverse=True)
+        return [stats for rate, stats in rates]
+
+    def summary(self, stats, now=None):
+        """Return a dict of display values for one topic."""
+        now = now or time.monotonic()
+        with self.lock:
+            p50, p95, p99 = stats.percentiles(now, self.span)
+            return {
+                'topic': stats.topic,
+                'rate': stats.rate(now, self.span),
+                'byte_rate': stats.byte_rate(now, self.span),
+                'p50': p50, 'p95': p95, 'p99': p99,
+                'jitter': stats.jitter,
+                'count': stats.count,
+                'qos0': stats.qos[0], 'qos1': stats.qos[1], 'qos2': stats.qos[2],
+                'retained': stats.retained,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.topics.clear()
@@ -0,0 +1,101 @@
+"""Incrementally updated trie of MQTT topics for the Monitor topic tree.
+
+insert() walks the topic levels once, creating nodes as needed, and stores
+the last payload and message count on the node of the full topic.  Subtree
+totals are not updated on every message: the ancestors are only marked
+stale, stopping at the first one already marked, and rollup() recomputes a
+stale subtree when the view asks for it.  Rates are measured between two
+rollups of the same node, so nothing time dependent is done per message.
+"""
+import threading
+import time
+
+
+class TopicNode(object):
+    __slots__ = ('name', 'path', 'parent', 'children', 'payload', 'count', 'last_time',
+                 'stale', 'subtree_count', 'rate', 'subtree_rate', '_sample')
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        if parent is None or parent.path is None:
+            self.path = name
+        else:
+            self.path = parent.path + '/' + name
+        self.children = {}
+        self.payload = None
+        self.count = 0
+        self.last_time = None
+        self.stale = False
+        self.subtree_count = 0
+        self.rate = 0.0
+        self.subtree_rate = 0.0
+        self._sample = None     # (time, count, subtree_count) at the last rate measurement
+
+    def child_list(self):
+        """Children in order of first appearance, which keeps model rows stable."""
+        return list(self.children.values())
+
+
+class TopicTree(object):
+    """Trie of topic levels, safe to update from the network thread."""
+
+    def __init__(self, rate_interval=1.0):
+        self.root = TopicNode(None)
+        self.rate_interval = rate_interval
+        self.nodes = 1
+        self.lock = threading.Lock()
+
+    def insert(self, topic, payload, now=None):
+        now = now or time.time()
+        with self.lock:
+            node = self.root
+            for level in topic.split('/'):
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = TopicNode(level, node)
+                    self.nodes += 1
+                node = child
+            node.payload = payload
+            node.count += 1
+            node.last_time = now
+            while node is not None and not node.stale:
+                node.stale = True
+                node = node.parent
+
+    def rollup(self, node, now=None):
+        """Bring the subtree totals and rates of a node up to date."""
+        now = now or time.time()
+        with self.lock:
+            self._rollup(node)
+            sample = node._sample
+            if sample is None:
+                node._sample = (now, node.count, node.subtree_count)
+            elif now - sample[0] >= self.rate_interval:
+                elapsed = now - sample[0]
+                node.rate = (node.count - sample[1]) / elapsed
+                node.subtree_rate = (node.subtree_count - sample[2]) / elapsed
+                node._sample = (now, node.count, node.subtree_count)
+
+    def _rollup(self, node):
+        # iterative post-order walk over the stale part of the subtree
+        stack = [(node, False)]
+        while stack:
+            current, visited = stack.pop()
+            if not current.stale:
+                continue
+            if visited:
+                current.subtree_count = current.count + sum(child.subtree_count for child in current.children.values())
+                current.stale = False
+                continue
+            stack.append((current, True))
+            stack.extend((child, False) for child in current.children.values() if child.stale)
+
+    def children(self, node):
+        with self.lock:
+            return node.child_list()
+
+    def clear(self):
+        with self.lock:
+            self.root = TopicNode(None)
+            self.nodes = 1
@@ -0,0 +1,412 @@
+"""asyncio MQTT transport shared by the tools in this repository.
+
+paho-mqtt still encodes and decodes the packets, but no client runs a loop
+thread of its own.  An AsyncClient drives its socket from an asyncio event
+loop with add_reader() and add_writer(); each time the socket becomes
+readable it reads every packet already received, up to READ_BATCH, and hands
+the messages on as one list, so a consumer wakes once per burst rather than
+once per message.  Batches go to on_batch(batch) on the loop, or when no
+on_batch is given into a bounded queue read with
+
+    async for batch in client.messages(): ...
+
+in which case reading from the socket pauses while the queue is full, so a
+slow consumer pushes back on the broker through TCP instead of growing
+memory.
+
+publish() is a coroutine which waits for the connection and for a free slot
+in a window of messages not yet confirmed by on_publish; publish_nowait()
+is the plain call for code which does its own flow control.  A lost
+connection is retried with exponential backoff and jitter until
+disconnect() or a connect result which retrying cannot fix.
+
+A LoopThread runs an event loop on a thread of its own for programs which
+are not themselves asyncio, such as the Qt tools (see qtbridge.py).
+AsyncClient methods other than the coroutines must be called on the loop;
+from other threads use LoopThread.call().
+"""
+import asyncio
+import random
+import socket
+import ssl
+import threading
+
+import paho.mqtt.client as mqtt
+
+# connect results after which retrying cannot help
+FATAL_CONNECT_CODES = (1, 2, 4, 5)
+
+# most packets read from one socket before other work gets a turn
+READ_BATCH = 1000
+
+# batches which may wait in the queue of a client without on_batch
+QUEUED_BATCHES = 100
+
+
+def _has_data(sock):
+    """Return whether a read from the socket would not block."""
+    if isinstance(sock, ssl.SSLSocket):
+        # records already decrypted; the selector reports the rest
+        return sock.pending() > 0
+    try:
+        return bool(sock.recv(1, socket.MSG_PEEK))
+    except OSError:
+        return False
+
+
+class AsyncClient(object):
+    def __init__(self, host, port=1883, username='', password='', subscriptions=(), tls=False,
+                 client_id='', keepalive=60, window=100, on_batch=None, on_state=None, on_publish=None,
+                 retry_initial=1.0, retry_max=60.0, clean_session=True, protocol=mqtt.MQTTv311,
+                 logger=None, name=None):
+        self.host = host
+        self.port = port
+        self.name = name or '%s:%d' % (host, port)
+        self.subscriptions = list(subscriptions)
+        self.keepalive = keepalive
+        self.window = window
+        self.on_batch = on_batch
+        self.on_state = on_state
+        self.on_publish = on_publish
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.state = 'disconnected'     # 'connecting', 'connected', 'waiting' to retry, or 'disconnected'
+        self.error = ''
+        self.received = 0
+        self.wanted = False             # keep reconnecting
+        self.loop = None
+
+        client = mqtt.Client(client_id, clean_session=clean_session, protocol=protocol)
+        if logger is not None:
+            client.enable_logger(logger)
+        client.max_inflight_messages_set(window)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.on_publish = self._on_publish
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_write
+        client.on_socket_unregister_write = self._on_socket_write
+        if username:
+            client.username_pw_set(username, password)
+        if tls:
+            client.tls_set()
+        self.client = client
+
+        self._sock = None
+        self._writing = False
+        self._paused = False
+        self._batch = []
+        self._attempts = 0
+        self._task = None
+        self._misc_handle = None
+        self._lost = None
+        self._slots = None
+        self._connected = None
+        self._queue = None
+        self._waiters = {}      # mid -> future of an awaited publish
+        self._qos0 = set()      # mids of awaited QoS 0 publishes, lost if the connection drops
+
+    # --- control, on the loop ------------------------------------------------------------------
+    def start(self):
+        """Begin connecting; must be called on the event loop."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self._thread_id = threading.get_ident()
+            self._slots = asyncio.Semaphore(self.window)
+            self._connected = asyncio.Event()
+            if self.on_batch is None:
+                self._queue = asyncio.Queue(QUEUED_BATCHES)
+        self.wanted = True
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
+
+    def disconnect(self):
+        """Close the connection and stop reconnecting."""
+        self.wanted = False
+        if self._sock is not None:
+            self.client.disconnect()
+            self._update_write()
+        elif self._task is not None and not self._task.done() and self.state == 'waiting':
+            self._task.cancel()
+
+    def subscribe(self, subscriptions):
+        """Replace the list of subscriptions, changing those of a live connection."""
+        old, self.subscriptions = self.subscriptions, list(subscriptions)
+        if self.state == 'connected':
+            removed = [sub for sub in old if sub not in self.subscriptions]
+            added = [sub for sub in self.subscriptions if sub not in old]
+            if removed:
+                self.client.unsubscribe(removed)
+            if added:
+                self.client.subscribe([(sub, 0) for sub in added])
+            self._update_write()
+
+    def publish_nowait(self, topic, payload, qos=0, retain=False):
+        """Queue a message and return its MQTTMessageInfo, with rc MQTT_ERR_NO_CONN when not connected."""
+        if self.state != 'connected':
+            info = mqtt.MQTTMessageInfo(0)
+            info.rc = mqtt.MQTT_ERR_NO_CONN
+            return info
+        info = self.client.publish(topic, payload, qos, retain)
+        self._update_write()
+        return info
+
+    # --- coroutines ---------------------------------------------------------------------------
+    async def wait_connected(self):
+        await self._connected.wait()
+
+    async def publish(self, topic, payload, qos=0, retain=False, wait=False):
+        """Publish once connected and a window slot is free; returns the MQTTMessageInfo.
+
+        With wait, returns only after on_publish, and raises ConnectionError
+        if the message is lost with the connection or the client is closed
+        first.  paho resends QoS 1 and 2 messages after a reconnect, but a
+        QoS 0 message still queued when the connection drops is lost.
+        """
+        await self._slots.acquire()
+        try:
+            await self._connected.wait()
+            info = self.client.publish(topic, payload, qos, retain)
+        except BaseException:
+            self._slots.release()
+            raise
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._slots.release()
+            raise ConnectionError(mqtt.error_string(info.rc))
+        future = self._waiters[info.mid] = self.loop.create_future()
+        if qos == 0:
+            self._qos0.add(info.mid)
+        self._update_write()
+        if wait and not await future:
+            raise ConnectionError("message lost with the connection or the client closed")
+        return info
+
+    async def flush(self, timeout=None):
+        """Wait for every awaited publish to finish; returns whether they were all confirmed."""
+        futures = list(self._waiters.values())
+        if not futures:
+            return True
+        done, pending = await asyncio.wait(futures, timeout=timeout)
+        return not pending and all(future.result() for future in done)
+
+    async def messages(self):
+        """Yield each batch of received messages, for a client without on_batch."""
+        while True:
+            batch = await self._queue.get()
+            if batch is None:
+                return
+            if self._paused and not self._queue.full() and self._sock is not None:
+                self._paused = False
+                self.loop.add_reader(self._sock, self._readable)
+            yield batch
+
+    async def close(self, timeout=2.0):
+        """Disconnect, waiting up to timeout seconds for confirmations and the goodbye."""
+        if self.loop is None:
+            return
+        if self._waiters:
+            await self.flush(timeout)
+        self.disconnect()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+        for future in self._waiters.values():
+            if not future.done():
+                future.set_result(False)
+        self._waiters.clear()
+        self._qos0.clear()
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+    # --- connection task ----------------------------------------------------------------------
+    async def _run(self):
+        try:
+            while self.wanted:
+                self._set_state('connecting', '')
+                try:
+                    # the blocking TCP and TLS connect runs on the loop's executor
+                    await self.loop.run_in_executor(None, self.client.connect, self.host, self.port, self.keepalive)
+                except (OSError, ssl.SSLError, ValueError) as e:
+                    self.error = str(e) or e.__class__.__name__
+                else:
+                    self._lost = self.loop.create_future()
+                    self._attach()
+                    if not self.wanted:
+                        self.client.disconnect()   # disconnected while the connect was under way
+                        self._update_write()
+                    await self._lost
+                if not self.wanted:
+                    break
+                delay = min(self.retry_max, self.retry_initial * 2 ** self._attempts)
+                delay *= random.uniform(0.5, 1.0)
+                self._attempts += 1
+                self._set_state('waiting')
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._detach()
+            self._set_state('disconnected')
+
+    def _set_state(self, state, error=None):
+        if error is not None:
+            self.error = error
+        if state != self.state:
+            self.state = state
+            if self.on_state is not None:
+                self.on_state(self)
+
+    def _attach(self):
+        sock = self.client.socket()
+        self._sock = sock
+        self._paused = False
+        self.loop.add_reader(sock, self._readable)
+        self._update_write()
+        self._misc_handle = self.loop.call_later(1.0, self._misc)
+
+    def _detach(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            self.loop.remove_reader(sock)
+            self.loop.remove_writer(sock)
+        self._writing = False
+        if self._misc_handle is not None:
+            self._misc_handle.cancel()
+            self._misc_handle = None
+
+    def _readable(self):
+        sock = self._sock
+        client = self.client
+        for _ in range(READ_BATCH):
+            if client.loop_read() != mqtt.MQTT_ERR_SUCCESS or self._sock is not sock or not _has_data(sock):
+                break
+        self._deliver()
+        self._update_write()
+
+    def _deliver(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self.received += len(batch)
+        if self.on_batch is not None:
+            self.on_batch(batch)
+            return
+        self._queue.put_nowait(batch)
+        if self._queue.full() and self._sock is not None and not self._paused:
+            # stop reading until the consumer catches up
+            self._paused = True
+            self.loop.remove_reader(self._sock)
+
+    def _writable(self):
+        self.client.loop_write()
+        self._update_write()
+
+    def _update_write(self):
+        if self._sock is None:
+            return
+        want = self.client.want_write()
+        if want and not self._writing:
+            self.loop.add_writer(self._sock, self._writable)
+        elif not want and self._writing:
+            self.loop.remove_writer(self._sock)
+        self._writing = want
+
+    def _misc(self):
+        self._misc_handle = None
+        if self._sock is not None:
+            self.client.loop_misc()     # keepalive pings and timeouts
+        if self._sock is not None:
+            self._misc_handle = self.loop.call_later(1.0, self._misc)
+
+    # --- paho callbacks, called on the loop -------------------------------------------------------
+    def _on_loop(self):
+        return threading.get_ident() == self._thread_id
+
+    def _on_socket_write(self, client, userdata, sock):
+        if self._on_loop():
+            self._update_write()
+
+    def _on_socket_close(self, client, userdata, sock):
+        if self._on_loop():
+            self._detach()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self._attempts = 0
+            if self.subscriptions:
+                client.subscribe([(sub, 0) for sub in self.subscriptions])
+            self._connected.set()
+            self._set_state('connected', '')
+        else:
+            self.error = mqtt.connack_string(rc)
+            if rc in FATAL_CONNECT_CODES:
+                self.wanted = False
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._detach()
+        self._connected.clear()
+        if rc != 0 and not self.error:
+            self.error = mqtt.error_string(rc)
+        self._deliver()
+        # paho drops the packets still queued when it reconnects; QoS 0 messages among
+        # them are never confirmed, so give up on them and free their window slots
+        for mid in self._qos0:
+            self._finish(mid, False)
+        self._qos0.clear()
+        if self._lost is not None and not self._lost.done():
+            self._lost.set_result(rc)
+
+    def _on_message(self, client, userdata, msg):
+        self._batch.append(msg)
+
+    def _on_publish(self, client, userdata, mid):
+        self._qos0.discard(mid)
+        self._finish(mid, True)
+        if self.on_publish is not None:
+            self.on_publish(mid)
+
+    def _finish(self, mid, confirmed):
+        future = self._waiters.pop(mid, None)
+        if future is not None:
+            self._slots.release()
+            if not future.done():
+                future.set_result(confirmed)
+
+
+class LoopThread(object):
+    """An asyncio event loop running on a daemon thread of its own."""
+
+    def __init__(self, name='mqtt'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def call(self, function, *args):
+        """Run function(*args) on the loop; may be called from any thread."""
+        self.loop.call_soon_threadsafe(function, *args)
+
+    def submit(self, coroutine):
+        """Schedule a coroutine on the loop, returning a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine, timeout=None):
+        """Run a coroutine on the loop and wait for its result."""
+        return self.submit(coroutine).result(timeout)
+
+    def stop(self, timeout=2.0):
+        if self._thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)